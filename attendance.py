@@ -0,0 +1,140 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+
+# === CONFIGURATION ===
+DEFAULT_CONNECT_TIMEOUT = 3.0   # seconds to establish the TCP connection
+DEFAULT_READ_TIMEOUT = 10.0     # seconds to wait for the server's answer
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5           # 0.5s, 1s, 2s ... between retries
+POOL_SIZE = 4
+SUBMIT_WORKERS = POOL_SIZE      # a crowd lane can have several punches in flight at once
+RETRY_STATUSES = (502, 503, 504)  # the proxy answered, the timeclock did not: nothing was recorded
+CONNECTION_FAILED = "Server connection failed"
+READ_TIMEOUT = "Server did not answer in time"  # the punch may or may not have been recorded
+
+
+# === Attendance client ===
+class AttendanceClient:
+    """
+    Talks to the /dtr/timeclock endpoint over one pooled, keep-alive
+    requests.Session with connect/read timeouts.
+
+    Only failures where the punch cannot have been recorded are retried
+    (connection errors and 502/503/504). A read timeout is not retried,
+    since the server may already have clocked the user in; it is raised as
+    requests.ReadTimeout rather than a ConnectionError, so callers can tell
+    "maybe recorded" from "not reached" (see unreachable()).
+
+    send() blocks; submit() runs send() on a small thread pool and returns a
+    Future so the UI can show a "submitting..." state instead of freezing.
+    """
+
+    def __init__(self, base_url, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # read=False re-raises the original read timeout instead of wrapping it in MaxRetryError,
+        # which requests would turn into a ConnectionError
+        retry = Retry(total=retries, connect=retries, read=False, status=retries,
+                      backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET", "POST"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=SUBMIT_WORKERS, thread_name_prefix="attendance")
+
+    def request(self, user_id, status, event_id=None, punched_at=None):
+        """
+        Performs one /dtr/timeclock call and returns the decoded JSON.
+        Raises on transport errors and on a 5xx that outlasted the retries. event_id doubles as an idempotency key so
+        the server can ignore replays of a punch it already recorded.
+        """
+        params = {"id": user_id, "status": status}
+        headers = {}
+        if event_id is not None:
+            params["event_id"] = event_id
+            headers["Idempotency-Key"] = event_id
+        if punched_at is not None:
+            params["punched_at"] = punched_at
+        metrics.incr("server_requests")
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}/dtr/timeclock", params=params,
+                                        headers=headers, timeout=self.timeout)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            data = response.json()
+        except Exception:
+            metrics.incr("server_errors")
+            raise
+        finally:
+            metrics.observe("server", time.perf_counter() - start)
+        return data
+
+    def send(self, user_id, status, event_id=None, punched_at=None):
+        """
+        Sends login/logout request to server and returns username and full_name for popup.
+        On failure returns (None, error message); (None, CONNECTION_FAILED) means
+        the server was not reached, (None, READ_TIMEOUT) that it was reached but
+        did not answer, so the punch may already be recorded.
+        """
+        try:
+            data = self.request(user_id, status, event_id, punched_at)
+
+            server_username = data.get('username', user_id)
+            server_full_name = data.get('full_name', user_id)  # fallback to username if full_name not provided
+
+            # Check if the login status is success
+            if data.get('success') == 'login':
+                print(f"✅ {server_username} ({server_full_name}) logged in successfully")
+            elif data.get('success') == 'logout':
+                print(f"✅ {server_username} ({server_full_name}) logged out successfully")
+            # Check for 'fail' response and specific message for unregistered users
+            elif data.get('success') == 'fail':
+                error_message = data.get('message', 'Unknown error')
+                print(f"⚠️ Login failed: {error_message}")
+                metrics.incr("server_rejections")
+                return None, error_message  # Return None and the error message
+            else:
+                print(f"⚠️ Server response: {data}")
+
+            return server_username, server_full_name
+        except requests.ReadTimeout as e:
+            print(f"❌ Server did not answer in time: {e}")
+            return None, READ_TIMEOUT
+        except Exception as e:
+            print(f"❌ Error connecting to server: {e}")
+            return None, CONNECTION_FAILED
+
+    def submit(self, user_id, status, callback=None, event_id=None, punched_at=None):
+        """
+        Non-blocking send(). Returns a Future resolving to (username, full_name).
+        The optional callback gets the result on a pool thread, so Tk code
+        should poll the future from the main loop instead.
+        """
+        future = self.executor.submit(self.send, user_id, status, event_id, punched_at)
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(*f.result()))
+        return future
+
+    @staticmethod
+    def unreachable(error):
+        """
+        True if request() failed without the timeclock seeing the punch: no
+        connection, or a 502/503/504 from a proxy in front of it that outlasted
+        the retries.
+        """
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in RETRY_STATUSES
+        return isinstance(error, requests.ConnectionError)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
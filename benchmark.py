@@ -0,0 +1,364 @@
+"""
+Benchmarks for the recognition hot path. Runs headless on CPU, no camera.
+
+    python benchmark.py --frames recorded_frames/ --sizes 10,100,1000,10000,100000 --output bench.json
+
+Stages: face_locations (full frame and capture-box ROI), face_encodings,
+the legacy per-user compare_faces loop vs GalleryMatcher, template
+save/load (legacy npz vs TemplateStore), and the render path (legacy
+compose_frame vs FrameRenderer, with bytes allocated per frame). Each stage
+reports p50/p95/p99 latency and throughput; peak RSS is sampled after every
+stage. Compare two JSON files with: python benchmark.py --compare a.json b.json
+
+    python benchmark.py --profiles people/ --output profile_benchmark.json
+
+measures each recognition profile (profiles.py) on recorded kiosk frames
+sorted into one directory per user ID: the first CAPTURE_FRAMES images of a
+user are enrolled with the balanced profile, as the kiosk's stored
+templates were, and every other image is a login attempt. Reports
+detect+encode latency, match rate and false-match rate per profile; the
+Settings dialog shows them from profile_benchmark.json.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+import face_recognition
+
+from capture_rules import CAPTURE_BOX, CAPTURE_FRAMES, FRAME_SIZE, RECOGNITION_TOLERANCE, face_in_box, face_size_status
+from detection import FaceDetector
+from gallery import GalleryMatcher
+from profiles import PROFILES, PROFILE_BENCHMARK_FILE, encoder_for, describe
+from render import FrameRenderer, compose_frame
+from template_store import TemplateStore
+
+# === CONFIGURATION ===
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+STAGE_BUDGET_SECONDS = 5.0   # stop repeating a stage once it has run this long
+STAGE_MAX_REPEATS = 200
+
+
+# === Measurement helpers ===
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024.0 if sys.platform != "darwin" else peak / (1024.0 * 1024.0)
+    except ImportError:
+        return None
+
+
+def measure(fn, inputs, budget=STAGE_BUDGET_SECONDS, max_repeats=STAGE_MAX_REPEATS):
+    """
+    Calls fn(item) cycling over inputs (after one warm-up call) until the
+    time budget or repeat cap is reached. Returns latency stats in ms.
+    """
+    fn(inputs[0])
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats and time.perf_counter() - started < budget:
+        item = inputs[len(samples) % len(inputs)]
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000.0
+    return {
+        "runs": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "per_sec": round(1000.0 / float(samples.mean()), 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def allocated_kb(fn, item):
+    """
+    Peak Python/numpy memory allocated by one call of fn(item), in KiB
+    (allocations inside PIL or Tk are not traced).
+    """
+    fn(item)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fn(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round((peak - baseline) / 1024.0, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# === Inputs ===
+def load_frames(frames_dir, count=8, seed=0):
+    """
+    Recorded still frames (resized to the kiosk frame size), or synthetic
+    frames if no directory is given. Synthetic frames have no real face, so
+    detection timings are realistic but encoding uses the guide box location.
+    """
+    if frames_dir:
+        frames = []
+        for name in sorted(os.listdir(frames_dir)):
+            image = cv2.imread(os.path.join(frames_dir, name))
+            if image is not None:
+                frames.append(cv2.resize(image, FRAME_SIZE))
+        if not frames:
+            raise SystemExit(f"No readable images in {frames_dir}")
+        return frames
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8) for _ in range(count)]
+
+
+def load_people(people_dir):
+    """
+    {user_id: [frame, ...]} from one sub-directory of images per user.
+    """
+    people = {}
+    for user_id in sorted(os.listdir(people_dir)):
+        user_dir = os.path.join(people_dir, user_id)
+        if os.path.isdir(user_dir):
+            frames = load_frames(user_dir)
+            if len(frames) > CAPTURE_FRAMES:
+                people[user_id] = frames
+    if not people:
+        raise SystemExit(f"No user directories with more than {CAPTURE_FRAMES} images in {people_dir}")
+    return people
+
+
+def synthetic_gallery(users, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=0.09, size=(users, 128))
+    templates = {f"user{i}": centres[i] + rng.normal(scale=0.01, size=(5, 128)) for i in range(users)}
+    probes = centres[rng.integers(0, users, 16)] + rng.normal(scale=0.01, size=(16, 128))
+    return templates, list(probes)
+
+
+def legacy_match(templates, encoding):
+    """
+    The original per-user loop from update_frame.
+    """
+    for name, user_templates in templates.items():
+        matches = face_recognition.compare_faces(user_templates, encoding, tolerance=RECOGNITION_TOLERANCE)
+        if matches.count(True) >= 4 and matches[0] == True:
+            return name
+    return None
+
+
+# === Stages ===
+def bench_frames(frames):
+    results = {}
+    rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    results["face_locations_full_frame"] = measure(face_recognition.face_locations, rgb_frames)
+
+    detector = FaceDetector(CAPTURE_BOX, use_haar=False)
+    results["face_locations_roi"] = measure(detector.detect, rgb_frames)
+    haar_detector = FaceDetector(CAPTURE_BOX, use_haar=True)
+    results["face_locations_roi_haar"] = measure(haar_detector.detect, rgb_frames)
+
+    # Encode whatever was found, or the middle of the guide box on synthetic frames
+    x1, y1, x2, y2 = CAPTURE_BOX
+    fallback = [(y1 + 60, x2 - 70, y2 - 60, x1 + 70)]
+    located = []
+    for rgb in rgb_frames:
+        faces = face_recognition.face_locations(rgb)
+        located.append((rgb, faces[:1] or fallback))
+    results["face_encodings"] = measure(lambda item: face_recognition.face_encodings(item[0], item[1]), located)
+
+    def render_legacy(frame):
+        return compose_frame(frame, "login", "Face not recognized", [fallback[0]], "Display 30.0 FPS")
+    renderer = FrameRenderer()
+
+    def render(frame):
+        return renderer.render(frame, "login", "Face not recognized", [fallback[0]], "Display 30.0 FPS")
+    results["render_legacy"] = measure(render_legacy, frames)
+    results["render_legacy"]["alloc_kb"] = allocated_kb(render_legacy, frames[0])
+    results["render"] = measure(render, frames)
+    results["render"]["alloc_kb"] = allocated_kb(render, frames[0])
+    return results
+
+
+def bench_profiles(people, profiles=PROFILES):
+    """
+    Latency and match rate of every profile on the same enrolled gallery
+    and the same login attempts (see the module docstring).
+    """
+    def pipeline(profile):
+        detector = FaceDetector(CAPTURE_BOX, downscale=profile["downscale"], use_haar=False,
+                                upsample=profile["upsample"], model=profile["detector_model"])
+        encode = encoder_for(profile, face_recognition.face_encodings)
+
+        def run(rgb):
+            faces = [face for face in detector.detect(rgb)
+                     if face_in_box(face) and face_size_status(face) == "ok"]
+            return encode(rgb, faces[:1])[0] if faces else None
+        return run
+
+    enroll = pipeline(profiles["balanced"])
+    templates = {}
+    attempts = []
+    for user_id, frames in people.items():
+        rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+        encodings = [encoding for encoding in map(enroll, rgb_frames[:CAPTURE_FRAMES]) if encoding is not None]
+        if encodings:
+            templates[user_id] = np.array(encodings)
+        attempts.extend((user_id, rgb) for rgb in rgb_frames[CAPTURE_FRAMES:])
+    matcher = GalleryMatcher(templates)
+
+    results = {}
+    for name, profile in profiles.items():
+        run = pipeline(profile)
+        run(attempts[0][1])  # warm-up
+        samples = []
+        detected = correct = wrong = 0
+        for user_id, rgb in attempts:
+            start = time.perf_counter()
+            encoding = run(rgb)
+            samples.append(time.perf_counter() - start)
+            if encoding is None:
+                continue
+            detected += 1
+            match = matcher.match(encoding, RECOGNITION_TOLERANCE)
+            if match == user_id:
+                correct += 1
+            elif match is not None:
+                wrong += 1
+        samples = np.array(samples) * 1000.0
+        results[name] = {
+            "profile": profile,
+            "attempts": len(attempts),
+            "p50_ms": round(float(np.percentile(samples, 50)), 3),
+            "p95_ms": round(float(np.percentile(samples, 95)), 3),
+            "per_sec": round(1000.0 / float(samples.mean()), 2),
+            "detect_rate": round(detected / len(attempts), 4),
+            "match_rate": round(correct / len(attempts), 4),
+            "false_match_rate": round(wrong / len(attempts), 4),
+        }
+    return results
+
+
+def bench_gallery(size):
+    results = {}
+    templates, probes = synthetic_gallery(size)
+    legacy_budget = min(STAGE_BUDGET_SECONDS, 10.0)
+    results["compare_faces_loop"] = measure(lambda probe: legacy_match(templates, probe), probes,
+                                            budget=legacy_budget, max_repeats=50)
+    matcher = GalleryMatcher(templates)
+    results["gallery_matcher"] = measure(lambda probe: matcher.match(probe, RECOGNITION_TOLERANCE), probes)
+
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    try:
+        npz_file = os.path.join(tmp, "face_templates.npz")
+        results["save_templates_npz"] = measure(lambda _: np.savez(npz_file, **templates), [None],
+                                                max_repeats=10)
+        results["load_templates_npz"] = measure(lambda _: dict(np.load(npz_file, allow_pickle=True)), [None],
+                                                max_repeats=10)
+
+        store = TemplateStore(os.path.join(tmp, "store"))
+        store.put_many(templates.items())
+        new_user = np.random.default_rng(1).normal(size=(5, 128))
+        results["store_put_one_user"] = measure(lambda _: store.put("bench_user", new_user), [None], max_repeats=50)
+        results["store_load"] = measure(lambda _: TemplateStore(store.path).load(), [None], max_repeats=10)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"{'stage':<48}{'old p50':>12}{'new p50':>12}{'change':>10}")
+    for group in ("frames", "gallery"):
+        for key, old_stats in _flatten(old.get(group, {})):
+            new_stats = dict(_flatten(new.get(group, {}))).get(key)
+            if not new_stats:
+                continue
+            change = (new_stats["p50_ms"] - old_stats["p50_ms"]) / old_stats["p50_ms"] * 100 if old_stats["p50_ms"] else 0
+            print(f"{key:<48}{old_stats['p50_ms']:>12.3f}{new_stats['p50_ms']:>12.3f}{change:>9.1f}%")
+
+
+def _flatten(section, prefix=""):
+    for key, value in section.items():
+        if isinstance(value, dict) and "p50_ms" not in value:
+            yield from _flatten(value, f"{prefix}{key}/")
+        else:
+            yield f"{prefix}{key}", value
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recognition hot path.")
+    parser.add_argument("--frames", help="directory of recorded still frames (default: synthetic)")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated gallery sizes")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--profiles", metavar="PEOPLE_DIR",
+                        help="benchmark the recognition profiles on one image directory per user")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    if args.profiles:
+        report = {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "cpu_count": os.cpu_count(), "machine": platform.machine(),
+                  "profiles": bench_profiles(load_people(args.profiles))}
+        for name, stats in report["profiles"].items():
+            print(f"{describe(name, stats['profile'], stats)}  ({stats['per_sec']}/s, "
+                  f"detected {stats['detect_rate'] * 100:.1f}% of {stats['attempts']})")
+        output = args.output or PROFILE_BENCHMARK_FILE
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}; the kiosk shows them from next to its settings.json")
+        sys.exit(0)
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "frames_source": args.frames or "synthetic",
+        "frames": {},
+        "gallery": {},
+    }
+
+    frames = load_frames(args.frames)
+    report["frames"] = bench_frames(frames)
+    for stage, stats in report["frames"].items():
+        print(f"{stage:<30} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f}  "
+              f"p99 {stats['p99_ms']:9.2f}  {stats['per_sec']:8.1f}/s  rss {stats['peak_rss_mb']} MB")
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        report["gallery"][str(size)] = bench_gallery(size)
+        for stage, stats in report["gallery"][str(size)].items():
+            print(f"[{size:>6} users] {stage:<22} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f}  "
+                  f"p99 {stats['p99_ms']:9.2f}  rss {stats['peak_rss_mb']} MB")
+
+    frame_p50 = sum(report["frames"][stage]["p50_ms"] for stage in ("face_locations_roi", "face_encodings", "render"))
+    report["frames_per_sec_estimate"] = round(1000.0 / frame_p50, 2) if frame_p50 else None
+    print(f"\nEstimated frames/sec (ROI detection + encoding + render): {report['frames_per_sec_estimate']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,73 @@
+# === CAPTURE BOX RULES ===
+# Shared by the kiosk (facialrecog.py) and the headless tools so a face is
+# judged the same way everywhere.
+FRAME_SIZE = (640, 480)             # every camera frame is resized to this
+CAPTURE_BOX = (170, 100, 470, 380)  # guide box (x1, y1, x2, y2) in the 640x480 frame
+MIN_FACE_RATIO = 0.5                # face should be at least 50% of box height
+MAX_FACE_RATIO = 0.6                # face should be at most 60% of box height
+
+# Crowd lanes accept every face in a wide zone instead of one face in the guide box
+CROWD_BOX = (20, 20, 620, 460)      # nearly the whole frame
+CROWD_MIN_FACE = 80                 # px; HOG's smallest window at full resolution
+CROWD_MAX_FACE = 260
+
+# === MATCHING RULES ===
+# One definition for the kiosk, the recognition server and every CLI
+CAPTURE_FRAMES = 5                  # templates stored per user
+RECOGNITION_TOLERANCE = 0.32        # face distance for a template to match; lower = stricter
+LANDMARK_MODEL = "small"            # face_encodings landmark model of every stored template; encodings
+                                    # from "large" landmarks are not comparable with them
+
+
+def face_in_box(face, box=CAPTURE_BOX):
+    """
+    True if the centre of a (top, right, bottom, left) face is inside the box.
+    """
+    top, right, bottom, left = face
+    x1, y1, x2, y2 = box
+    face_center_x = (left + right) // 2
+    face_center_y = (top + bottom) // 2
+    return x1 <= face_center_x <= x2 and y1 <= face_center_y <= y2
+
+
+def face_size_limits(box=CAPTURE_BOX):
+    box_height = box[3] - box[1]
+    return int(MIN_FACE_RATIO * box_height), int(MAX_FACE_RATIO * box_height)
+
+
+def face_size_status(face, box=CAPTURE_BOX):
+    """
+    "too_small", "too_large" or "ok" for a (top, right, bottom, left) face.
+    """
+    min_face_size, max_face_size = face_size_limits(box)
+    face_height = face[2] - face[0]
+    if face_height < min_face_size:
+        return "too_small"
+    if face_height > max_face_size:
+        return "too_large"
+    return "ok"
+
+
+def crowd_face_status(face, box=CROWD_BOX):
+    """
+    "outside", "too_small", "too_large" or "ok" for a face on a crowd lane.
+    """
+    if not face_in_box(face, box):
+        return "outside"
+    face_height = face[2] - face[0]
+    if face_height < CROWD_MIN_FACE:
+        return "too_small"
+    if face_height > CROWD_MAX_FACE:
+        return "too_large"
+    return "ok"
+
+
+def capture_roi(frame_shape, box=CAPTURE_BOX, max_face_ratio=MAX_FACE_RATIO):
+    """
+    The part of the frame a face passing the box checks can occupy: the box
+    plus half the largest allowed face height on every side, as (x1, y1, x2, y2).
+    """
+    x1, y1, x2, y2 = box
+    height, width = frame_shape[:2]
+    margin = int(max_face_ratio * (y2 - y1) / 2) + 4
+    return max(0, x1 - margin), max(0, y1 - margin), min(width, x2 + margin), min(height, y2 + margin)
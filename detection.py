@@ -0,0 +1,89 @@
+import cv2
+import face_recognition
+
+from capture_rules import capture_roi
+from metrics import metrics
+
+# === CONFIGURATION ===
+DEFAULT_DOWNSCALE = 0.5   # detection runs on the ROI at this scale
+HAAR_MIN_FACE = 0.35      # Haar pre-filter size window, relative to the box height.
+HAAR_MAX_FACE = 1.0       # Looser than the 50-60% rule: Haar boxes are sized differently from HOG boxes.
+
+
+# === Detection stage ===
+class FaceDetector:
+    """
+    Finds faces only where they can pass the capture-box checks.
+
+    The search is restricted to the capture box plus a margin (a face whose
+    centre is inside the box can stick out by half its height), downscaled
+    by `downscale`. With `use_haar` the cheap Haar cascade runs first and the
+    expensive HOG detector only runs when a plausibly sized face is present.
+    `model` and `upsample` are passed to face_locations (see profiles.py).
+    Returned locations are (top, right, bottom, left) in full-frame pixels.
+    """
+
+    def __init__(self, capture_box, downscale=DEFAULT_DOWNSCALE, use_haar=True,
+                 upsample=1, max_face_ratio=0.6, model="hog"):
+        self.capture_box = capture_box
+        self.downscale = downscale
+        self.use_haar = use_haar
+        self.upsample = upsample
+        self.model = model
+        self.face_cascade = None
+        if use_haar:
+            self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+        x1, y1, x2, y2 = capture_box
+        self.box_height = y2 - y1
+        self.max_face_ratio = max_face_ratio
+        self.haar_checks = 0
+        self.haar_rejects = 0
+
+    def roi(self, frame_shape):
+        return capture_roi(frame_shape, self.capture_box, self.max_face_ratio)
+
+    def has_candidate(self, small_rgb):
+        """
+        Haar pre-filter: True if anything face-like of a plausible size is present.
+        """
+        gray = cv2.cvtColor(small_rgb, cv2.COLOR_RGB2GRAY)
+        min_side = int(HAAR_MIN_FACE * self.box_height * self.downscale)
+        max_side = int(HAAR_MAX_FACE * self.box_height * self.downscale)
+        hits = self.face_cascade.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=3,
+                                                  minSize=(min_side, min_side),
+                                                  maxSize=(max_side, max_side))
+        self.haar_checks += 1
+        if len(hits) == 0:
+            self.haar_rejects += 1
+            metrics.incr("haar_rejects")
+            return False
+        return True
+
+    def detect(self, rgb_frame):
+        rx1, ry1, rx2, ry2 = self.roi(rgb_frame.shape)
+        roi = rgb_frame[ry1:ry2, rx1:rx2]
+        if self.downscale != 1.0:
+            small = cv2.resize(roi, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        else:
+            small = roi
+
+        if self.face_cascade is not None and not self.has_candidate(small):
+            return []
+
+        with metrics.timer("hog"):
+            faces = face_recognition.face_locations(small, number_of_times_to_upsample=self.upsample,
+                                                    model=self.model)
+
+        # Map back to full-frame coordinates
+        height, width = rgb_frame.shape[:2]
+        scale = 1.0 / self.downscale
+        mapped = []
+        for top, right, bottom, left in faces:
+            mapped.append((
+                max(0, int(round(top * scale)) + ry1),
+                min(width, int(round(right * scale)) + rx1),
+                min(height, int(round(bottom * scale)) + ry1),
+                max(0, int(round(left * scale)) + rx1),
+            ))
+        return mapped
@@ -0,0 +1,197 @@
+"""
+Headless bulk enrollment.
+
+    python enroll.py photos/                 # photos/<user_id>/*.jpg or photos/<user_id>_1.jpg
+    python enroll.py --csv staff.csv         # rows: user_id,image_path
+    python enroll.py photos/ --workers 8 --dry-run
+
+Each image is checked with the same rules as the kiosk capture box (exactly
+one face, big enough to pass the "move closer" check) and encoded in a
+process pool across all cores. All users are written to the template store
+in one batched commit. Run it while the kiosk is closed; the kiosk picks the
+new users up on its next start. A new store first gets the kiosk's legacy
+face_templates.npz imported (see TemplateStore.import_legacy), exactly as
+the kiosk would have done, so enrolling before the kiosk's first start on
+the store loses nobody.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import face_recognition
+from PIL import Image
+
+from capture_rules import CAPTURE_FRAMES, LANDMARK_MODEL, face_size_limits
+from gallery import MIN_MATCHING_TEMPLATES
+from template_store import TemplateStore
+
+# === CONFIGURATION ===
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+LEGACY_FILE = "face_templates.npz"  # the kiosk's pre-store templates
+DETECT_MAX_SIDE = 1280             # detection runs on a copy no larger than this
+MIN_FACE_SIZE, MAX_FACE_SIZE = face_size_limits()
+TARGET_FACE_SIZE = (MIN_FACE_SIZE + MAX_FACE_SIZE) // 2
+
+
+# === Input discovery ===
+def user_id_from_filename(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base, _, suffix = stem.rpartition("_")
+    return base if base and suffix.isdigit() else stem
+
+
+def collect_from_directory(root):
+    """
+    photos/<user_id>/<any>.jpg, or flat photos/<user_id>.jpg / <user_id>_<n>.jpg
+    """
+    images = defaultdict(list)
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    images[entry].append(os.path.join(path, name))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            images[user_id_from_filename(entry)].append(path)
+    return images
+
+
+def collect_from_csv(csv_file):
+    images = defaultdict(list)
+    base = os.path.dirname(os.path.abspath(csv_file))
+    with open(csv_file, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == "user_id":
+                continue
+            user_id, image_path = row[0].strip(), row[1].strip()
+            images[user_id].append(image_path if os.path.isabs(image_path) else os.path.join(base, image_path))
+    return images
+
+
+# === Worker (runs in the process pool) ===
+def encode_image(path):
+    """
+    Returns (path, encoding, error). Applies the kiosk rules: exactly one face,
+    and that face must be at least as large as the capture box accepts.
+    The image is then scaled so the face sits in the middle of the accepted
+    size band, like a user standing at the right distance.
+    """
+    try:
+        image = Image.open(path).convert("RGB")
+    except Exception as e:
+        return path, None, f"unreadable image ({e})"
+
+    scale = min(1.0, DETECT_MAX_SIDE / max(image.size))
+    small = image if scale == 1.0 else image.resize(
+        (int(image.width * scale), int(image.height * scale)), Image.Resampling.BILINEAR)
+    faces = face_recognition.face_locations(np.asarray(small))
+    if not faces:
+        return path, None, "no face found"
+    if len(faces) > 1:
+        return path, None, f"{len(faces)} faces found, expected 1"
+
+    top, right, bottom, left = [int(round(v / scale)) for v in faces[0]]
+    face_height = bottom - top
+    if face_height < MIN_FACE_SIZE:
+        return path, None, f"face too small ({face_height}px, need {MIN_FACE_SIZE}px)"
+
+    # Bring the face to kiosk size before encoding
+    factor = TARGET_FACE_SIZE / face_height
+    if factor < 1.0:
+        image = image.resize((int(image.width * factor), int(image.height * factor)), Image.Resampling.LANCZOS)
+        top, right, bottom, left = [int(round(v * factor)) for v in (top, right, bottom, left)]
+
+    encodings = face_recognition.face_encodings(np.asarray(image), [(top, right, bottom, left)],
+                                                model=LANDMARK_MODEL)
+    if not encodings:
+        return path, None, "face could not be encoded"
+    return path, encodings[0], None
+
+
+# === Enrollment ===
+def build_templates(encodings, count=CAPTURE_FRAMES):
+    """
+    Up to `count` templates, one per distinct photo. A user with fewer good
+    photos (--min-images below CAPTURE_FRAMES) gets fewer rows rather than
+    repeated ones: the matcher works with any row count per user, and a
+    repeat of the first (anchor) template would count twice towards the
+    MIN_MATCHING_TEMPLATES rule. With enroll()'s floor of
+    MIN_MATCHING_TEMPLATES photos, a match always needs that many different
+    pictures to agree.
+    """
+    return np.array(encodings[:count])
+
+
+def enroll(images, store_dir, workers=None, min_images=CAPTURE_FRAMES, dry_run=False, legacy_file=LEGACY_FILE):
+    min_images = max(min_images, MIN_MATCHING_TEMPLATES)
+    paths = [path for user_paths in images.values() for path in user_paths]
+    results = {}
+    failures = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (path, encoding, error) in enumerate(pool.map(encode_image, paths, chunksize=4), 1):
+            if error:
+                failures.append((path, error))
+                print(f"⚠️ {path}: {error}")
+            else:
+                results[path] = encoding
+            if done % 50 == 0:
+                print(f"... {done}/{len(paths)} images")
+    elapsed = time.perf_counter() - start
+    failed_images = len(failures)
+
+    batch = []
+    skipped = []
+    for user_id, user_paths in images.items():
+        encodings = [results[path] for path in user_paths if path in results][:CAPTURE_FRAMES]
+        if len(encodings) < min_images:
+            error = f"only {len(encodings)} usable images, need {min_images}"
+            failures.append((user_id, error))
+            print(f"⚠️ {user_id}: {error}")
+            skipped.append(user_id)
+            continue
+        batch.append((user_id, build_templates(encodings)))
+
+    if batch and not dry_run:
+        store = TemplateStore(store_dir)
+        imported = store.import_legacy(legacy_file)
+        if imported:
+            print(f"✅ Imported {imported} users from {legacy_file} into {store_dir} first")
+        store.put_many(batch)
+
+    rate = len(paths) / elapsed if elapsed > 0 else 0.0
+    print(f"\n{len(paths)} images in {elapsed:.1f}s ({rate:.1f} images/sec), {failed_images} failed")
+    print(f"{'Would enroll' if dry_run else 'Enrolled'} {len(batch)} users"
+          + (f", skipped {len(skipped)} without enough good images: {', '.join(skipped)}" if skipped else ""))
+    return batch, failures, skipped
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-enroll users from photos into the template store.")
+    parser.add_argument("directory", nargs="?", help="photos/<user_id>/*.jpg or photos/<user_id>_<n>.jpg")
+    parser.add_argument("--csv", help="CSV with user_id,image_path rows")
+    parser.add_argument("--store", default="face_templates.store")
+    parser.add_argument("--legacy", default=LEGACY_FILE, help="legacy .npz imported into a new store first")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--min-images", type=int, default=CAPTURE_FRAMES,
+                        help=f"good images required per user (at least {MIN_MATCHING_TEMPLATES})")
+    parser.add_argument("--dry-run", action="store_true", help="encode and report, but don't write the store")
+    args = parser.parse_args()
+
+    if not args.directory and not args.csv:
+        parser.error("give a photo directory or --csv")
+    if args.min_images < MIN_MATCHING_TEMPLATES:
+        parser.error(f"--min-images must be at least {MIN_MATCHING_TEMPLATES}: a match needs that many "
+                     f"templates to agree, and repeated photos would make it a single-photo check")
+    images = collect_from_csv(args.csv) if args.csv else collect_from_directory(args.directory)
+    if not images:
+        print("No images found.")
+        sys.exit(1)
+    enroll(images, args.store, workers=args.workers, min_images=args.min_images, dry_run=args.dry_run,
+           legacy_file=args.legacy)
@@ -0,0 +1,110 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+from logging.handlers import RotatingFileHandler
+
+# === CONFIGURATION ===
+DEFAULT_CAPACITY = 300          # entries kept in memory (and shown in the log pane)
+COALESCE_LOOKBACK = 4           # a message equal to one of the last N entries is folded into it
+DEFAULT_MAX_BYTES = 1_000_000   # per log file before it rotates
+DEFAULT_BACKUPS = 5
+
+
+class LogEntry:
+    __slots__ = ("time", "message", "count", "logged_count")
+
+    def __init__(self, message, now):
+        self.time = now
+        self.message = message
+        self.count = 1
+        self.logged_count = 1  # occurrences already written to the file
+
+    def line(self):
+        text = f"[{time.strftime('%H:%M:%S', time.localtime(self.time))}] {self.message}"
+        return f"{text} ×{self.count}" if self.count > 1 else text
+
+
+# === Event log ===
+class EventLog:
+    """
+    Bounded kiosk message log. Entries live in a fixed-size ring buffer and
+    repeats of a recent message only bump its "×N" counter, so memory stays
+    flat however long the kiosk runs. add() is thread-safe and never touches
+    Tk; the UI polls `version` on a timer and redraws only when it changed.
+
+    With a path, every entry is also appended as a JSON line to a rotating
+    log file; repeats are written as one {"repeated": N} line instead of N lines.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None, max_bytes=DEFAULT_MAX_BYTES,
+                 backups=DEFAULT_BACKUPS):
+        self.entries = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.version = 0
+        self.added = 0  # entries ever appended; with len(lines) this tells how many fell off the front
+        self.logger = None
+        if path:
+            self.logger = logging.getLogger(f"kiosk.events.{id(self)}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            try:
+                self.logger.addHandler(RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                           encoding="utf-8"))
+            except OSError as e:
+                print(f"⚠️ Could not open event log file: {e}")
+                self.logger = None
+
+    def add(self, message):
+        now = time.time()
+        with self.lock:
+            for entry in islice(reversed(self.entries), COALESCE_LOOKBACK):
+                if entry.message == message:
+                    entry.count += 1
+                    self.version += 1
+                    return
+            self._write_repeats()
+            entry = LogEntry(message, now)
+            self.entries.append(entry)
+            self.added += 1
+            self.version += 1
+            self._write({"time": now, "message": message})
+
+    def lines(self):
+        with self.lock:
+            return [entry.line() for entry in self.entries]
+
+    def snapshot(self):
+        """
+        (version, added, lines), read together.
+        """
+        with self.lock:
+            return self.version, self.added, [entry.line() for entry in self.entries]
+
+    def flush(self):
+        """
+        Writes pending repeat counts to the log file.
+        """
+        with self.lock:
+            self._write_repeats()
+
+    def _write_repeats(self):
+        for entry in self.entries:
+            if entry.count > entry.logged_count:
+                self._write({"time": time.time(), "message": entry.message,
+                             "repeated": entry.count - entry.logged_count})
+                entry.logged_count = entry.count
+
+    def _write(self, record):
+        if self.logger is not None:
+            record["time"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record["time"]))
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+
+    def close(self):
+        self.flush()
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
@@ -1,14 +1,41 @@
-import cv2
-import numpy as np
+import time
+STARTED_AT = time.perf_counter()  # process start, for the startup timing report
+
 import os
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 from PIL import Image, ImageTk
-import face_recognition
-import time
-import requests
 import json
 import sys 
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from startup_timing import StartupTimer
+from capture_rules import CAPTURE_BOX, CAPTURE_FRAMES, RECOGNITION_TOLERANCE
+from punch_journal import PunchJournal, JournalFlusher, PENDING, SENT, REJECTED, RETRY
+from metrics import metrics, StatsFileWriter, start_stats_server, DutyCycle
+from lanes import Lane, load_lane_configs
+from event_log import EventLog
+from profiles import load_profiles, encoder_for, load_measurements, describe, DEFAULT_PROFILE, PROFILE_BENCHMARK_FILE
+
+# === LAZY ENGINE MODULES ===
+# OpenCV, dlib (via face_recognition) and requests take seconds to import in
+# the frozen build, so they are imported by load_engine() on a background
+# thread after the window is up. These names are filled in there.
+cv2 = None
+np = None
+face_recognition = None
+GalleryMatcher = build_index = None
+FrameGrabber = RecognitionPool = FpsCounter = None
+FaceDetector = FaceTracker = TemplateStore = None
+FrameRenderer = None
+Recognizer = open_source = QualityGate = None
+RecentIdentities = PunchDebouncer = None
+MotionGate = None
+TemplateSync = TemplateSyncClient = None
+RecognitionClient = RemoteGallery = None
+AttendanceClient = CONNECTION_FAILED = READ_TIMEOUT = None
+attendance_client = None
 
 def get_settings_path():
     if getattr(sys, 'frozen', False):
@@ -33,55 +60,150 @@ settings = load_settings()
 server_url = settings.get("server_url")
 
 # === SERVER COMMUNICATION ===
+def create_attendance_client():
+    return AttendanceClient(
+        server_url,
+        connect_timeout=settings.get("server_connect_timeout", 3.0),
+        read_timeout=settings.get("server_read_timeout", 10.0),
+        retries=settings.get("server_retries", 2),
+        backoff=settings.get("server_backoff", 0.5),
+    )
+
 def send_login_to_server(user_id, status):
     """
     Sends login/logout request to server and returns username and full_name for popup.
+    Blocks; UI code should use attendance_client.submit() instead.
     """
-    #server_url = f"http://192.168.1.20:8000/dtr/timeclock?id={user_id}&status={status}"
-    
-    try:
-        response = requests.get(f"{server_url}/dtr/timeclock?id={user_id}&status={status}")
-        data = response.json()
-
-        server_username = data.get('username', user_id)
-        server_full_name = data.get('full_name', user_id)  # fallback to username if full_name not provided
-
-        # Check if the login status is success
-        if data.get('success') == 'login':
-            print(f"✅ {server_username} ({server_full_name}) logged in successfully")
-        elif data.get('success') == 'logout':
-            print(f"✅ {server_username} ({server_full_name}) logged out successfully")
-        # Check for 'fail' response and specific message for unregistered users
-        elif data.get('success') == 'fail':
-            error_message = data.get('message', 'Unknown error')
-            print(f"⚠️ Login failed: {error_message}")
-            return None, error_message  # Return None and the error message
-        else:
-            print(f"⚠️ Server response: {data}")
+    return attendance_client.send(user_id, status)
 
-        return server_username, server_full_name
-    except Exception as e:
-        print(f"❌ Error connecting to server: {e}")
-        return None, "Server connection failed"
+# === OFFLINE PUNCH JOURNAL ===
+JOURNAL_FILE = os.path.join(os.path.dirname(SETTINGS_FILE), "punch_journal.db")
+punch_journal = PunchJournal(JOURNAL_FILE)
+
+def submit_punch(user_id, status, source):
+    """
+    Journals the punch first, then sends it without blocking.
+    Returns (event_id, future); safe to call from any thread.
+    """
+    event_id = punch_journal.record(user_id, status, source)
+    future = attendance_client.submit(user_id, status, event_id=event_id, punched_at=time.time())
+    return event_id, future
 
 # === CONFIGURATION ===
-FACE_TEMPLATE_FILE = "face_templates.npz"
-CAPTURE_FRAMES = 5
-RECOGNITION_TOLERANCE = 0.32  # lower = stricter
+FACE_TEMPLATE_FILE = "face_templates.npz"  # legacy format, imported into the store once
+TEMPLATE_STORE_DIR = "face_templates.store"
 MIN_FACE_SIZE = 170#120   # too far
 MAX_FACE_SIZE = 200#300   # too close
-
-# === Load Haar Cascade ===
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+DISPLAY_INTERVAL_MS = 30  # Tk render tick, independent of recognition speed
+PROFILES = load_profiles(settings)  # speed/accuracy presets for detection and encoding, see profiles.py
+RECOGNITION_PROFILE = settings.get("recognition_profile", DEFAULT_PROFILE)
+PROFILE_BENCHMARK_PATH = os.path.join(os.path.dirname(SETTINGS_FILE), PROFILE_BENCHMARK_FILE)  # benchmark.py --profiles
+DETECTION_HAAR_PREFILTER = settings.get("detection_haar_prefilter", True)
+CAMERA_SOURCE = settings.get("camera_source", 0)  # camera index, stream URL, video file or image folder (see frame_sources.py)
+LANE_CONFIGS = load_lane_configs(settings)          # entrance lanes sharing one gallery, see lanes.py
+RECOGNITION_WORKERS = settings.get("recognition_workers", 1)  # shared by all lanes
+LANE_DISPLAY_SCALE = settings.get("lane_display_scale", 0.6)  # camera views are shrunk when there are several lanes
+RECOGNITION_SERVER_URL = settings.get("recognition_server_url")  # thin kiosk: recognition runs on this server
+RECOGNITION_SERVER_TOKEN = settings.get("recognition_server_token")  # the server's --token, for registration/deletion
+QUALITY_GATE_ENABLED = settings.get("quality_gate", True)  # thresholds: the "quality" section, see quality.py
+REGISTRATION_BURST = settings.get("registration_burst", 12)  # good frames collected; the best CAPTURE_FRAMES are kept
+RECENT_IDENTITY_SIZE = settings.get("recent_identity_size", 64)    # people checked before the full gallery (0 = off)
+RECENT_IDENTITY_TTL = settings.get("recent_identity_ttl", 300)     # seconds a recently seen person stays cached
+PUNCH_DEBOUNCE_SECONDS = settings.get("punch_debounce_seconds", 60)  # same face punch is not re-sent within this (0 = off)
+IDLE_MODE = settings.get("idle_mode", True)                 # always-on lanes sleep until motion, see motion.py
+IDLE_QUIET_SECONDS = settings.get("idle_quiet_seconds", 10)  # no motion or face for this long -> back to idle
+IDLE_CHECK_FPS = settings.get("idle_check_fps", 4)          # motion checks per second while idle
+IDLE_RENDER_INTERVAL = 0.25                                 # seconds between redraws of an idle lane
+CROWD_FEEDBACK_SECONDS = 5   # how long a crowd lane shows a person's punch result over their face
+CROWD_FEEDBACK_COLORS = {"seen": (0, 255, 0), "unknown": (0, 0, 255), "pending": (0, 255, 255),
+                         "ok": (0, 255, 0), "failed": (0, 0, 255), "duplicate": (255, 255, 0)}  # BGR
+TEMPLATE_SYNC_ENABLED = settings.get("template_sync", False)      # share enrollments via server_url, see template_sync.py
+TEMPLATE_SYNC_INTERVAL = settings.get("template_sync_interval", 30)  # seconds between pulls
+KIOSK_ID = settings.get("kiosk_id")                                # defaults to the host name
 
 # === Utility ===
-def load_templates(file):
-    if os.path.exists(file):
-        return dict(np.load(file, allow_pickle=True))
-    return {}
+def open_template_store(store_dir, legacy_file):
+    """
+    Opens the incremental template store, importing the legacy .npz the first time.
+    """
+    store = TemplateStore(store_dir)
+    imported = store.import_legacy(legacy_file)
+    if imported:
+        print(f"✅ Imported {imported} users from {legacy_file} into {store_dir}")
+    return store
 
-def save_templates(templates, file):
-    np.savez(file, **templates)
+def build_matcher(templates):
+    """
+    Builds the gallery matcher, optionally backed by the index named in
+    settings.json ("gallery_index": "brute" or "ivf"). "gallery_precision"
+    ("float32", "float16" or "int8") and "gallery_centroids" select a compact
+    first pass; see `python gallery.py` for the trade-offs.
+    """
+    precision = settings.get("gallery_precision", "float64")
+    centroids = settings.get("gallery_centroids", False)
+    backend = settings.get("gallery_index")
+    if not backend:
+        return GalleryMatcher(templates, precision=precision, centroids=centroids)
+    options = {}
+    if backend == "ivf":
+        options["nprobe"] = settings.get("gallery_index_nprobe", 8)
+    return GalleryMatcher(templates, build_index(backend, templates, **options), precision, centroids)
+
+STARTUP_TIMING_FILE = os.path.join(os.path.dirname(SETTINGS_FILE), "startup_timing.jsonl")
+
+# === METRICS ===
+# Per-stage counters and latency histograms (see metrics.py). Off by default;
+# F2 toggles the on-screen debug overlay and turns collection on with it.
+METRICS_ENABLED = settings.get("metrics_enabled", False)
+STATS_FILE = os.path.join(os.path.dirname(SETTINGS_FILE), "kiosk_stats.json")
+STATS_INTERVAL_SECONDS = settings.get("stats_interval_seconds", 10)
+STATS_HTTP_PORT = settings.get("stats_http_port", 0)  # 0 = no local endpoint
+
+# === EVENT LOG ===
+# Bounded message log behind the "System Logs" pane, mirrored to a rotating JSON-lines file
+EVENT_LOG_FILE = os.path.join(os.path.dirname(SETTINGS_FILE), "kiosk_events.log")
+EVENT_LOG_SIZE = settings.get("event_log_size", 300)
+EVENT_LOG_MAX_BYTES = settings.get("event_log_max_bytes", 1_000_000)
+EVENT_LOG_BACKUPS = settings.get("event_log_backups", 5)
+LOG_FLUSH_INTERVAL_MS = 250  # the log pane is redrawn at most this often
+
+def load_engine(timer):
+    """
+    Imports and initialises the heavy modules. Runs on a background thread
+    while the window is already painted; each stage is recorded in timer.
+    """
+    global cv2, np, face_recognition, GalleryMatcher, build_index
+    global FrameGrabber, RecognitionPool, FpsCounter, FaceDetector, FaceTracker, TemplateStore, FrameRenderer
+    global AttendanceClient, CONNECTION_FAILED, READ_TIMEOUT, attendance_client, RecognitionClient, RemoteGallery
+    global Recognizer, open_source, QualityGate, RecentIdentities, PunchDebouncer, MotionGate
+    global TemplateSync, TemplateSyncClient
+
+    with timer.stage("import"):
+        # requests first, so ID-only login works as early as possible
+        from attendance import AttendanceClient, CONNECTION_FAILED, READ_TIMEOUT
+        attendance_client = create_attendance_client()
+        import numpy as np
+        import cv2
+        from gallery import GalleryMatcher
+        from gallery_index import build_index
+        from pipeline import FrameGrabber, RecognitionPool, FpsCounter
+        from tracking import FaceTracker
+        from template_store import TemplateStore
+        from render import FrameRenderer
+        from recognition import Recognizer
+        from frame_sources import open_source
+        from quality import QualityGate
+        from identity_cache import RecentIdentities, PunchDebouncer
+        from motion import MotionGate
+        from template_sync import TemplateSync, TemplateSyncClient
+
+    with timer.stage("model load"):
+        if RECOGNITION_SERVER_URL:
+            # Thin kiosk: the server has the models, so dlib is never loaded here
+            from recognition_client import RecognitionClient, RemoteGallery
+        else:
+            import face_recognition  # loads the dlib detector and landmark/encoder models
+            from detection import FaceDetector
 
 # === MAIN APP ===
 class FacialBiometricLoginApp:
@@ -95,18 +217,37 @@ class FacialBiometricLoginApp:
         
         # Optional: bind Escape key to exit fullscreen
         self.root.bind("<Escape>", lambda e: self.root.attributes("-fullscreen", False))
+        # F2 shows/hides the per-stage timing overlay on the camera view
+        self.root.bind("<F2>", lambda e: self.toggle_debug_overlay())
         # Variables
-        self.cap = None
-        self.mode = None
-        self.face_templates = load_templates(FACE_TEMPLATE_FILE)
+        self.lanes = []   # one per camera, see create_lanes
+        self.pool = None  # recognition workers shared by all lanes
+        self.results = None
+        # Filled in by the background engine loader (see start_engine_loading)
+        self.engine_ready = False
+        self.engine_error = None
+        self.template_store = None
+        self.face_templates = {}
+        self.matcher = None
+        self.recognizer = None  # recognition.Recognizer, run by the pool threads
+        self.flusher = None
+        self.profile_name = RECOGNITION_PROFILE
+        self.template_sync = None  # template_sync.TemplateSync when template_sync is on
+        self.remote = None  # RecognitionClient when recognition_server_url is set
+        # A thin kiosk's enroll/delete are HTTP calls: one at a time, never on the Tk thread
+        self.gallery_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gallery")
+        # Serializes every write to the matcher, face_templates and the store: the kiosk's own
+        # (change_gallery) and template sync's pulled changes. Readers don't take it.
+        self.gallery_lock = threading.RLock()
         self.running = False
-        self.capture_buffer = []
-        self.logged_in = False
-        self.logged_out = False
         self.logged_in_user = None
         self.user_id = None
         self.last_popup_message = None
-        self.status_text = ""  # Overlay text on camera
+        self.debug_overlay = False
+        self.event_log = EventLog(EVENT_LOG_SIZE, EVENT_LOG_FILE, EVENT_LOG_MAX_BYTES, EVENT_LOG_BACKUPS)
+        self.shown_log_version = -1
+        self.shown_log_added = 0  # event_log.added and line count at the last redraw
+        self.shown_log_lines = 0
 
         # === Title (Scrolling) ===
         # self.title_text = "   EVERSOFT FACIAL BIOMETRIC LOGIN SYSTEM   "
@@ -122,14 +263,12 @@ class FacialBiometricLoginApp:
         title_frame = tk.Frame(root, bg="#0B132B")
         title_frame.pack(pady=10)
 
-        # Load and display the logo
-        logo_image = Image.open("logo.png")
-        logo_image = logo_image.resize((80, 80), Image.Resampling.LANCZOS)  # Updated Pillow resize
-        logo_photo = ImageTk.PhotoImage(logo_image)
-
-        logo_label = tk.Label(title_frame, image=logo_photo, bg="#0B132B")
-        logo_label.image = logo_photo  # keep a reference
-        logo_label.pack(side=tk.LEFT, padx=(0, 10))
+        # Logo placeholder; the image is decoded and resized off the main thread
+        self.logo_image = None
+        self.logo_placeholder = tk.PhotoImage(width=80, height=80)
+        self.logo_label = tk.Label(title_frame, image=self.logo_placeholder, bg="#0B132B")
+        self.logo_label.image = None
+        self.logo_label.pack(side=tk.LEFT, padx=(0, 10))
 
         # Title text next to the logos
         self.title_text = "DAHFI FACIAL BIOMETRIC LOGIN SYSTEM"
@@ -162,8 +301,7 @@ class FacialBiometricLoginApp:
         self.left_frame = tk.Frame(main_frame, bg="#000000", width=800, height=600)
         self.left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
         self.left_frame.pack_propagate(False)
-        self.video_label = tk.Label(self.left_frame, bg="black")
-        self.video_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        self.lanes = self.create_lanes()
 
         # Right - Controls
         self.right_frame = tk.Frame(main_frame, bg="#1C2541", width=350)
@@ -224,6 +362,154 @@ class FacialBiometricLoginApp:
         )
         self.message_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.message_text.yview)
+        self.flush_messages()
+
+        # === Metrics ===
+        metrics.enabled = METRICS_ENABLED
+        self.duty = DutyCycle()  # CPU per kiosk state (idle / active / stopped)
+        metrics.add_section("duty_cycle", self.duty.report)
+        self.stats_writer = StatsFileWriter(metrics, STATS_FILE, STATS_INTERVAL_SECONDS)
+        self.stats_writer.start()
+        if STATS_HTTP_PORT:
+            try:
+                start_stats_server(metrics, STATS_HTTP_PORT)
+                print(f"📈 Stats at http://127.0.0.1:{STATS_HTTP_PORT}/stats")
+            except OSError as e:
+                print(f"⚠️ Could not start stats endpoint: {e}")
+
+        # === Background startup ===
+        self.timer = StartupTimer(STARTED_AT)
+        self.root.after(0, lambda: self.timer.record("window", self.timer.since_start()))
+        self.start_engine_loading()
+
+    # === Engine loading ===
+    def start_engine_loading(self):
+        self.add_message("⏳ Recognition engine loading...")
+        self.engine_thread = threading.Thread(target=self.load_engine_in_background,
+                                              daemon=True, name="EngineLoader")
+        self.engine_thread.start()
+        self.root.after(100, self.check_engine)
+
+    def load_engine_in_background(self):
+        """
+        Runs on the loader thread. Nothing here may touch Tk; check_engine
+        picks up the results on the main loop.
+        """
+        try:
+            logo_image = Image.open("logo.png")
+            self.logo_image = logo_image.resize((80, 80), Image.Resampling.LANCZOS)  # Updated Pillow resize
+
+            load_engine(self.timer)
+
+            with self.timer.stage("gallery load"):
+                if RECOGNITION_SERVER_URL:
+                    self.remote = RecognitionClient(RECOGNITION_SERVER_URL, token=RECOGNITION_SERVER_TOKEN)
+                    self.face_templates = dict.fromkeys(self.remote.users())
+                    self.matcher = RemoteGallery(self.remote)
+                else:
+                    self.template_store = open_template_store(TEMPLATE_STORE_DIR, FACE_TEMPLATE_FILE)
+                    self.face_templates = self.template_store.load()
+                    self.matcher = build_matcher(self.face_templates)
+            quality = None
+            if QUALITY_GATE_ENABLED:
+                # Pose checks need landmarks, which a thin kiosk has no model for
+                quality = QualityGate.from_settings(
+                    settings, landmarks=face_recognition.face_landmarks if self.remote is None else None)
+            self.recognizer = Recognizer(self.matcher, submit_punch, remote=self.remote, tolerance=RECOGNITION_TOLERANCE,
+                                         capture_frames=CAPTURE_FRAMES, quality=quality,
+                                         burst=REGISTRATION_BURST,
+                                         recent=RecentIdentities(RECENT_IDENTITY_SIZE, RECENT_IDENTITY_TTL)
+                                         if RECENT_IDENTITY_SIZE else None,
+                                         debouncer=PunchDebouncer(PUNCH_DEBOUNCE_SECONDS)
+                                         if PUNCH_DEBOUNCE_SECONDS else None)
+
+            self.apply_profile(self.profile_name)  # sets the encoder and every lane's detector
+
+            for lane in self.lanes:
+                lane.tracker = FaceTracker()
+                lane.renderer = FrameRenderer(lane.capture_box, output_size=self.lane_display_size)
+                if IDLE_MODE and lane.continuous:
+                    lane.motion = MotionGate(lane.capture_box, idle_fps=IDLE_CHECK_FPS,
+                                             quiet_seconds=IDLE_QUIET_SECONDS)
+            self.flusher = JournalFlusher(punch_journal, attendance_client)
+            self.flusher.start()
+            if TEMPLATE_SYNC_ENABLED and self.remote is None:  # a thin kiosk's gallery lives on its server
+                self.template_sync = TemplateSync(TemplateSyncClient(server_url), self.matcher, self.template_store,
+                                                  templates=self.face_templates, kiosk_id=KIOSK_ID,
+                                                  interval=TEMPLATE_SYNC_INTERVAL, lock=self.gallery_lock)
+                self.template_sync.start()
+        except Exception as e:
+            print(f"❌ Failed to load recognition engine: {e}")
+            self.engine_error = e
+
+    def apply_profile(self, name):
+        """
+        Switches detection and encoding to a profile from settings.json
+        ("fast", "balanced", "accurate" or a custom one). Safe while lanes
+        run: each lane gets a new detector in one assignment, and running
+        lanes restart their attempt so no track keeps an encoding made with
+        the old settings.
+        """
+        if name not in PROFILES:
+            print(f"⚠️ Unknown recognition profile '{name}', using {DEFAULT_PROFILE}")
+            name = DEFAULT_PROFILE
+        profile = PROFILES[name]
+        self.profile_name = name
+        self.recognizer.max_fps = profile["max_fps"]
+        if self.remote is None:  # a thin kiosk's server does its own detection and encoding
+            self.recognizer.encode = encoder_for(profile, face_recognition.face_encodings)
+            for lane in self.lanes:
+                lane.detector = FaceDetector(lane.capture_box, downscale=profile["downscale"],
+                                             use_haar=DETECTION_HAAR_PREFILTER and not lane.crowd,  # sized for one face
+                                             upsample=profile["upsample"],
+                                             model=profile["detector_model"])
+        if self.running:
+            for lane in self.lanes:
+                if lane.mode is not None:
+                    lane.reset(lane.mode)
+        print(f"⚙️ Recognition profile: {describe(name, profile)}")
+
+    def check_engine(self):
+        if self.logo_image is not None and self.logo_label.image is None:
+            logo_photo = ImageTk.PhotoImage(self.logo_image)
+            self.logo_label.configure(image=logo_photo)
+            self.logo_label.image = logo_photo  # keep a reference
+
+        if self.engine_thread.is_alive():
+            self.root.after(100, self.check_engine)
+            return
+
+        if self.engine_error is not None:
+            self.add_message(f"❌ Recognition engine failed to load: {self.engine_error}")
+            messagebox.showerror("Engine Error", f"Recognition engine failed to load:\n{self.engine_error}")
+            return
+
+        self.engine_ready = True
+        self.timer.record("engine ready", self.timer.since_start())
+        self.add_message(f"✅ Recognition engine ready ({len(self.face_templates)} users).")
+        self.add_message(f"Startup: {self.timer.report()}")
+        print(f"⏱️ Startup: {self.timer.report()}")
+        self.timer.save(STARTUP_TIMING_FILE)
+
+        # Entrance lanes run unattended, so their cameras start right away
+        if any(lane.continuous for lane in self.lanes):
+            self.start_camera("login")
+
+    def toggle_debug_overlay(self):
+        self.debug_overlay = not self.debug_overlay
+        if self.debug_overlay and not metrics.enabled:
+            metrics.enabled = True
+            self.add_message("📈 Metrics collection enabled.")
+        self.add_message(f"Debug overlay {'on' if self.debug_overlay else 'off'}.")
+
+    def require_engine(self):
+        if self.engine_ready:
+            return True
+        if self.engine_error is not None:
+            messagebox.showerror("Engine Error", f"Recognition engine failed to load:\n{self.engine_error}")
+        else:
+            self.add_message("⏳ Recognition engine is still loading, please wait...")
+        return False
 
     # === Title scrolling ===
     # def animate_title(self):
@@ -247,47 +533,155 @@ class FacialBiometricLoginApp:
 
     # === Message display ===
     def add_message(self, msg):
-        self.message_text.insert(tk.END, f"[{time.strftime('%H:%M:%S')}] {msg}\n")
-        self.message_text.see(tk.END)
-        self.message_text.update_idletasks()
+        # Cheap and thread-safe; the pane is redrawn by flush_messages
+        self.event_log.add(msg)
+
+    def flush_messages(self):
+        """
+        Redraws the log pane from the event log, at most every
+        LOG_FLUSH_INTERVAL_MS and only when something changed. A reader who
+        scrolled up stays on the same line, even as old lines fall off the top.
+        """
+        if self.event_log.version != self.shown_log_version:
+            version, added, lines = self.event_log.snapshot()
+            at_bottom = self.message_text.yview()[1] >= 0.999
+            top_line, top_char = map(int, self.message_text.index("@0,0").split("."))
+            self.message_text.delete("1.0", tk.END)
+            self.message_text.insert(tk.END, "\n".join(lines) + "\n")
+            if at_bottom:
+                self.message_text.see(tk.END)
+            else:
+                dropped = (added - self.shown_log_added) - (len(lines) - self.shown_log_lines)
+                self.message_text.yview(f"{max(1, top_line - dropped)}.{top_char}")
+            self.shown_log_version, self.shown_log_added, self.shown_log_lines = version, added, len(lines)
+            self.event_log.flush()
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_messages)
 
     # === Camera control ===
+    def create_lanes(self):
+        """
+        One lane per configured camera, or a single button-driven lane.
+        A single lane keeps the original centred view; several are tiled.
+        """
+        configs = LANE_CONFIGS or [{"name": "", "source": CAMERA_SOURCE, "mode": None, "capture_box": CAPTURE_BOX}]
+        lanes = [Lane(**config) for config in configs]
+        if len(lanes) == 1:
+            self.lane_display_size = None
+            lanes[0].video_label = tk.Label(self.left_frame, bg="black")
+            lanes[0].video_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        else:
+            self.lane_display_size = (int(640 * LANE_DISPLAY_SCALE), int(480 * LANE_DISPLAY_SCALE))
+            grid = tk.Frame(self.left_frame, bg="#000000")
+            grid.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+            for index, lane in enumerate(lanes):
+                lane.video_label = tk.Label(grid, bg="black")
+                lane.video_label.grid(row=index // 2, column=index % 2, padx=4, pady=4)
+
+        # One persistent PhotoImage per lane; frames are pasted into it in place
+        for lane in lanes:
+            lane.photo = ImageTk.PhotoImage("RGBA", self.lane_display_size or (640, 480))
+            lane.video_label.configure(image=lane.photo)
+        return lanes
+
     def start_camera(self, mode):
-        if self.cap is None:
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        if not self.require_engine():
+            return
+        opened = []
+        for lane in self.lanes:
+            if lane.cap is None:
+                lane.cap = open_source(lane.source)
+            if lane.cap.isOpened():
+                opened.append(lane)
+            else:
+                lane.cap.release()
+                lane.cap = None
+                self.add_message(lane.label(f"⚠️ Unable to access camera {lane.source}."))
+        if not opened:
             messagebox.showerror("Camera Error", "Unable to access the camera.")
             return
 
-        # Reset states for each new login attempt
-        if mode == "login":
-            self.logged_in = False  # Reset login state
-            self.logged_in_user = None
-
-        self.mode = mode
+        # Reset states for each new attempt. Entrance lanes keep their own
+        # mode; registration borrows the first camera with a guide box.
         self.running = True
-        self.capture_buffer = []
-        self.status_text = ""
-        self.start_time = time.time()  # ⏱️ record start time
-        self.add_message(f"Camera started in {mode.upper()} mode. Initializing...")
-
-        self.update_frame()
+        self.camera_started_at = time.perf_counter()
+        register_lane = next((lane for lane in opened if not lane.crowd), opened[0])
+        for lane in opened:
+            lane_mode = mode
+            if lane.continuous and not (mode == "register" and lane is register_lane):
+                lane_mode = lane.fixed_mode
+            lane.reset(lane_mode)  # ⏱️ also records the start time
+            lane.user_id = self.user_id if lane_mode == "register" else None
+            self.add_message(lane.label(f"Camera started in {lane_mode.upper()} mode. Initializing..."))
+
+        # Capture and recognition run on their own threads; Tk only renders.
+        # A lane opened while the pool already runs is wired in the same way.
+        starting = self.pool is None
+        if starting:
+            self.results = queue.Queue()
+            self.pool = RecognitionPool(self.recognizer.recognize_frame, RECOGNITION_WORKERS, self.results)
+        pool = self.pool
+        for lane in opened:
+            if lane.grabber is None:
+                if lane.motion is not None:
+                    lane.motion.reset()  # start idle, with a background from this session
+                lane.fps = FpsCounter()
+                lane.display_fps = FpsCounter()
+                lane.displayed_frame_id = 0
+                lane.grabber = FrameGrabber(lane.cap, on_frame=lambda lane=lane: pool.frame_ready(lane))
+                lane.grabber.start()
+        if starting:
+            pool.start()
+            self.update_frame()
+
+    def restart_lane(self, lane):
+        """
+        Puts an entrance lane back in its own mode after a punch or
+        registration. Only that lane starts over; the others keep running.
+        """
+        if self.running and lane.grabber is not None:
+            lane.reset(lane.fixed_mode)
+
+    def stop_attended_lanes(self):
+        """
+        Ends a button-driven attempt. With no entrance lane running that
+        stops the camera, as it always has. Always-on entrance lanes keep
+        running (an ID-only punch must not switch them off for the day), so
+        only the button-driven lanes are parked until the next button press.
+        """
+        if not any(lane.continuous and lane.grabber is not None for lane in self.lanes):
+            self.stop_camera()
+            return
+        for lane in self.lanes:
+            if not lane.continuous and lane.mode is not None:
+                lane.recognition_done = True
+                lane.status_text = ""
 
     def stop_camera(self):
         self.running = False
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
-
-        black_img = np.zeros((480, 640, 3), dtype=np.uint8)
-        black_img = Image.fromarray(black_img)
-        imgtk = ImageTk.PhotoImage(image=black_img)
-        self.video_label.imgtk = imgtk
-        self.video_label.configure(image=imgtk)
-
+        if self.pool is not None:
+            self.pool.stop()
+        for lane in self.lanes:
+            if lane.grabber is not None:
+                lane.grabber.stop()
+                lane.grabber.join(timeout=1.0)
+                lane.grabber = None
+        if self.pool is not None:
+            self.pool.join(timeout=1.0)
+            self.pool = None
+
+        for lane in self.lanes:
+            if lane.cap is not None:
+                lane.cap.release()
+                lane.cap = None
+            if lane.renderer is not None:
+                lane.renderer.blank()
+                lane.photo.paste(lane.renderer.image)
+            lane.mode = None
+            lane.status_text = ""
+
+        self.duty.set_state("stopped")
         self.add_message("Camera stopped.")
-        self.mode = None
-        self.status_text = ""
+        self.add_message(f"Duty cycle: {self.duty.summary_line()}")
 
     def ask_password(self):
         pw_window = tk.Toplevel(self.root)
@@ -339,6 +733,8 @@ class FacialBiometricLoginApp:
     #     self.user_id = user_id
     #     self.start_camera("register")
     def register_face(self):
+        if not self.require_engine():
+            return
         # 1. Ask for User ID
         user_id = simpledialog.askstring("Register Face", "Enter User ID:")
         if not user_id:
@@ -389,6 +785,8 @@ class FacialBiometricLoginApp:
     #     else:
     #         messagebox.showerror("Not Found", f"No user found with ID: {user_to_delete}")
     def delete_face(self):
+        if not self.require_engine():
+            return
         # Make sure users exist
         if not self.face_templates:
             messagebox.showinfo("No Data", "No registered users found.")
@@ -415,53 +813,148 @@ class FacialBiometricLoginApp:
             return
 
         # 3. Delete user if exists
-        if user_to_delete in self.face_templates:
-            del self.face_templates[user_to_delete]
-            save_templates(self.face_templates, FACE_TEMPLATE_FILE)
+        if user_to_delete not in self.face_templates:
+            messagebox.showerror("Not Found", f"No user found with ID: {user_to_delete}")
+            return
+
+        def deleted(error):
+            if error is not None:
+                self.add_message(f"❌ Could not delete user {user_to_delete}: {error}")
+                messagebox.showerror("Delete Failed", f"User '{user_to_delete}' was not deleted:\n{error}")
+                return
             self.add_message(f"Deleted user: {user_to_delete}")
             messagebox.showinfo("Deleted", f"User '{user_to_delete}' deleted successfully.")
+
+        self.change_gallery(deleted, self.remove_user, user_to_delete)
+
+    def register_user(self, user_id, templates):
+        self.matcher.set_user(user_id, templates)
+        self.face_templates[user_id] = templates
+        if self.template_store is not None:  # a thin kiosk has no local store
+            self.template_store.put(user_id, templates)
+        if self.template_sync is not None:
+            self.template_sync.record_put(user_id, templates)
+
+    def remove_user(self, user_id):
+        self.matcher.remove_user(user_id)
+        self.face_templates.pop(user_id, None)
+        if self.template_store is not None:
+            self.template_store.delete(user_id)
+        if self.template_sync is not None:
+            self.template_sync.record_delete(user_id)
+
+    def change_gallery(self, on_done, change, *args):
+        """
+        Runs change(*args) (register_user or remove_user) under gallery_lock
+        and calls on_done(error) on the Tk thread, error being None on
+        success. The matcher goes first, so face_templates, the store and the
+        sync outbox only change once it took the change. On a thin kiosk the
+        matcher is a request to the recognition server, so the change runs on
+        gallery_executor and the Tk loop keeps drawing while it waits.
+        """
+        def run():
+            try:
+                with self.gallery_lock:
+                    change(*args)
+            except Exception as e:
+                return (e,)
+            return (None,)
+
+        if self.remote is None:
+            on_done(*run())
         else:
-            messagebox.showerror("Not Found", f"No user found with ID: {user_to_delete}")
+            self.poll_future(self.gallery_executor.submit(run), on_done)
 
     def login_with_id_only(self):
+        if attendance_client is None:
+            self.add_message("⏳ Still starting up, please try again in a moment.")
+            return
         user_id = simpledialog.askstring("Login", "Enter User ID:")
         if not user_id:
             return
 
-        # Send login request WITHOUT face
-        server_username, server_full_name = send_login_to_server(user_id, "login")
+        def done(server_username, server_full_name):
+            # Handle server errors
+            if server_username is None:
+                self.show_popup(f"❌ {server_full_name}", status="error")
+                self.add_message(f"⚠️ Login failed: {server_full_name}")
+                return
 
-        # Handle server errors
-        if server_username is None:
-            self.show_popup(f"❌ {server_full_name}", status="error")
-            self.add_message(f"⚠️ Login failed: {server_full_name}")
-            return
+            # Success
+            self.show_popup(f"✅ Login Successful for {server_full_name}", status="success")
+            self.add_message(f"User '{server_full_name}' logged in successfully.")
 
-        # Success
-        self.show_popup(f"✅ Login Successful for {server_full_name}", status="success")
-        self.add_message(f"User '{server_full_name}' logged in successfully.")
+        # Send login request WITHOUT face
+        self.submit_punch(user_id, "login", done)
 
     def logout_with_id_only(self):
+        if attendance_client is None:
+            self.add_message("⏳ Still starting up, please try again in a moment.")
+            return
         user_id = simpledialog.askstring("Logout", "Enter User ID:")
         if not user_id:
             return
 
-        # Send login request WITHOUT face
-        server_username, server_full_name = send_login_to_server(user_id, "logout")
+        def done(server_username, server_full_name):
+            # Handle server errors
+            if server_username is None:
+                self.show_popup(f"❌ {server_full_name}", status="error")
+                self.add_message(f"⚠️ Logout failed: {server_full_name}")
+                return
 
-        # Handle server errors
-        if server_username is None:
-            self.show_popup(f"❌ {server_full_name}", status="error")
-            self.add_message(f"⚠️ Logout failed: {server_full_name}")
-            return
+            # Success
+            self.show_popup(f"✅ Login Successful for {server_full_name}", status="success")
+            self.add_message(f"User '{server_full_name}' logged in successfully.")
+
+        # Send logout request WITHOUT face
+        self.submit_punch(user_id, "logout", done)
+
+    # === Attendance (non-blocking) ===
+    def submit_punch(self, user_id, status, on_done, source="id"):
+        """
+        Sends the punch through the journal and calls on_done(username, full_name)
+        on the Tk thread once the server answers.
+        """
+        self.add_message(f"⏳ Submitting {status} for {user_id}...")
+        event_id, future = submit_punch(user_id, status, source)
+        self.track_punch(user_id, event_id, future, on_done)
+
+    def track_punch(self, user_id, event_id, future, on_done):
+        """
+        Records the server's answer in the journal. If the server could not be
+        reached the punch stays pending for the background flusher and the user
+        is told it was saved, so they don't keep retrying. A server that was
+        reached but did not answer may have recorded it: the flusher replays it
+        under the same event_id, which the server deduplicates.
+        """
+        def resolved(server_username, server_full_name):
+            if server_username is not None:
+                punch_journal.mark([(event_id, SENT, None)])
+            elif server_full_name == CONNECTION_FAILED:
+                punch_journal.mark([(event_id, PENDING, CONNECTION_FAILED)])
+                self.flusher.wake()
+                self.add_message(f"📥 Server unreachable. Punch for {user_id} saved offline.")
+                server_username, server_full_name = user_id, f"{user_id} (saved offline, will sync automatically)"
+            elif server_full_name == READ_TIMEOUT:
+                punch_journal.mark([(event_id, RETRY, READ_TIMEOUT)])
+                self.flusher.wake()
+                self.add_message(f"⏳ Server did not answer in time. Punch for {user_id} saved, will be confirmed.")
+                server_username, server_full_name = user_id, f"{user_id} (saved, will be confirmed automatically)"
+            else:
+                punch_journal.mark([(event_id, REJECTED, server_full_name)])
+            on_done(server_username, server_full_name)
+
+        self.poll_future(future, resolved)
 
-        # Success
-        self.show_popup(f"✅ Login Successful for {server_full_name}", status="success")
-        self.add_message(f"User '{server_full_name}' logged in successfully.")
+    def poll_future(self, future, on_done):
+        # Tk is not thread-safe, so completion is picked up from the main loop
+        if future.done():
+            on_done(*future.result())
+        else:
+            self.root.after(50, self.poll_future, future, on_done)
 
     # === Logout User ===
     def logout_user(self):
-        self.logged_out = False
     # Add debugging statements
         # print(f"Logged In: {self.logged_in}, Logged In User: {self.logged_in_user}")
 
@@ -483,7 +976,7 @@ class FacialBiometricLoginApp:
         settings_win = tk.Toplevel(self.root)
         settings_win.title("Settings")
         settings_win.configure(bg="#1C2541")
-        settings_win.geometry("400x200")
+        settings_win.geometry("520x330")
         settings_win.attributes('-topmost', True)
 
         tk.Label(settings_win, text="Server URL:", font=("Arial", 12, "bold"),
@@ -493,10 +986,40 @@ class FacialBiometricLoginApp:
         url_entry = tk.Entry(settings_win, textvariable=server_url_var, font=("Arial", 12), width=40)
         url_entry.pack(pady=5)
 
+        # Speed/accuracy profile, with the numbers from the last benchmark.py --profiles run
+        tk.Label(settings_win, text="Recognition profile:", font=("Arial", 12, "bold"),
+                 bg="#1C2541", fg="#6FFFE9").pack(pady=(15, 5))
+        measured = load_measurements(PROFILE_BENCHMARK_PATH)
+        profile_var = tk.StringVar(value=self.profile_name)
+        profile_menu = tk.OptionMenu(settings_win, profile_var, *PROFILES.keys())
+        profile_menu.config(font=("Arial", 12), bg="#3A506B", fg="#FFFFFF", width=15)
+        profile_menu.pack(pady=5)
+        profile_info = tk.Label(settings_win, font=("Arial", 9), bg="#1C2541", fg="#FFFFFF",
+                                wraplength=480, justify="center")
+        profile_info.pack(pady=5)
+
+        def show_profile(*_):
+            name = profile_var.get()
+            profile_info.configure(text=describe(name, PROFILES[name], measured.get(name)))
+        profile_var.trace_add("write", show_profile)
+        show_profile()
+
         def save_settings_btn():
             global server_url, settings
             server_url = server_url_var.get()
             settings['server_url'] = server_url
+            if attendance_client is not None:
+                attendance_client.base_url = server_url
+            profile_name = profile_var.get()
+            if profile_name != self.profile_name:
+                settings['recognition_profile'] = profile_name
+                if self.engine_ready:
+                    self.apply_profile(profile_name)
+                else:
+                    self.profile_name = profile_name  # picked up when the engine finishes loading
+                self.add_message(f"✅ Recognition profile: {profile_name}")
+            if self.template_sync is not None:
+                self.template_sync.client.base_url = server_url
             save_settings(settings)
             self.add_message(f"✅ Server URL updated to: {server_url}")
             settings_win.destroy()
@@ -533,7 +1056,12 @@ class FacialBiometricLoginApp:
     #     # Use after() to schedule the popup to close after the given duration
     #     popup.after(duration, close_popup)
 
-    def show_popup(self, username_fullname, status="success", duration=3000):
+    def show_popup(self, username_fullname, status="success", duration=3000, stop=True):
+        """
+        Shows a message for `duration` ms. A success or error popup also ends
+        the button-driven attempt (stop_attended_lanes), unless stop=False:
+        entrance lanes pass that and restart themselves (restart_lane) instead.
+        """
         # --- PREVENT DUPLICATE POPUP ---
         if self.last_popup_message == (username_fullname, status):
             return  # Prevent same popup from showing again
@@ -577,196 +1105,190 @@ class FacialBiometricLoginApp:
             popup.destroy()
             self.last_popup_message = None
 
-        if status in ("success", "error"):
-            self.stop_camera()
+        if stop and status in ("success", "error"):
+            self.stop_attended_lanes()
 
         popup.after(duration, close_popup)
 
         
 
-    # === Frame Update ===
+    # === Frame Update (Tk thread) ===
     def update_frame(self):
-        if not self.running or self.cap is None:
+        if not self.running or self.pool is None:
             return
 
-        ret, frame = self.cap.read()
-        if ret:
-            frame = cv2.resize(frame, (640, 480))
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            elapsed = time.time() - getattr(self, 'start_time', 0)
-            detect_faces = elapsed >= 2  # start detecting after 2 seconds
+        # Apply everything the recognition workers produced since the last tick
+        while self.running:
+            try:
+                lane, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.apply_result(lane, result)
+        if not self.running:
+            return
 
-            if detect_faces:
-                faces = face_recognition.face_locations(rgb_frame)
-                encodings = face_recognition.face_encodings(rgb_frame, faces)
-            else:
-                faces, encodings = [], []
-                cv2.putText(frame, "Keep your face within the guide box... Starting soon...",
-                            (10, 470), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2, cv2.LINE_AA)
-
-            # --- CAPTURE ZONE COORDINATES ---
-            CAPTURE_X1, CAPTURE_Y1 = 170, 100
-            CAPTURE_X2, CAPTURE_Y2 = 470, 380
-
-            # --- BLUR OUTSIDE BOX ---
-            blurred_frame = cv2.GaussianBlur(frame, (25, 25), 0)
-            blurred_frame[CAPTURE_Y1:CAPTURE_Y2, CAPTURE_X1:CAPTURE_X2] = frame[CAPTURE_Y1:CAPTURE_Y2, CAPTURE_X1:CAPTURE_X2]
-            frame = blurred_frame
-
-            # Draw capture box
-            cv2.rectangle(frame, (CAPTURE_X1, CAPTURE_Y1), (CAPTURE_X2, CAPTURE_Y2), (255, 255, 0), 2)
-            cv2.putText(frame, "Keep your face within the guide box.", (CAPTURE_X1, CAPTURE_Y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-
-            # Draw mode/status
-            mode_text = f"MODE: {self.mode.upper() if self.mode else 'IDLE'}"
-            cv2.putText(frame, mode_text, (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2, cv2.LINE_AA)
-            if self.status_text:
-                cv2.putText(frame, self.status_text, (10, 470),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
-
-            for (top, right, bottom, left), encoding in zip(faces, encodings):
-                # Draw face rectangle
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-
-                # --- FACE CENTER AND CAPTURE ZONE CHECK ---
-                face_center_x = (left + right) // 2
-                face_center_y = (top + bottom) // 2
-
-                if not (CAPTURE_X1 <= face_center_x <= CAPTURE_X2 and CAPTURE_Y1 <= face_center_y <= CAPTURE_Y2):
-                    self.status_text = "Move your face inside the box"
-                    continue  # Skip processing until face is inside zone
-                # --- DISTANCE CHECK ---
-                face_height = bottom - top
-                box_height = CAPTURE_Y2 - CAPTURE_Y1
-
-                # Define min/max size relative to box height
-                min_face_size = int(0.5 * box_height)  # face should be at least 50% of box height
-                max_face_size = int(0.6 * box_height)  # face should be at most 50% of box height
-
-                if face_height < min_face_size:
-                    self.status_text = "Move closer to the camera"
-                    self.add_message("Move closer to the camera")
+        # Idle lanes skip recognition and are redrawn only a few times a second
+        now = time.perf_counter()
+        running = [lane for lane in self.lanes if lane.grabber is not None]
+        self.duty.set_state("active" if any(lane.motion is None or lane.motion.active for lane in running) else "idle")
+        for lane in running:
+            if lane.motion is not None and not lane.motion.active:
+                if now < lane.next_render:
                     continue
+                lane.next_render = now + IDLE_RENDER_INTERVAL
+            frame_id, frame = lane.grabber.latest()
+            if frame is not None and frame_id != lane.displayed_frame_id:
+                lane.displayed_frame_id = frame_id
+                with metrics.timer("render"):
+                    self.render_frame(lane, frame)
+                lane.display_fps.tick()
+                if not self.timer.has("first frame"):
+                    self.timer.record("first frame", time.perf_counter() - self.camera_started_at)
+                    self.add_message(f"Startup: {self.timer.report()}")
+                    self.timer.save(STARTUP_TIMING_FILE)
+
+        self.root.after(DISPLAY_INTERVAL_MS, self.update_frame)
+
+    def render_frame(self, lane, frame):
+        fps_text = lane.label(f"Display {lane.display_fps.fps:.1f} FPS | Recognition {lane.fps.fps:.1f} FPS")
+        debug_lines = metrics.summary_lines() + [self.duty.summary_line()] if self.debug_overlay else None
+        lane.renderer.render(frame, lane.mode, lane.status_text, lane.last_faces, fps_text,
+                             warming_up=time.time() - lane.start_time < 2, debug_lines=debug_lines,
+                             quality_text=lane.quality_text, labels=self.crowd_labels(lane))
+
+        # Display frame: update the lane's Tk image in place
+        lane.photo.paste(lane.renderer.image)
+
+    def apply_result(self, lane, result):
+        """
+        Applies one recognition result on the Tk thread: status, log lines
+        and any login/logout/registration event of that lane.
+        """
+        lane.last_faces = result["faces"]
+        if result["status_text"] is not None:
+            lane.status_text = result["status_text"]
+        if result["quality"] is not None:
+            lane.quality_text = result["quality"]
+        for msg in result["messages"]:
+            self.add_message(lane.label(msg))
+        if "labels" in result:  # crowd lane: any number of people per frame
+            lane.last_labels = result["labels"]
+            for event in result["events"]:
+                self.apply_crowd_event(lane, event)
+
+        event = result["event"]
+        if event is None:
+            return
 
-                if face_height > max_face_size:
-                    self.status_text = "Move back from the camera"
-                    self.add_message("Move back from the camera")
-                    continue
+        if event["kind"] == "register":
+            self.change_gallery(lambda error: self.finish_register(lane, event, error),
+                                self.register_user, event["user_id"], event["templates"])
+
+        elif event["kind"] == "punch":
+            self.track_punch(event["user_id"], event["event_id"], event["future"],
+                             lambda username, full_name: self.finish_face_punch(lane, event["status"], username,
+                                                                                full_name, event["user_id"]))
+
+        elif event["kind"] == "duplicate":
+            # Same face punch moments ago: nothing is sent, the person is just told
+            self.add_message(lane.label(f"ℹ️ {event['user_id']} already recorded ({event['status']}), not sent again."))
+            if lane.continuous:
+                self.root.after(3000, self.restart_lane, lane)
+            else:
+                self.root.after(3000, self.stop_attended_lanes)
+
+    def finish_register(self, lane, event, error):
+        """
+        Tells the user how a registration (register_user) went and frees the lane.
+        """
+        user_id = event["user_id"]
+        if error is not None:
+            self.add_message(lane.label(f"❌ Registration of {user_id} failed: {error}"))
+            self.show_popup(f"❌ Registration failed for {user_id}", status="error", stop=not lane.continuous)
+        else:
+            self.show_popup(f"Face Registered: {user_id}", status="success", stop=not lane.continuous)
+            self.add_message(f"User '{user_id}' registered successfully.")
+        if lane.continuous:
+            self.restart_lane(lane)
+        else:
+            self.stop_attended_lanes()
+
+    # === Crowd lanes ===
+    def crowd_labels(self, lane):
+        """
+        (text, colour) per face of a crowd lane: the person's punch progress
+        while it is fresh, otherwise who they were recognized as.
+        """
+        if not lane.crowd or lane.mode == "register":
+            return None
+        now = time.time()
+        labels = []
+        for text, user_id in lane.last_labels:
+            shown = lane.feedback.get(user_id)
+            if shown is not None and shown[2] > now:
+                labels.append((shown[0], CROWD_FEEDBACK_COLORS[shown[1]]))
+            else:
+                labels.append((text, CROWD_FEEDBACK_COLORS["unknown" if user_id is None else "seen"]))
+        return labels
+
+    def set_feedback(self, lane, user_id, text, state):
+        now = time.time()
+        lane.feedback[user_id] = (text, state, now + CROWD_FEEDBACK_SECONDS)
+        if len(lane.feedback) > 200:
+            lane.feedback = {key: shown for key, shown in lane.feedback.items() if shown[2] > now}
+
+    def apply_crowd_event(self, lane, event):
+        """
+        One person's punch on a crowd lane. It is in flight alongside
+        everyone else's; its progress is shown over that person's face.
+        """
+        user_id, status = event["user_id"], event["status"]
+        if event["kind"] == "duplicate":
+            self.set_feedback(lane, user_id, f"{user_id}: already recorded", "duplicate")
+            return
+        self.set_feedback(lane, user_id, f"{user_id}: submitting...", "pending")
+        self.track_punch(user_id, event["event_id"], event["future"],
+                         lambda username, full_name: self.finish_crowd_punch(lane, status, username,
+                                                                             full_name, user_id))
 
-                # Registration
-                # if self.mode == "register":
-                #     self.capture_buffer.append(encoding)
-                #     self.add_message(f"Captured frame {len(self.capture_buffer)}/{CAPTURE_FRAMES}")
-                #     if len(self.capture_buffer) >= CAPTURE_FRAMES:
-                #         self.face_templates[self.user_id] = self.capture_buffer.copy()
-                #         save_templates(self.face_templates, FACE_TEMPLATE_FILE)
-                #         self.show_popup(f"Face Registered: {self.user_id}", status="success")
-                #         self.add_message(f"User '{self.user_id}' registered successfully.")
-                #         self.stop_camera()
-
-                if self.mode == "register":
-                    for (top, right, bottom, left), encoding in zip(faces, encodings):
-                        # Calculate face center
-                        face_center_x = (left + right) // 2
-                        face_center_y = (top + bottom) // 2
-
-                        # Step 1: Align face inside box
-                        if not (CAPTURE_X1 <= face_center_x <= CAPTURE_X2 and
-                                CAPTURE_Y1 <= face_center_y <= CAPTURE_Y2):
-                            self.status_text = "Step 1: Move your face inside the box"
-                            break  # wait until user aligns
-
-                        # Step 2: Adjust distance (face size)
-                        face_height = bottom - top
-                        box_height = CAPTURE_Y2 - CAPTURE_Y1
-                        min_face_size = int(0.5 * box_height)
-                        max_face_size = int(0.6 * box_height)
-
-                        if face_height < min_face_size:
-                            self.status_text = "Step 2: Move closer to the camera"
-                            break  # wait until user moves closer
-                        if face_height > max_face_size:
-                            self.status_text = "Step 2: Move back from the camera"
-                            break  # wait until user moves back
-
-                        # Step 3: Capture frame
-                        if len(self.capture_buffer) < CAPTURE_FRAMES:
-                            self.capture_buffer.append(encoding)
-                            frames_captured = len(self.capture_buffer)
-                            self.status_text = f"Step 3: Capturing face... Frame {frames_captured}/{CAPTURE_FRAMES}"
-                            self.add_message(f"Captured frame {frames_captured}/{CAPTURE_FRAMES}")
-
-                        # Step 4: Save templates once enough frames are captured
-                        if len(self.capture_buffer) >= CAPTURE_FRAMES:
-                            self.face_templates[self.user_id] = self.capture_buffer.copy()
-                            save_templates(self.face_templates, FACE_TEMPLATE_FILE)
-                            self.show_popup(f"Face Registered: {self.user_id}", status="success")
-                            self.add_message(f"User '{self.user_id}' registered successfully.")
-                            self.capture_buffer.clear()
-                            self.stop_camera()
-                            return
-
-                # Login
-                elif self.mode == "login" and not self.logged_in:
-                    match_found = False
-                    for name, templates in self.face_templates.items():
-                        matches = face_recognition.compare_faces(templates, encoding, tolerance=RECOGNITION_TOLERANCE)
-                        if matches.count(True) >= 4 and matches[0] == True:#max(1, len(templates)//2):
-                            server_username, server_full_name = send_login_to_server(name, "login")
-                            if server_username is None:  # Handle fail case (e.g. user not registered)
-                                self.status_text = "Login failed"
-                                self.show_popup(f"❌ {server_full_name}", status="error")
-                                self.add_message(f"⚠️ {server_full_name}.")
-                                return
-                            self.show_popup(f"✅ Login successful for {server_full_name}", status="success")
-                            self.add_message(f"✅ Login successful for {server_full_name}")
-                            self.logged_in = True
-                            match_found = True
-                            self.status_text = f"Logged in: {server_full_name}"  # Instead of name, show full name from server
-                            self.root.after(3000, self.stop_camera)
-                            return
-                    if not match_found:
-                        self.status_text = "Face not recognized"
-                        self.add_message("⚠️ Face detected but not recognized.")
-
-                # === Logout ===
-                elif self.mode == "logout" and not self.logged_out:
-                    print('logout')
-                    match_found = False
-                    # We don't use self.logged_in_user anymore
-                    for name, templates in self.face_templates.items():
-                        matches = face_recognition.compare_faces(templates, encoding, tolerance=RECOGNITION_TOLERANCE)
-                        if matches.count(True) >= 4 and matches[0] == True:# max(1, len(templates)//2):
-                            server_username, server_full_name = send_login_to_server(name, "logout")
-                            if server_username is None:  # Handle fail case (e.g. user not registered or not logged in)
-                                self.status_text = "Logout failed"
-                                self.show_popup(f"❌ {server_full_name}", status="error")
-                                self.add_message(f"⚠️ {server_full_name}.")
-                                return
-                            self.show_popup(f"✅ Logout successful for {server_full_name}", status="success")
-                            self.add_message(f"✅ Logout successful for {server_username}")
-                            match_found = True
-                            self.logged_out = True
-                            self.logged_in = False
-                            self.status_text = "Logged out successfully"
-                            
-
-                            self.root.after(3000, self.stop_camera)
-                            return
-                    if not match_found:
-                        self.status_text = "Face does not match registered user"
-                        self.add_message("⚠️ Face detected but does not match any registered user.")
-
-            # Display frame
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-            img = Image.fromarray(frame)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
-
-        self.root.after(100, self.update_frame)
+    def finish_crowd_punch(self, lane, status, server_username, server_full_name, user_id):
+        if server_username is None:
+            self.recognizer.crowd_debouncer.forget(user_id, status)
+            self.set_feedback(lane, user_id, f"{user_id}: {server_full_name}", "failed")
+            self.add_message(lane.label(f"⚠️ {user_id}: {server_full_name}."))
+            return
+        done = "logged in" if status == "login" else "logged out"
+        self.set_feedback(lane, user_id, f"{server_full_name}: {done}", "ok")
+        self.add_message(lane.label(f"✅ {server_full_name} {done}"))
+
+    def finish_face_punch(self, lane, status, server_username, server_full_name, user_id=None):
+        if server_username is None:  # Handle fail case (e.g. user not registered or not logged in)
+            if self.recognizer.debouncer is not None:
+                self.recognizer.debouncer.forget(user_id, status)  # let them try again right away
+            lane.status_text = "Login failed" if status == "login" else "Logout failed"
+            self.show_popup(lane.label(f"❌ {server_full_name}"), status="error", stop=not lane.continuous)
+            self.add_message(lane.label(f"⚠️ {server_full_name}."))
+            if lane.continuous:
+                self.root.after(3000, self.restart_lane, lane)
+            return
+
+        if status == "login":
+            self.show_popup(lane.label(f"✅ Login successful for {server_full_name}"), status="success",
+                            stop=not lane.continuous)
+            self.add_message(lane.label(f"✅ Login successful for {server_full_name}"))
+            lane.logged_in = True
+            lane.status_text = f"Logged in: {server_full_name}"  # Instead of name, show full name from server
+        else:
+            self.show_popup(lane.label(f"✅ Logout successful for {server_full_name}"), status="success",
+                            stop=not lane.continuous)
+            self.add_message(lane.label(f"✅ Logout successful for {server_username}"))
+            lane.logged_out = True
+            lane.logged_in = False
+            lane.status_text = "Logged out successfully"
+        if lane.continuous:
+            self.root.after(3000, self.restart_lane, lane)  # ready for the next person
+        else:
+            self.root.after(3000, self.stop_attended_lanes)
 
 # === MAIN ===
 if __name__ == "__main__":
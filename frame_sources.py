@@ -0,0 +1,154 @@
+import os
+import time
+
+import cv2
+
+# === CONFIGURATION ===
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+DEFAULT_FPS = 30.0  # pacing for image directories and videos without a frame rate
+
+
+# === Frame sources ===
+# Everything FrameGrabber and replay.py read frames from. Each source has the
+# cv2.VideoCapture interface the kiosk already uses (isOpened, read, release),
+# so a recorded video or a folder of stills can stand in for a camera.
+class FrameSource:
+    """
+    Base for recorded sources. With realtime=True read() is paced to the
+    source frame rate, like a camera; with realtime=False frames come back
+    as fast as they can be decoded. `finished` is set once a non-looping
+    source runs out, after which read() keeps returning (False, None).
+    """
+
+    def __init__(self, fps=DEFAULT_FPS, realtime=True, loop=False):
+        self.fps = fps or DEFAULT_FPS
+        self.realtime = realtime
+        self.loop = loop
+        self.finished = False
+        self.frames_read = 0
+        self.next_due = None
+
+    def _pace(self):
+        if not self.realtime:
+            return
+        now = time.perf_counter()
+        if self.next_due is None or now - self.next_due > 1.0:  # first frame, or resync after a stall
+            self.next_due = now
+        elif self.next_due > now:
+            time.sleep(self.next_due - now)
+        self.next_due += 1.0 / self.fps
+
+    def read(self):
+        if self.finished:
+            return False, None
+        frame = self._next_frame()
+        if frame is None and self.loop and self.frames_read:
+            self._rewind()
+            frame = self._next_frame()
+        if frame is None:
+            self.finished = True
+            return False, None
+        self._pace()
+        self.frames_read += 1
+        return True, frame
+
+    def _next_frame(self):
+        raise NotImplementedError
+
+    def _rewind(self):
+        raise NotImplementedError
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class WebcamSource:
+    """
+    A live camera (index) or network stream (URL). Live sources pace
+    themselves, so this only passes calls through to cv2.VideoCapture.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.cap = cv2.VideoCapture(device)
+        self.finished = False
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """
+    A recorded video file, decoded frame by frame.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        super().__init__(self.cap.get(cv2.CAP_PROP_FPS), realtime, loop)
+
+    def _next_frame(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def _rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    A directory of still frames, read in file-name order. Unreadable files
+    are skipped.
+    """
+
+    def __init__(self, path, fps=DEFAULT_FPS, realtime=True, loop=False):
+        super().__init__(fps, realtime, loop)
+        self.path = path
+        self.files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+        self.position = 0
+
+    def _next_frame(self):
+        while self.position < len(self.files):
+            frame = cv2.imread(self.files[self.position])
+            self.position += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def _rewind(self):
+        self.position = 0
+
+    def isOpened(self):
+        return bool(self.files)
+
+
+def open_source(spec, realtime=True, loop=True, fps=DEFAULT_FPS):
+    """
+    Opens a frame source from a settings value or command-line argument:
+    a camera index (0, "1"), a stream URL ("rtsp://..."), a directory of
+    images or a video file. The kiosk plays recordings in real time and on a
+    loop; replay.py reads them once, as fast as possible.
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return WebcamSource(int(spec))
+    if "://" in spec:
+        return WebcamSource(spec)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, fps=fps, realtime=realtime, loop=loop)
+    return VideoFileSource(spec, realtime=realtime, loop=loop)
@@ -0,0 +1,437 @@
+import threading
+import time
+import numpy as np
+
+from capture_rules import RECOGNITION_TOLERANCE
+
+# === CONFIGURATION ===
+MIN_MATCHING_TEMPLATES = 4  # at least 4 of the 5 stored templates must match
+PRECISIONS = ("float64", "float32", "float16", "int8")
+FIRST_PASS_CHUNK = 4096     # compact rows widened to float32 at a time, so the working set stays in cache
+FIRST_PASS_SLACK = 1e-3     # covers float32 rounding in first-pass distances
+
+
+# === Gallery Matcher ===
+class GalleryMatcher:
+    """
+    Holds every enrolled template in one contiguous (N_templates, 128) matrix
+    so a probe encoding is compared against the whole gallery with a single
+    batched distance computation instead of one compare_faces call per user.
+
+    Users are kept in the same order as the face_templates dict, so when more
+    than one user satisfies the rule the first one wins, exactly like the old loop.
+
+    With an index (see gallery_index.py) the index only shortlists candidate
+    users and the 4-of-5 rule is then checked on that shortlist alone.
+
+    All public methods take an internal lock so the recognition worker can
+    match while the Tk thread registers or deletes users.
+
+    With a compact precision ("float32", "float16" or "int8" with a scale
+    and offset per dimension) match() and match_many() first scan a compact
+    copy of the gallery, optionally one centroid per user instead of every
+    template, and only users that might pass the rule are re-checked against
+    the float64 templates. Each compact row carries a bound on its rounding
+    error (and for centroids, the distance from the centroid to template 0),
+    so the first pass never drops a user the exact rule would accept:
+    decisions are the same as with float64.
+    """
+
+    def __init__(self, templates=None, index=None, precision="float64", centroids=False):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown gallery precision: {precision}")
+        self.user_ids = []       # user order, mirrors face_templates dict order
+        self.user_templates = {}  # user_id -> (n, 128) array
+        self.order = {}          # user_id -> insertion sequence number
+        self.next_order = 0
+        self.index = index
+        self.matrix = np.empty((0, 128))
+        self.owners = np.empty(0, dtype=np.intp)      # row -> user index
+        self.first_rows = np.empty(0, dtype=np.intp)  # user index -> row of template 0
+        self.precision = precision
+        self.centroids = centroids
+        self.compact = None      # first-pass matrix, see _build_compact
+        self.dirty = False
+        self.version = 0  # bumped on every gallery change, lets callers invalidate cached matches
+        self.lock = threading.RLock()
+        if templates:
+            self.rebuild(templates)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self.user_templates
+
+    # --- Gallery maintenance ---
+    def rebuild(self, templates):
+        with self.lock:
+            self.user_ids = []
+            self.user_templates = {}
+            self.order = {}
+            for user_id, user_templates in templates.items():
+                self.user_ids.append(user_id)
+                self.user_templates[user_id] = self._as_matrix(user_templates)
+                self.order[user_id] = self.next_order
+                self.next_order += 1
+            self.dirty = True
+            self.version += 1
+
+    def set_user(self, user_id, user_templates):
+        """
+        Adds or overwrites a user. An overwritten user keeps its position,
+        the same way assigning to an existing dict key does.
+        """
+        with self.lock:
+            if user_id not in self.user_templates:
+                self.user_ids.append(user_id)
+                self.order[user_id] = self.next_order
+                self.next_order += 1
+            self.user_templates[user_id] = self._as_matrix(user_templates)
+            if self.index is not None and len(self.user_templates[user_id]):
+                self.index.add(user_id, self.user_templates[user_id][0])
+            self.dirty = True
+            self.version += 1
+
+    def remove_user(self, user_id):
+        with self.lock:
+            if user_id not in self.user_templates:
+                return False
+            del self.user_templates[user_id]
+            del self.order[user_id]
+            self.user_ids.remove(user_id)
+            if self.index is not None:
+                self.index.remove(user_id)
+            self.dirty = True
+            self.version += 1
+            return True
+
+    def apply_changes(self, puts=(), deletes=()):
+        """
+        Applies a batch of (user_id, templates) puts and user_id deletes with
+        one version bump. A user overwritten with the same number of
+        templates is patched in place (rows and norms) while the float64
+        matrix is current, so syncing a few changed users does not restack
+        the whole gallery.
+        """
+        with self.lock:
+            deleted = {user_id for user_id in deletes if user_id in self.user_templates}
+            if deleted:
+                for user_id in deleted:
+                    del self.user_templates[user_id]
+                    del self.order[user_id]
+                    if self.index is not None:
+                        self.index.remove(user_id)
+                self.user_ids = [user_id for user_id in self.user_ids if user_id not in deleted]
+                self.dirty = True
+            for user_id, user_templates in puts:
+                block = self._as_matrix(user_templates)
+                current = self.user_templates.get(user_id)
+                if (not self.dirty and self.compact is None and current is not None
+                        and len(current) == len(block)):
+                    first_row = self.first_rows[self.positions[user_id]]
+                    self.matrix[first_row:first_row + len(block)] = block  # current is a view of these rows
+                    self.squared_norms[first_row:first_row + len(block)] = np.einsum("ij,ij->i", block, block)
+                else:
+                    if current is None:
+                        self.user_ids.append(user_id)
+                        self.order[user_id] = self.next_order
+                        self.next_order += 1
+                    self.user_templates[user_id] = block
+                    self.dirty = True
+                if self.index is not None and len(block):
+                    self.index.add(user_id, block[0])
+            if puts or deleted:
+                self.version += 1
+
+    @staticmethod
+    def _as_matrix(user_templates):
+        return np.asarray(user_templates, dtype=np.float64).reshape(-1, 128)
+
+    def _restack(self):
+        blocks = [self.user_templates[user_id] for user_id in self.user_ids]
+        counts = np.array([len(block) for block in blocks], dtype=np.intp)
+        if blocks:
+            self.matrix = np.ascontiguousarray(np.concatenate(blocks))
+        else:
+            self.matrix = np.empty((0, 128))
+        self.owners = np.repeat(np.arange(len(blocks), dtype=np.intp), counts)
+        self.first_rows = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp) if blocks else np.empty(0, dtype=np.intp)
+        self.row_counts = counts
+        self.empty_users = counts == 0
+        self.squared_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.positions = {user_id: position for position, user_id in enumerate(self.user_ids)}
+        # Users become views into the matrix, so each template is held once
+        for user_id, first_row, count in zip(self.user_ids, self.first_rows, counts):
+            self.user_templates[user_id] = self.matrix[first_row:first_row + count]
+        if self.precision != "float64" or self.centroids:
+            self._build_compact()
+        self.dirty = False
+
+    def _build_compact(self):
+        """
+        Builds the first-pass matrix (templates, or one centroid per user) in
+        the compact precision, plus per-row slack: the rounding error of the
+        row and, for centroids, the distance from the centroid to template 0.
+        A row further than tolerance + slack from a probe cannot be a match.
+        """
+        has_rows = ~self.empty_users
+        if self.centroids:
+            keys = np.zeros((len(self.user_ids), 128))
+            if has_rows.any():
+                sums = np.add.reduceat(self.matrix, self.first_rows[has_rows], axis=0)
+                keys[has_rows] = sums / self.row_counts[has_rows, None]
+            slack = np.full(len(keys), -np.inf)  # users without templates never pass
+            slack[has_rows] = np.linalg.norm(self.matrix[self.first_rows[has_rows]] - keys[has_rows], axis=1)
+        else:
+            keys = self.matrix
+            slack = np.zeros(len(keys))
+
+        self.compact_scale = self.compact_offset = None
+        if self.precision == "int8":
+            low, high = (keys.min(axis=0), keys.max(axis=0)) if len(keys) else (np.zeros(128), np.zeros(128))
+            offset = (high + low) / 2
+            scale = np.maximum((high - low) / 254, 1e-12)
+            self.compact = np.clip(np.rint((keys - offset) / scale), -127, 127).astype(np.int8)
+            restored = self.compact * scale + offset
+            self.compact_scale = scale.astype(np.float32)
+            self.compact_offset = offset.astype(np.float32)
+        else:
+            self.compact = np.ascontiguousarray(keys, dtype=self.precision)
+            restored = self.compact.astype(np.float64)
+        self.compact_norms = np.einsum("ij,ij->i", restored, restored).astype(np.float32)
+        self.compact_slack = (slack + np.linalg.norm(restored - keys, axis=1) + FIRST_PASS_SLACK).astype(np.float32)
+
+    def _first_pass(self, probes):
+        """
+        Approximate (B, rows) distances from float64 probes to the compact rows.
+        """
+        probes32 = probes.astype(np.float32)
+        weights = probes32 * self.compact_scale if self.compact_scale is not None else probes32
+        dots = np.empty((len(probes), len(self.compact)), dtype=np.float32)
+        for start in range(0, len(self.compact), FIRST_PASS_CHUNK):
+            block = self.compact[start:start + FIRST_PASS_CHUNK].astype(np.float32, copy=False)
+            np.matmul(weights, block.T, out=dots[:, start:start + len(block)])
+        if self.compact_offset is not None:
+            dots += (probes32 @ self.compact_offset)[:, None]
+        squared = np.einsum("ij,ij->i", probes32, probes32)[:, None] + self.compact_norms[None, :] - 2.0 * dots
+        return np.sqrt(np.maximum(squared, 0.0, out=squared), out=squared)
+
+    def _match_compact(self, encodings, tolerance, min_matches):
+        """
+        match_many() for a compact gallery: shortlist users from the compact
+        pass, then apply the rule to them at full precision in gallery order.
+        """
+        approx = self._first_pass(encodings)
+        possible = approx <= tolerance + self.compact_slack[None, :]
+        if self.centroids:
+            shortlists = possible
+        else:
+            running = np.concatenate((np.zeros((len(encodings), 1), dtype=np.intp),
+                                      np.cumsum(possible, axis=1)), axis=1)
+            counts = running[:, self.first_rows + self.row_counts] - running[:, self.first_rows]
+            first_hit = np.zeros_like(counts, dtype=bool)
+            has_rows = ~self.empty_users
+            first_hit[:, has_rows] = possible[:, self.first_rows[has_rows]]
+            shortlists = (counts >= min_matches) & first_hit
+
+        results = []
+        for encoding, shortlist, row_distances in zip(encodings, shortlists, approx):
+            match = None
+            for user in np.flatnonzero(shortlist):
+                distances = np.linalg.norm(self.user_templates[self.user_ids[user]] - encoding, axis=1)
+                hits = distances <= tolerance
+                if np.count_nonzero(hits) >= min_matches and hits[0]:
+                    match = (self.user_ids[user], float(distances[0]))
+                    break
+            if match is None:
+                # Nearest template of the user the compact pass puts closest
+                nearest = int(np.argmin(row_distances))
+                user = nearest if self.centroids else int(self.owners[nearest])
+                user_rows = self.user_templates[self.user_ids[user]]
+                match = (None, float(np.linalg.norm(user_rows - encoding, axis=1).min()) if len(user_rows) else float("inf"))
+            results.append(match)
+        return results
+
+    def memory_bytes(self):
+        """
+        Bytes held by the gallery arrays: the float64 templates and, if
+        there is one, the compact first-pass matrix.
+        """
+        with self.lock:
+            if self.dirty:
+                self._restack()
+            total = {"float64": self.matrix.nbytes}
+            if self.compact is not None:
+                total["first_pass"] = self.compact.nbytes
+            return total
+
+    # --- Matching ---
+    def distances(self, encoding):
+        """
+        Euclidean distance from the probe to every template row (same formula
+        as face_recognition.face_distance).
+        """
+        with self.lock:
+            if self.dirty:
+                self._restack()
+            if len(self.matrix) == 0:
+                return np.empty(0)
+            return np.linalg.norm(self.matrix - encoding, axis=1)
+
+    def qualifying_users(self, encoding, tolerance, min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Returns the indices (in gallery order) of every user that satisfies
+        the rule: >= min_matches templates within tolerance and template 0 matches.
+        """
+        with self.lock:
+            distances = self.distances(encoding)
+            if len(distances) == 0:
+                return np.empty(0, dtype=np.intp)
+            hits = distances <= tolerance
+            counts = np.bincount(self.owners[hits], minlength=len(self.user_ids))
+            first_hit = np.zeros(len(self.user_ids), dtype=bool)
+            has_rows = ~self.empty_users
+            first_hit[has_rows] = hits[self.first_rows[has_rows]]
+            return np.flatnonzero((counts >= min_matches) & first_hit)
+
+    def match_shortlist(self, encoding, candidates, tolerance, min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Applies the rule to the given candidate users only, in gallery order.
+        """
+        with self.lock:
+            for user_id in sorted(set(candidates), key=self.order.__getitem__):
+                hits = np.linalg.norm(self.user_templates[user_id] - encoding, axis=1) <= tolerance
+                if np.count_nonzero(hits) >= min_matches and hits[0]:
+                    return user_id
+            return None
+
+    def match(self, encoding, tolerance, min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Returns the user_id of the first matching user, or None.
+        """
+        with self.lock:
+            if self.index is not None:
+                candidates = self.index.candidates(encoding, tolerance)
+                return self.match_shortlist(encoding, candidates, tolerance, min_matches)
+            if self.dirty:
+                self._restack()
+            if self.compact is not None and len(self.compact):
+                return self._match_compact(np.asarray(encoding, dtype=np.float64).reshape(1, 128),
+                                           tolerance, min_matches)[0][0]
+            qualifying = self.qualifying_users(encoding, tolerance, min_matches)
+            if len(qualifying) == 0:
+                return None
+            return self.user_ids[qualifying[0]]
+
+    def match_many(self, encodings, tolerance, min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Matches a batch of probes with one (B, N_templates) distance matrix.
+        Returns [(user_id or None, distance)] in probe order; distance is to
+        the matched user's template 0, or to the nearest template when there
+        is no match. Same first-match-wins rule as match().
+        """
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+        with self.lock:
+            if self.index is not None:
+                return [self._match_with_distance(encoding, tolerance, min_matches) for encoding in encodings]
+            if self.dirty:
+                self._restack()
+            if len(encodings) == 0:
+                return []
+            if len(self.matrix) == 0:
+                return [(None, float("inf"))] * len(encodings)
+            if self.compact is not None:
+                return self._match_compact(encodings, tolerance, min_matches)
+
+            # |p - t|^2 = |p|^2 + |t|^2 - 2 p.t, clipped against rounding below zero
+            squared = (np.einsum("ij,ij->i", encodings, encodings)[:, None]
+                       + self.squared_norms[None, :] - 2.0 * encodings @ self.matrix.T)
+            distances = np.sqrt(np.maximum(squared, 0.0))
+            hits = distances <= tolerance
+
+            # Per-user hit counts from a running sum over each user's block of rows
+            running = np.concatenate((np.zeros((len(encodings), 1), dtype=np.intp),
+                                      np.cumsum(hits, axis=1)), axis=1)
+            counts = running[:, self.first_rows + self.row_counts] - running[:, self.first_rows]
+            first_hit = np.zeros_like(counts, dtype=bool)
+            has_rows = ~self.empty_users
+            first_hit[:, has_rows] = hits[:, self.first_rows[has_rows]]
+            qualifying = (counts >= min_matches) & first_hit
+
+            results = []
+            for row, user_mask in enumerate(qualifying):
+                if user_mask.any():
+                    user = int(np.argmax(user_mask))
+                    results.append((self.user_ids[user], float(distances[row, self.first_rows[user]])))
+                else:
+                    results.append((None, float(distances[row].min())))
+            return results
+
+    def _match_with_distance(self, encoding, tolerance, min_matches):
+        user_id = self.match(encoding, tolerance, min_matches)
+        if user_id is not None:
+            return user_id, float(np.linalg.norm(self.user_templates[user_id][0] - encoding))
+        distances = self.distances(encoding)
+        return None, float(distances.min()) if len(distances) else float("inf")
+
+
+# === MAIN (precision report) ===
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compare compact gallery modes with float64 matching.")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=16, help="probes per match_many call")
+    parser.add_argument("--tolerance", type=float, default=RECOGNITION_TOLERANCE)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Synthetic identities: a cluster centre per user plus 5 noisy captures.
+    # Probe noise is spread so many probes land near the tolerance boundary.
+    centres = rng.normal(scale=0.09, size=(args.users, 128))
+    templates = {f"user{i}": centres[i] + rng.normal(scale=0.01, size=(5, 128)) for i in range(args.users)}
+    picks = rng.integers(0, args.users, args.queries)
+    noise = rng.choice([0.01, 0.018, 0.022, 0.026, 0.03], size=(args.queries, 1))
+    probes = centres[picks] + rng.normal(size=(args.queries, 128)) * noise
+    probes[::4] = rng.normal(scale=0.09, size=(len(probes[::4]), 128))  # impostors
+
+    def run(matcher):
+        matcher.match(probes[0], args.tolerance)  # builds the matrices
+        start = time.perf_counter()
+        single = [matcher.match(probe, args.tolerance) for probe in probes]
+        single_ms = 1000 * (time.perf_counter() - start) / len(probes)
+        start = time.perf_counter()
+        batched = [user for first in range(0, len(probes), args.batch)
+                   for user, _ in matcher.match_many(probes[first:first + args.batch], args.tolerance)]
+        batch_ms = 1000 * (time.perf_counter() - start) / len(probes)
+        return single, batched, single_ms, batch_ms
+
+    reference, _, _, _ = run(GalleryMatcher(templates))
+    print(f"users={args.users} queries={args.queries} matches={sum(user is not None for user in reference)}")
+    reports = []
+    for precision in PRECISIONS:
+        for centroids in (False, True):
+            matcher = GalleryMatcher(templates, precision=precision, centroids=centroids)
+            single, batched, single_ms, batch_ms = run(matcher)
+            memory = matcher.memory_bytes()
+            report = {"precision": precision, "centroids": centroids,
+                      "first_pass_bytes_per_user": round(memory.get("first_pass", memory["float64"]) / args.users, 1),
+                      "total_bytes_per_user": round(sum(memory.values()) / args.users, 1),
+                      "match_ms": round(single_ms, 3), "match_many_ms_per_probe": round(batch_ms, 3),
+                      "differences": sum(a != b for a, b in zip(reference, single))
+                      + sum(a != b for a, b in zip(reference, batched))}
+            reports.append(report)
+            print(f"{precision:<8}{' centroid' if centroids else '         '}  "
+                  f"first pass {report['first_pass_bytes_per_user']:7.1f} B/user  "
+                  f"total {report['total_bytes_per_user']:7.1f} B/user  "
+                  f"match {report['match_ms']:7.3f} ms  batched {report['match_many_ms_per_probe']:7.3f} ms/probe  "
+                  f"differences {report['differences']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,251 @@
+import time
+import numpy as np
+
+from capture_rules import RECOGNITION_TOLERANCE
+
+# === CONFIGURATION ===
+IVF_TRAIN_MIN_USERS = 1000   # below this a single cell (brute force) is fast enough
+IVF_KMEANS_ITERATIONS = 10
+IVF_DEFAULT_NPROBE = 8
+
+# Every index is keyed on template 0 of each user. The recognition rule only
+# accepts a user whose template 0 is within tolerance of the probe, so a range
+# query over the template-0 vectors yields a shortlist that can never miss a
+# user the full 4-of-5 check would accept (for the exact backend).
+
+
+# === Growable cell of vectors ===
+class _Cell:
+    def __init__(self, dim=128):
+        self.vectors = np.empty((16, dim))
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, user_id, vector):
+        size = len(self.ids)
+        if size == len(self.vectors):
+            grown = np.empty((size * 2, self.vectors.shape[1]))
+            grown[:size] = self.vectors
+            self.vectors = grown
+        self.vectors[size] = vector
+        self.ids.append(user_id)
+        return size
+
+    def remove_at(self, pos):
+        """
+        Swap-removes a slot. Returns the user_id that moved into pos (or None).
+        """
+        last = len(self.ids) - 1
+        moved = None
+        if pos != last:
+            self.vectors[pos] = self.vectors[last]
+            self.ids[pos] = self.ids[last]
+            moved = self.ids[pos]
+        self.ids.pop()
+        return moved
+
+    def within(self, encoding, tolerance):
+        size = len(self.ids)
+        if size == 0:
+            return []
+        distances = np.linalg.norm(self.vectors[:size] - encoding, axis=1)
+        return [self.ids[i] for i in np.flatnonzero(distances <= tolerance)]
+
+
+# === Exact backend ===
+class BruteForceIndex:
+    """
+    Exact range search over every user's template 0.
+    """
+    name = "brute"
+
+    def __init__(self):
+        self.cell = _Cell()
+        self.slots = {}  # user_id -> position in cell
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, user_id, key_vector):
+        if user_id in self.slots:
+            self.remove(user_id)
+        self.slots[user_id] = self.cell.append(user_id, key_vector)
+
+    def remove(self, user_id):
+        pos = self.slots.pop(user_id, None)
+        if pos is None:
+            return False
+        moved = self.cell.remove_at(pos)
+        if moved is not None:
+            self.slots[moved] = pos
+        return True
+
+    def candidates(self, encoding, tolerance):
+        return self.cell.within(encoding, tolerance)
+
+
+# === Partitioned (IVF) backend ===
+class IVFIndex:
+    """
+    Inverted-file index: template-0 vectors are partitioned into cells around
+    k-means centroids, and a query only scans the nprobe cells whose centroids
+    are closest to the probe. Adds and removes touch a single cell, so
+    register/delete never need a rebuild; call train() again only if the
+    gallery drifts far from the data the centroids were fitted on.
+    """
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=IVF_DEFAULT_NPROBE):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = np.zeros((1, 128))
+        self.cells = [_Cell()]
+        self.slots = {}  # user_id -> (cell index, position)
+        self.trained = False
+
+    def __len__(self):
+        return len(self.slots)
+
+    def train(self, key_vectors, user_ids, seed=0):
+        """
+        Fits the centroids with a few rounds of k-means and re-buckets all users.
+        """
+        key_vectors = np.asarray(key_vectors, dtype=np.float64).reshape(-1, 128)
+        count = len(key_vectors)
+        if count < IVF_TRAIN_MIN_USERS:
+            self.centroids = np.zeros((1, 128))
+            self.trained = False
+        else:
+            nlist = self.nlist or max(1, int(np.sqrt(count)))
+            rng = np.random.default_rng(seed)
+            centroids = key_vectors[rng.choice(count, nlist, replace=False)].copy()
+            for _ in range(IVF_KMEANS_ITERATIONS):
+                assignment = self._nearest_centroids(key_vectors, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, key_vectors)
+                sizes = np.bincount(assignment, minlength=nlist)
+                filled = sizes > 0
+                centroids[filled] = sums[filled] / sizes[filled, None]
+            self.centroids = centroids
+            self.trained = True
+
+        self.cells = [_Cell() for _ in range(len(self.centroids))]
+        self.slots = {}
+        for user_id, vector in zip(user_ids, key_vectors):
+            self.add(user_id, vector)
+
+    @staticmethod
+    def _nearest_centroids(vectors, centroids):
+        # ||a-b||^2 = ||a||^2 - 2ab + ||b||^2; ||a||^2 is constant per row
+        scores = (centroids ** 2).sum(axis=1) - 2.0 * vectors @ centroids.T
+        return np.argmin(scores, axis=1)
+
+    def add(self, user_id, key_vector):
+        if user_id in self.slots:
+            self.remove(user_id)
+        key_vector = np.asarray(key_vector, dtype=np.float64)
+        cell = int(self._nearest_centroids(key_vector[None, :], self.centroids)[0])
+        self.slots[user_id] = (cell, self.cells[cell].append(user_id, key_vector))
+
+    def remove(self, user_id):
+        slot = self.slots.pop(user_id, None)
+        if slot is None:
+            return False
+        cell, pos = slot
+        moved = self.cells[cell].remove_at(pos)
+        if moved is not None:
+            self.slots[moved] = (cell, pos)
+        return True
+
+    def candidates(self, encoding, tolerance):
+        if len(self.cells) == 1:
+            return self.cells[0].within(encoding, tolerance)
+        distances = np.linalg.norm(self.centroids - encoding, axis=1)
+        nprobe = min(self.nprobe, len(self.cells))
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        found = []
+        for cell in probed:
+            found.extend(self.cells[cell].within(encoding, tolerance))
+        return found
+
+
+INDEX_BACKENDS = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def build_index(backend, templates, **options):
+    """
+    Creates an index of the given backend name over a face_templates dict.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown gallery index backend: {backend}")
+    index = INDEX_BACKENDS[backend](**options)
+    user_ids = list(templates.keys())
+    key_vectors = [np.asarray(templates[user_id]).reshape(-1, 128)[0] for user_id in user_ids]
+    if hasattr(index, "train"):
+        index.train(key_vectors, user_ids)
+    else:
+        for user_id, vector in zip(user_ids, key_vectors):
+            index.add(user_id, vector)
+    return index
+
+
+# === Recall report ===
+def measure_recall(index, exact_index, probes, tolerance):
+    """
+    Compares an approximate index with exact search on the same probes.
+    Returns recall (fraction of exact candidates also returned) and mean
+    query times in milliseconds for both.
+    """
+    expected_total = 0
+    found_total = 0
+    index_time = 0.0
+    exact_time = 0.0
+    for probe in probes:
+        start = time.perf_counter()
+        found = set(index.candidates(probe, tolerance))
+        index_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = set(exact_index.candidates(probe, tolerance))
+        exact_time += time.perf_counter() - start
+
+        expected_total += len(expected)
+        found_total += len(expected & found)
+
+    queries = max(1, len(probes))
+    return {
+        "recall": found_total / expected_total if expected_total else 1.0,
+        "index_ms": 1000 * index_time / queries,
+        "exact_ms": 1000 * exact_time / queries,
+        "queries": len(probes),
+    }
+
+
+# === MAIN (synthetic recall report) ===
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report ANN recall against exact gallery search.")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, default=IVF_DEFAULT_NPROBE)
+    parser.add_argument("--tolerance", type=float, default=RECOGNITION_TOLERANCE)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Synthetic identities: a cluster centre per user plus 5 noisy captures
+    centres = rng.normal(scale=0.09, size=(args.users, 128))
+    templates = {f"user{i}": centres[i] + rng.normal(scale=0.01, size=(5, 128)) for i in range(args.users)}
+    picks = rng.integers(0, args.users, args.queries)
+    probes = centres[picks] + rng.normal(scale=0.01, size=(args.queries, 128))
+
+    exact = build_index("brute", templates)
+    ivf = build_index("ivf", templates, nprobe=args.nprobe)
+    report = measure_recall(ivf, exact, probes, args.tolerance)
+    print(f"users={args.users} cells={len(ivf.cells)} nprobe={args.nprobe}")
+    print(f"recall={report['recall']:.4f}  ivf={report['index_ms']:.3f} ms/query  exact={report['exact_ms']:.3f} ms/query")
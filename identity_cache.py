@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gallery import MIN_MATCHING_TEMPLATES
+from metrics import metrics
+
+# === CONFIGURATION ===
+RECENT_CAPACITY = 64       # identities kept; the least recently seen is evicted first
+RECENT_TTL_SECONDS = 300   # an identity not seen for this long is forgotten
+DEBOUNCE_SECONDS = 60      # a second identical punch within this window is not sent
+
+
+# === Recent identities ===
+class RecentIdentities:
+    """
+    The templates of people matched in the last few minutes, most recent
+    first. A person who steps away and comes back (or lingers through a lane
+    restart) is checked against these few users before the full gallery,
+    with the same 4-of-5 rule. Entries expire after `ttl` seconds, the cache
+    holds at most `capacity` users (LRU), and everything is dropped when the
+    gallery version changes, so a deleted or re-registered user is never
+    matched from stale templates.
+    """
+
+    def __init__(self, capacity=RECENT_CAPACITY, ttl=RECENT_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (templates, last_seen), most recent last
+        self.version = None
+        self.lock = threading.Lock()
+
+    def _sync(self, version, now):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        while self.entries:
+            user_id, (_, last_seen) = next(iter(self.entries.items()))
+            if now - last_seen < self.ttl:
+                break
+            del self.entries[user_id]
+
+    def match(self, encoding, tolerance, version, min_matches=MIN_MATCHING_TEMPLATES, now=None):
+        """
+        Returns the most recently seen user that passes the rule, or None.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            self._sync(version, now)
+            for user_id in reversed(self.entries):
+                templates, _ = self.entries[user_id]
+                hits = np.linalg.norm(templates - encoding, axis=1) <= tolerance
+                if np.count_nonzero(hits) >= min_matches and hits[0]:
+                    self.entries[user_id] = (templates, now)
+                    self.entries.move_to_end(user_id)
+                    metrics.incr("recent_hits")
+                    return user_id
+        metrics.incr("recent_misses")
+        return None
+
+    def remember(self, user_id, templates, version, now=None):
+        if templates is None or not len(templates):
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            self._sync(version, now)
+            self.entries[user_id] = (np.array(templates, dtype=np.float64), now)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# === Punch debouncing ===
+class PunchDebouncer:
+    """
+    Remembers the last face punch per (user, status) so the same login or
+    logout is not sent again within `window` seconds. claim() is atomic, so
+    two lanes (or two workers) seeing the same person cannot both punch.
+    """
+
+    def __init__(self, window=DEBOUNCE_SECONDS):
+        self.window = window
+        self.last_punch = {}  # (user_id, status) -> time
+        self.lock = threading.Lock()
+
+    def claim(self, user_id, status, now=None):
+        """
+        True if the punch should be sent (and records it), False if it is a
+        duplicate within the window.
+        """
+        now = time.time() if now is None else now
+        key = (user_id, status)
+        with self.lock:
+            last = self.last_punch.get(key)
+            if last is not None and now - last < self.window:
+                metrics.incr("punches_debounced")
+                return False
+            self.last_punch[key] = now
+            if len(self.last_punch) > 1000:  # drop expired keys now and then
+                self.last_punch = {k: t for k, t in self.last_punch.items() if now - t < self.window}
+            return True
+
+    def forget(self, user_id, status):
+        """
+        Releases a claim whose punch failed, so the person can try again.
+        """
+        with self.lock:
+            self.last_punch.pop((user_id, status), None)
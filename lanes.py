@@ -0,0 +1,107 @@
+import time
+
+from capture_rules import CAPTURE_BOX, CROWD_BOX
+
+# === CONFIGURATION ===
+LANE_MODES = ("login", "logout")
+
+
+# === Lane ===
+class Lane:
+    """
+    One capture source (camera) and everything the kiosk tracks for it: its
+    mode, capture box, detector/tracker and the state of the current attempt.
+    The gallery and the recognition workers are shared by all lanes.
+
+    A lane configured with a mode in settings.json runs continuously (an
+    entrance lane); a lane without one follows the buttons like the original
+    single-camera kiosk and stops after each punch.
+
+    A crowd lane never finishes an attempt: every identified face is punched
+    as it comes, and `feedback` holds what each person is shown above their
+    face ({user_id: (text, state, shown_until)}).
+    """
+
+    def __init__(self, name, source=0, mode=None, capture_box=CAPTURE_BOX, crowd=False):
+        self.name = name
+        self.source = source
+        self.fixed_mode = mode
+        self.capture_box = tuple(capture_box)
+        self.crowd = crowd
+        self.cap = None
+        self.grabber = None
+        self.detector = None
+        self.tracker = None
+        self.video_label = None
+        self.photo = None         # persistent ImageTk.PhotoImage shown in video_label
+        self.renderer = None      # render.FrameRenderer, allocated once per lane
+        self.fps = None           # recognition FPS, ticked by the worker pool
+        self.display_fps = None
+        self.displayed_frame_id = 0
+        self.user_id = None       # set for the lane that runs a registration
+        self.motion = None        # motion.MotionGate for an always-on lane with idle mode
+        self.next_render = 0.0    # idle lanes are redrawn only a few times a second
+        self.next_recognition = 0.0  # earliest time of the next recognized frame under a max_fps cap
+        self.feedback = {}        # crowd lanes: per-person status, drawn over their face
+        self.reset(mode)
+
+    def reset(self, mode):
+        """
+        Starts a fresh attempt in the given mode.
+        """
+        self.mode = mode
+        self.capture_buffer = []
+        self.status_text = ""
+        self.quality_text = ""   # latest quality-gate scores, shown under the status line
+        self.start_time = time.time()
+        self.recognition_done = False
+        self.last_faces = []
+        self.last_labels = []    # crowd lanes: (text, user_id or None) per face in last_faces
+        self.logged_in = False
+        self.logged_out = False
+        if self.tracker is not None:
+            self.tracker.reset()
+
+    @property
+    def continuous(self):
+        return self.fixed_mode is not None
+
+    def label(self, text):
+        """
+        Prefixes a message with the lane name when there is more than one lane.
+        """
+        return f"[{self.name}] {text}" if self.name else text
+
+
+def load_lane_configs(settings):
+    """
+    Reads the "lanes" list from settings.json, e.g.
+
+        "lanes": [{"name": "IN", "source": 0, "mode": "login"},
+                  {"name": "OUT", "source": 1, "mode": "logout",
+                   "capture_box": [170, 100, 470, 380]},
+                  {"name": "SHIFT", "source": 2, "mode": "login", "crowd": true}]
+
+    source is a camera index, a stream URL, a video file or a directory of
+    images (see frame_sources.open_source). Returns [] when no lanes are
+    configured, in which case the kiosk uses a single button-driven camera.
+    A crowd lane (see Recognizer.process_crowd_frame) handles every face in
+    a wide zone at once; its capture_box defaults to CROWD_BOX.
+    """
+    configs = []
+    for index, entry in enumerate(settings.get("lanes") or []):
+        mode = entry.get("mode")
+        if mode not in LANE_MODES:
+            print(f"⚠️ Lane {index}: mode must be one of {LANE_MODES}, got {mode!r}; skipped")
+            continue
+        crowd = bool(entry.get("crowd", False))
+        box = entry.get("capture_box", CROWD_BOX if crowd else CAPTURE_BOX)
+        if len(box) != 4:
+            print(f"⚠️ Lane {index}: capture_box must be [x1, y1, x2, y2]; skipped")
+            continue
+        configs.append({"name": entry.get("name", f"Lane {index + 1}"),
+                        "source": entry.get("source", index),
+                        "mode": mode,
+                        "capture_box": box,
+                        "crowd": crowd})
+    return configs
@@ -0,0 +1,251 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === CONFIGURATION ===
+BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)  # histogram upper bounds
+STATS_INTERVAL_SECONDS = 10.0
+
+
+# === Histogram ===
+class Histogram:
+    """
+    Fixed-bucket latency histogram: constant memory, O(log buckets) per sample.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile.
+        """
+        if self.count == 0:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+# === Registry ===
+class Metrics:
+    """
+    Counters and latency histograms for the hot path. Every call starts
+    with a single bool check, so a disabled registry costs next to nothing.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.sections = {}  # name -> callable returning extra JSON for snapshot()
+        self.started_at = time.time()
+
+    def add_section(self, name, provider):
+        """
+        Adds provider() under `name` in every snapshot (stats file and endpoint).
+        """
+        self.sections[name] = provider
+
+    def incr(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds * 1000.0)
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "counters": dict(self.counters),
+                "latency": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+        for name, provider in list(self.sections.items()):
+            snapshot[name] = provider()
+        return snapshot
+
+    def summary_lines(self, stages=("capture", "detect", "encode", "match", "render", "server")):
+        """
+        Short lines for the on-screen debug overlay.
+        """
+        with self.lock:
+            lines = []
+            for stage in stages:
+                histogram = self.histograms.get(stage)
+                if histogram is not None and histogram.count:
+                    lines.append(f"{stage:<8} p50 {histogram.percentile(50):>6.1f} ms  p95 {histogram.percentile(95):>6.1f} ms")
+            counters = self.counters
+            lines.append(f"frames {counters.get('frames_read', 0)} dropped {counters.get('frames_dropped', 0)} "
+                         f"faces {counters.get('faces_detected', 0)} matches {counters.get('matches', 0)}")
+            lines.append(f"server {counters.get('server_requests', 0)} errors {counters.get('server_errors', 0)}")
+            return lines
+
+
+# === Duty cycle ===
+class DutyCycle:
+    """
+    Wall time and process CPU time spent in each kiosk state (idle, active,
+    stopped). cpu_percent is CPU seconds per wall second over every thread,
+    so 100 means one core fully busy.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}  # state -> [wall seconds, cpu seconds]
+        self.state = "stopped"
+        self.since_wall = time.perf_counter()
+        self.since_cpu = time.process_time()
+
+    def set_state(self, state):
+        with self.lock:
+            if state != self.state:
+                self._accumulate()
+                self.state = state
+
+    def _accumulate(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        totals = self.totals.setdefault(self.state, [0.0, 0.0])
+        totals[0] += wall - self.since_wall
+        totals[1] += cpu - self.since_cpu
+        self.since_wall, self.since_cpu = wall, cpu
+
+    def report(self):
+        with self.lock:
+            self._accumulate()
+            return {state: {"seconds": round(wall, 1),
+                            "cpu_percent": round(100.0 * cpu / wall, 1) if wall else 0.0}
+                    for state, (wall, cpu) in self.totals.items()}
+
+    def summary_line(self):
+        report = self.report()
+        return "cpu " + "  ".join(f"{state} {stats['cpu_percent']:.0f}% ({stats['seconds']:.0f}s)"
+                                  for state, stats in sorted(report.items()))
+
+
+# Process-wide registry used by the pipeline, detector and attendance client
+metrics = Metrics()
+
+
+# === Exposition ===
+class StatsFileWriter(threading.Thread):
+    """
+    Periodically writes metrics.snapshot() to a JSON file (atomically).
+    """
+
+    def __init__(self, registry, path, interval=STATS_INTERVAL_SECONDS):
+        super().__init__(daemon=True, name="StatsFileWriter")
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            if not self.registry.enabled:
+                continue
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(self.registry.snapshot(), f, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"⚠️ Could not write stats file: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/stats"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.registry.snapshot(), indent=2).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stats_server(registry, port):
+    """
+    Serves the snapshot as JSON on http://127.0.0.1:<port>/stats (local only).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StatsHandler)
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True, name="StatsServer").start()
+    return server
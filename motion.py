@@ -0,0 +1,105 @@
+import time
+
+import cv2
+import numpy as np
+
+from capture_rules import CAPTURE_BOX
+
+# === CONFIGURATION ===
+MOTION_SIZE = (64, 48)        # the capture box is shrunk to this before differencing
+IDLE_CHECK_FPS = 4            # motion checks per second while idle
+PIXEL_DELTA = 18              # grey-level change that counts a pixel as moving
+MOTION_THRESHOLD = 0.02       # fraction of moving pixels that wakes the lane
+BACKGROUND_RATE = 0.05        # how fast the background model follows slow light changes
+QUIET_SECONDS = 10            # no motion and no face for this long sends the lane back to idle
+
+IDLE = "idle"
+ACTIVE = "active"
+
+
+# === Motion gate ===
+class MotionGate:
+    """
+    Idle/active state of an always-on lane. While idle, only a cheap check
+    runs, a few times a second: the capture box is shrunk to a 64x48 grey
+    image and compared with a running-average background. Motion in the box
+    wakes the lane, and the full detection/recognition path runs on every frame.
+    After `quiet_seconds` with neither motion nor a detected face, the lane
+    goes back to idle.
+
+    Called only from the recognition pool, which never runs two frames of
+    the same lane at once, so no locking is needed.
+    """
+
+    def __init__(self, box=CAPTURE_BOX, idle_fps=IDLE_CHECK_FPS, quiet_seconds=QUIET_SECONDS,
+                 threshold=MOTION_THRESHOLD, pixel_delta=PIXEL_DELTA):
+        self.box = box
+        self.check_interval = 1.0 / idle_fps
+        self.quiet_seconds = quiet_seconds
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.small = np.empty((MOTION_SIZE[1], MOTION_SIZE[0], 3), dtype=np.uint8)
+        self.gray = np.empty((MOTION_SIZE[1], MOTION_SIZE[0]), dtype=np.uint8)
+        self.wakeups = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Back to idle with no background, for a camera that is (re)started.
+        Not thread-safe: call it before the lane's frames reach the pool.
+        """
+        self.background = None
+        self.state = IDLE
+        self.last_check = 0.0
+        self.last_activity = 0.0
+
+    @property
+    def active(self):
+        return self.state == ACTIVE
+
+    def motion(self, frame):
+        """
+        Fraction of capture-box pixels that changed against the background.
+        """
+        x1, y1, x2, y2 = self.box
+        cv2.resize(frame[y1:y2, x1:x2], MOTION_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.background is None:
+            self.background = self.gray.astype(np.float32)
+            return 0.0
+        moving = np.count_nonzero(cv2.absdiff(self.gray, self.background.astype(np.uint8)) > self.pixel_delta)
+        cv2.accumulateWeighted(self.gray, self.background, BACKGROUND_RATE)
+        return moving / self.gray.size
+
+    def should_process(self, frame, now=None):
+        """
+        True if this frame should go through recognition. While idle, most
+        frames are skipped without even looking at them.
+        """
+        now = time.time() if now is None else now
+        if self.state == ACTIVE:
+            if self.motion(frame) >= self.threshold:
+                self.last_activity = now
+            return True
+        if now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        if self.motion(frame) < self.threshold:
+            return False
+        self.state = ACTIVE
+        self.last_activity = now
+        self.wakeups += 1
+        return True
+
+    def after_frame(self, faces_found, now=None):
+        """
+        Records the outcome of a processed frame; returns True if the lane
+        just went back to idle.
+        """
+        now = time.time() if now is None else now
+        if faces_found:
+            self.last_activity = now
+        if self.state == ACTIVE and now - self.last_activity >= self.quiet_seconds:
+            self.state = IDLE
+            return True
+        return False
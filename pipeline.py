@@ -0,0 +1,183 @@
+import threading
+import queue
+import time
+from collections import deque
+import cv2
+
+from capture_rules import FRAME_SIZE
+from metrics import metrics
+
+
+# === FPS counter ===
+class FpsCounter:
+    """
+    Counts ticks over a sliding window and reports ticks per second.
+    """
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self.window_start = time.perf_counter()
+        self.fps = 0.0
+
+    def tick(self):
+        self.count += 1
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.fps = self.count / elapsed
+            self.count = 0
+            self.window_start = now
+
+
+# === Capture thread ===
+class FrameGrabber(threading.Thread):
+    """
+    Reads the camera as fast as the driver delivers frames and keeps only the
+    most recent one. Older frames are overwritten (drop-old), so nothing piles
+    up in the driver and consumers always see the freshest image.
+    """
+
+    def __init__(self, cap, frame_size=FRAME_SIZE, on_frame=None):
+        super().__init__(daemon=True, name="FrameGrabber")
+        self.cap = cap
+        self.on_frame = on_frame  # called (on this thread) after each new frame
+        self.frame_size = frame_size
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_id = 0
+        self.consumed_id = 0     # last frame handed to the recognition worker
+        self.frames_read = 0
+        self.frames_dropped = 0  # frames replaced before the worker picked them up
+        self.fps = FpsCounter()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            with metrics.timer("capture"):
+                ret, frame = self.cap.read()
+            if not ret:
+                metrics.incr("capture_failures")
+                time.sleep(0.01)
+                continue
+            frame = cv2.resize(frame, self.frame_size)
+            metrics.incr("frames_read")
+            with self.condition:
+                if self.frame_id != self.consumed_id:
+                    self.frames_dropped += 1
+                    metrics.incr("frames_dropped")
+                self.frame = frame
+                self.frame_id += 1
+                self.frames_read += 1
+                self.condition.notify_all()
+            self.fps.tick()
+            if self.on_frame is not None:
+                self.on_frame()
+
+    def latest(self):
+        with self.condition:
+            return self.frame_id, self.frame
+
+    def has_new_frame(self):
+        with self.condition:
+            return self.frame_id != self.consumed_id
+
+    def wait_for_new_frame(self, timeout=0.5):
+        """
+        Blocks until a frame newer than the last one consumed is available.
+        Returns the frame, or None on timeout/stop.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id != self.consumed_id or not self.running, timeout)
+            if not self.running or self.frame_id == self.consumed_id:
+                return None
+            self.consumed_id = self.frame_id
+            return self.frame
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+# === Shared recognition pool ===
+class RecognitionPool:
+    """
+    Recognition workers shared by several frame sources (lanes). A lane is
+    queued when its grabber delivers a frame and has at most one frame in
+    flight; queued lanes are served first-in first-out, so with N lanes each
+    gets at least 1/N of the workers' time however fast its camera runs.
+    Only the newest frame of a lane is processed (the grabber drops the rest).
+
+    Each lane needs a .grabber and an .fps (FpsCounter). Results of
+    process(lane, frame) are pushed as (lane, result) to one queue. A lane
+    whose grabber is gone (stop_camera sets it to None) is skipped.
+    """
+
+    def __init__(self, process, workers=1, results=None):
+        self.process = process
+        self.results = results if results is not None else queue.Queue()
+        self.condition = threading.Condition()
+        self.ready = deque()      # lanes with a fresh frame, in arrival order
+        self.scheduled = set()    # lanes that are queued or in flight
+        self.fps = FpsCounter()
+        self.running = True
+        self.threads = [threading.Thread(target=self.run, daemon=True, name=f"RecognitionPool-{i}")
+                        for i in range(max(1, workers))]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def frame_ready(self, lane):
+        with self.condition:
+            if lane in self.scheduled or not self.running:
+                return
+            self.scheduled.add(lane)
+            self.ready.append(lane)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.ready or not self.running)
+                if not self.running:
+                    return
+                lane = self.ready.popleft()
+                grabber = lane.grabber
+                if grabber is None:
+                    self.scheduled.discard(lane)
+                    continue
+
+            frame = None
+            try:
+                frame = grabber.wait_for_new_frame(timeout=0)
+                if frame is not None:
+                    with metrics.timer("recognize"):
+                        result = self.process(lane, frame)
+                    lane.fps.tick()
+                    if result is not None and self.running:
+                        self.results.put((lane, result))
+            except Exception as e:
+                print(f"❌ Recognition error: {e}")
+                metrics.incr("recognition_errors")
+
+            with self.condition:
+                if frame is not None:
+                    self.fps.tick()
+                self.scheduled.discard(lane)
+                # A frame that arrived while this one was processed goes to the back of the queue
+                if self.running and grabber.running and grabber.has_new_frame():
+                    self.scheduled.add(lane)
+                    self.ready.append(lane)
+                    self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.ready.clear()
+            self.condition.notify_all()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
@@ -0,0 +1,100 @@
+import copy
+import json
+import os
+
+from capture_rules import LANDMARK_MODEL
+
+# === CONFIGURATION ===
+DEFAULT_PROFILE = "balanced"
+PROFILE_BENCHMARK_FILE = "profile_benchmark.json"  # written by benchmark.py --profiles, read from next to
+                                                   # settings.json and shown in Settings
+
+# detector_model: "hog" (CPU) or "cnn" (needs a CUDA build of dlib to be usable)
+# upsample:       face_locations number_of_times_to_upsample
+# downscale:      the capture-box ROI is shrunk by this before detection
+# landmark_model: "large" (68 points) or "small" (5 points, faster) for face_encodings; only
+#                 LANDMARK_MODEL can be matched against the gallery (see landmark_model)
+# jitters:        face_encodings num_jitters; each jitter is another full encode
+# max_fps:        recognition frames per second per lane, 0 = as fast as the workers go
+PROFILES = {
+    # A face in the box is 140-170 px, so at 0.6 it is still above HOG's
+    # 80 px window without upsampling: about a third of the detection pixels
+    "fast": {"detector_model": "hog", "upsample": 0, "downscale": 0.6,
+             "landmark_model": "small", "jitters": 1, "max_fps": 0},
+    # The kiosk's behaviour before profiles existed
+    "balanced": {"detector_model": "hog", "upsample": 1, "downscale": 0.5,
+                 "landmark_model": "small", "jitters": 1, "max_fps": 0},
+    "accurate": {"detector_model": "hog", "upsample": 1, "downscale": 1.0,
+                 "landmark_model": "small", "jitters": 5, "max_fps": 5},
+}
+
+
+def load_profiles(settings):
+    """
+    The built-in profiles with the overrides from settings.json, e.g.
+    "profiles": {"fast": {"downscale": 0.7}, "night": {"upsample": 2}}.
+    A new name starts from "balanced". The older top-level
+    "detection_downscale" key still sets balanced's downscale.
+    """
+    profiles = copy.deepcopy(PROFILES)
+    if "detection_downscale" in settings:
+        profiles["balanced"]["downscale"] = settings["detection_downscale"]
+    for name, overrides in (settings.get("profiles") or {}).items():
+        profiles.setdefault(name, dict(profiles[DEFAULT_PROFILE])).update(overrides)
+    return profiles
+
+
+def landmark_model(profile, gallery_model=LANDMARK_MODEL):
+    """
+    The landmark model a profile actually encodes with. The gallery was
+    encoded with gallery_model, and distances between encodings from
+    different landmark models are meaningless, so a profile asking for
+    another model is refused and gets gallery_model instead.
+    """
+    return gallery_model
+
+
+def encoder_for(profile, face_encodings, gallery_model=LANDMARK_MODEL):
+    """
+    face_encodings bound to the profile's landmark model (see landmark_model)
+    and jitters, called like face_encodings(image, locations).
+    """
+    model = landmark_model(profile, gallery_model)
+    if profile["landmark_model"] != model:
+        print(f"⚠️ Profile landmark model '{profile['landmark_model']}' does not match the gallery's "
+              f"'{model}', using '{model}'")
+    jitters = profile["jitters"]
+
+    def encode(image, known_face_locations):
+        return face_encodings(image, known_face_locations, num_jitters=jitters, model=model)
+    return encode
+
+
+def load_measurements(path=PROFILE_BENCHMARK_FILE):
+    """
+    Per-profile results of the last benchmark.py --profiles run, or {}.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f).get("profiles", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def describe(name, profile, measured=None):
+    """
+    One line for the Settings dialog: the parameters the profile runs with
+    and, if benchmarked, latency and match rate.
+    """
+    model = landmark_model(profile)
+    refused = f" ('{profile['landmark_model']}' refused)" if profile["landmark_model"] != model else ""
+    text = (f"{name}: {profile['detector_model'].upper()} x{profile['upsample']} @ {profile['downscale']}, "
+            f"{model} landmarks{refused}, {profile['jitters']} jitter"
+            + ("s" if profile["jitters"] != 1 else "")
+            + (f", {profile['max_fps']} fps" if profile["max_fps"] else ""))
+    if measured:
+        text += (f" | p50 {measured['p50_ms']:.0f} ms, match {measured['match_rate'] * 100:.1f}%, "
+                 f"false {measured['false_match_rate'] * 100:.1f}%")
+    return text
@@ -0,0 +1,307 @@
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# === CONFIGURATION ===
+FLUSH_BATCH_SIZE = 100
+FLUSH_WORKERS = 4            # concurrent requests per batch, matches the client's pool size
+FLUSH_IDLE_SECONDS = 5.0     # how often to look for pending punches when idle
+FLUSH_GRACE_SECONDS = 30.0   # leave fresh punches to the live submit before replaying them
+FLUSH_MAX_BACKOFF = 60.0
+FLUSH_MAX_FAILURES = 10      # bad answers (500/501, non-JSON, read timeout) before a punch is given up on
+
+# Punch states
+PENDING = "pending"
+SENT = "sent"
+REJECTED = "rejected"  # the server answered "fail"; replaying would not help
+FAILED = "failed"      # the server kept answering with errors; an operator re-queues it (see requeue_failed)
+RETRY = "retry"        # outcome only: a bad answer, counted towards FLUSH_MAX_FAILURES
+
+
+# === Journal ===
+class PunchJournal:
+    """
+    Append-only record of every login/logout punch, kept in SQLite (WAL mode)
+    next to settings.json. A punch is written before it is sent, so nothing
+    is lost if the server is down or the kiosk restarts.
+
+    `attempts` counts every send; `failures` counts only the sends the
+    server answered badly, which is what the flusher gives up on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS punches (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT UNIQUE NOT NULL,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                source TEXT NOT NULL,
+                punched_at REAL NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                sent_at REAL
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(punches)")}
+        if "failures" not in columns:  # journals written before the failure cap
+            self.conn.execute("ALTER TABLE punches ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS punches_pending ON punches (state, seq)")
+
+    def record(self, user_id, status, source, punched_at=None):
+        """
+        Appends a punch and returns its event_id (the idempotency key).
+        """
+        event_id = uuid.uuid4().hex
+        punched_at = time.time() if punched_at is None else punched_at
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO punches (event_id, user_id, status, source, punched_at) VALUES (?, ?, ?, ?, ?)",
+                (event_id, user_id, status, source, punched_at))
+        return event_id
+
+    def record_many(self, punches):
+        """
+        Appends (user_id, status, source, punched_at) tuples in one transaction.
+        """
+        rows = [(uuid.uuid4().hex, user_id, status, source, punched_at)
+                for user_id, status, source, punched_at in punches]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO punches (event_id, user_id, status, source, punched_at) VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.execute("COMMIT")
+        return [row[0] for row in rows]
+
+    def pending(self, limit=FLUSH_BATCH_SIZE, older_than=None):
+        """
+        Oldest pending punches. Fresh punches (never attempted, younger than
+        older_than) are skipped so the live submit and the flusher don't race.
+        """
+        query = "SELECT event_id, user_id, status, punched_at, failures FROM punches WHERE state = ?"
+        args = [PENDING]
+        if older_than is not None:
+            query += " AND (attempts > 0 OR punched_at <= ?)"
+            args.append(older_than)
+        query += " ORDER BY seq LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            return self.conn.execute(query, args).fetchall()
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM punches WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def failed(self):
+        """
+        Punches the flusher gave up on, oldest first.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT event_id, user_id, status, punched_at, failures, last_error FROM punches "
+                "WHERE state = ? ORDER BY seq", (FAILED,)).fetchall()
+
+    def requeue_failed(self, event_ids=None):
+        """
+        Puts FAILED punches (all, or just event_ids) back to PENDING with a
+        fresh failure count, once whatever the server choked on is fixed.
+        Returns how many were re-queued.
+        """
+        query = "UPDATE punches SET state = ?, failures = 0, sent_at = NULL WHERE state = ?"
+        args = [PENDING, FAILED]
+        if event_ids is not None:
+            event_ids = list(event_ids)
+            if not event_ids:
+                return 0
+            query += f" AND event_id IN ({', '.join('?' * len(event_ids))})"
+            args.extend(event_ids)
+        with self.lock:
+            return self.conn.execute(query, args).rowcount
+
+    def mark(self, outcomes):
+        """
+        Applies (event_id, state, error) outcomes in one transaction. RETRY
+        keeps the punch pending and counts a failure against it.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            for event_id, state, error in outcomes:
+                if state == RETRY:
+                    self.conn.execute(
+                        "UPDATE punches SET attempts = attempts + 1, failures = failures + 1, last_error = ? "
+                        "WHERE event_id = ?", (error, event_id))
+                elif state == PENDING:
+                    self.conn.execute(
+                        "UPDATE punches SET attempts = attempts + 1, last_error = ? WHERE event_id = ?",
+                        (error, event_id))
+                else:
+                    self.conn.execute(
+                        "UPDATE punches SET state = ?, attempts = attempts + 1, failures = failures + ?, "
+                        "last_error = ?, sent_at = ? WHERE event_id = ?",
+                        (state, int(state == FAILED), error, now, event_id))
+            self.conn.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# === Background flusher ===
+class JournalFlusher(threading.Thread):
+    """
+    Drains pending punches to the server in batches once it is reachable.
+    Every replay carries the punch's event_id and original time, so the
+    server can drop duplicates. Backs off exponentially while the server is
+    down instead of hammering it.
+
+    An unreachable server, including a 502/503/504 from a proxy in front of
+    it, is retried for as long as it takes. A server that answers, but with
+    another 5xx, a non-JSON body or not at all within the read timeout, is
+    retried FLUSH_MAX_FAILURES times; then the punch is marked FAILED so one
+    poisoned punch isn't replayed forever. FAILED punches wait for an
+    operator: python punch_journal.py --journal punch_journal.db --requeue-failed
+    """
+
+    def __init__(self, journal, client, batch_size=FLUSH_BATCH_SIZE, grace=FLUSH_GRACE_SECONDS,
+                 max_failures=FLUSH_MAX_FAILURES):
+        super().__init__(daemon=True, name="JournalFlusher")
+        self.journal = journal
+        self.client = client
+        self.batch_size = batch_size
+        self.grace = grace
+        self.max_failures = max_failures
+        self.wake_event = threading.Event()
+        self.running = True
+        self.backoff = 0.0
+        self.sent = 0
+        self.rejected = 0
+        self.failed = 0
+        self.pool = ThreadPoolExecutor(max_workers=FLUSH_WORKERS, thread_name_prefix="flush")
+
+    def wake(self):
+        self.wake_event.set()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+
+    def run(self):
+        while self.running:
+            try:
+                drained_all = self.flush_once()
+            except Exception as e:
+                print(f"❌ Punch journal flush error: {e}")
+                drained_all = True
+            if drained_all:
+                self.wake_event.wait(self.backoff or FLUSH_IDLE_SECONDS)
+                self.wake_event.clear()
+
+    def flush_once(self):
+        """
+        Sends one batch. Returns True when there is nothing more to do right now.
+        """
+        batch = self.journal.pending(self.batch_size, older_than=time.time() - self.grace)
+        if not batch:
+            return True
+
+        outcomes = list(self.pool.map(self.send_one, batch))
+        self.journal.mark(outcomes)
+
+        offline = any(state in (PENDING, RETRY) for _, state, _ in outcomes)
+        self.sent += sum(1 for _, state, _ in outcomes if state == SENT)
+        self.rejected += sum(1 for _, state, _ in outcomes if state == REJECTED)
+        for event_id, state, error in outcomes:
+            if state == FAILED:
+                self.failed += 1
+                print(f"❌ Gave up on punch {event_id} after {self.max_failures} bad answers: {error} "
+                      f"(re-queue with punch_journal.py --requeue-failed)")
+        if offline:
+            self.backoff = min(FLUSH_MAX_BACKOFF, max(1.0, self.backoff * 2))
+            return True
+        self.backoff = 0.0
+        return len(batch) < self.batch_size
+
+    def send_one(self, punch):
+        event_id, user_id, status, punched_at, failures = punch
+        try:
+            data = self.client.request(user_id, status, event_id=event_id, punched_at=punched_at)
+        except Exception as e:
+            if self.client.unreachable(e):  # not reached: wait for it however long it takes
+                return event_id, PENDING, str(e)
+            return self.bad_answer(event_id, failures, str(e))
+        if not isinstance(data, dict):
+            return self.bad_answer(event_id, failures, f"unexpected response {str(data)[:200]}")
+        if data.get("success") == "fail":
+            return event_id, REJECTED, data.get("message", "Unknown error")
+        return event_id, SENT, None
+
+    def bad_answer(self, event_id, failures, error):
+        if failures + 1 >= self.max_failures:
+            return event_id, FAILED, error
+        return event_id, RETRY, error
+
+
+# === MAIN (drain throughput benchmark, failed punch maintenance) ===
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+    import tempfile
+    from attendance import AttendanceClient
+    from timeclock_stub import start_stub_server
+
+    parser = argparse.ArgumentParser(description="Measure how fast a backlog of offline punches drains, or "
+                                                 "list and re-queue the punches a kiosk gave up on.")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=FLUSH_BATCH_SIZE)
+    parser.add_argument("--server-url", default=None, help="drain to this server instead of a local stub")
+    parser.add_argument("--journal", help="a kiosk's punch_journal.db, for --list-failed / --requeue-failed")
+    parser.add_argument("--list-failed", action="store_true", help="show the punches marked failed")
+    parser.add_argument("--requeue-failed", nargs="*", metavar="EVENT_ID",
+                        help="put failed punches (all, or these) back in the queue; the kiosk resends them")
+    args = parser.parse_args()
+
+    if args.list_failed or args.requeue_failed is not None:
+        if not args.journal:
+            parser.error("--list-failed and --requeue-failed need --journal")
+        journal = PunchJournal(args.journal)
+        if args.list_failed:
+            for event_id, user_id, status, punched_at, failures, last_error in journal.failed():
+                print(f"{event_id} {user_id} {status} "
+                      f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(punched_at))} "
+                      f"after {failures} bad answers: {last_error}")
+        if args.requeue_failed is not None:
+            count = journal.requeue_failed(args.requeue_failed or None)
+            print(f"✅ Re-queued {count} failed punches")
+        journal.close()
+        sys.exit(0)
+
+    server_url = args.server_url
+    if server_url is None:
+        server, server_url = start_stub_server()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = PunchJournal(os.path.join(tmp, "punch_journal.db"))
+        now = time.time()
+        journal.record_many((f"user{i % 500}", "login" if i % 2 == 0 else "logout", "bench", now - 3600)
+                            for i in range(args.events))
+
+        flusher = JournalFlusher(journal, AttendanceClient(server_url), batch_size=args.batch, grace=0)
+        start = time.perf_counter()
+        while journal.pending_count() and not flusher.backoff:
+            flusher.flush_once()
+        elapsed = time.perf_counter() - start
+
+        print(f"drained {flusher.sent} sent / {flusher.rejected} rejected / {flusher.failed} failed of {args.events} "
+              f"in {elapsed:.2f}s ({flusher.sent / elapsed:.0f} events/s), {journal.pending_count()} left")
+        journal.close()
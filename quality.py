@@ -0,0 +1,178 @@
+import math
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+# === CONFIGURATION ===
+# Defaults for the quality gate; settings.json can override each one (see
+# QualityGate.from_settings). Pixel checks run on the face crop resized to
+# PATCH_SIZE, so the numbers do not depend on how close the person stands.
+PATCH_SIZE = 96
+MIN_SHARPNESS = 40.0     # variance of the Laplacian; motion blur and defocus drive it towards 0
+MIN_BRIGHTNESS = 50.0    # mean grey level of the face, 0-255
+MAX_BRIGHTNESS = 210.0
+MAX_CLIPPED = 0.25       # fraction of face pixels crushed to black or blown to white
+MAX_YAW = 25.0           # degrees, estimated from the nose tip against the eyes
+MAX_ROLL = 20.0          # degrees, from the line through the eye centres
+MIN_EYE_OPEN = 0.18      # eye aspect ratio; a blink drops it to about 0.1
+REGISTRATION_BURST = 12  # frames that pass the gate before registration keeps the best K
+
+# What the kiosk tells the person when a check fails
+REASON_PROMPTS = {
+    "blurry": "Hold still",
+    "too dark": "Too dark - face the light",
+    "too bright": "Too bright - step out of direct light",
+    "uneven light": "Uneven lighting",
+    "head tilted": "Keep your head straight",
+    "look at the camera": "Look straight at the camera",
+    "eyes closed": "Keep your eyes open",
+    "no landmarks": "Look straight at the camera",
+    "no face": "Move your face inside the box",
+}
+
+
+class QualityScore:
+    __slots__ = ("sharpness", "brightness", "clipped", "yaw", "roll", "eye_open", "reason", "score")
+
+    def __init__(self, sharpness, brightness, clipped):
+        self.sharpness = sharpness
+        self.brightness = brightness
+        self.clipped = clipped
+        self.yaw = None       # pose fields stay None when no landmarks were used
+        self.roll = None
+        self.eye_open = None
+        self.reason = None    # first check that failed, or None
+        self.score = 0.0      # ranking for best-K selection, higher is better
+
+    @property
+    def ok(self):
+        return self.reason is None
+
+    def text(self):
+        """
+        One line for the status overlay.
+        """
+        parts = [f"sharp {self.sharpness:.0f}", f"light {self.brightness:.0f}"]
+        if self.yaw is not None:
+            parts.append(f"yaw {self.yaw:.0f}")
+            parts.append(f"roll {self.roll:.0f}")
+            parts.append(f"eyes {self.eye_open:.2f}")
+        return "Q " + " ".join(parts) + (f" - {self.reason}" if self.reason else " ok")
+
+
+# === Quality gate ===
+class QualityGate:
+    """
+    Cheap checks that decide whether a face is worth a 128-d encoding.
+
+    Sharpness (variance of the Laplacian) and exposure (mean level and
+    clipped pixels) are computed from a small grey patch in well under a
+    millisecond. When a landmarks function is given (face_recognition's
+    face_landmarks; the 68-point predictor costs a fraction of an encode),
+    pose is checked too: roll from the eye line, yaw from where the nose tip
+    falls between the eyes, and blinks from the eye aspect ratio. The checks
+    run in that order and stop at the first failure, so a blurry frame never
+    pays for landmarks.
+    """
+
+    def __init__(self, landmarks=None, min_sharpness=MIN_SHARPNESS, min_brightness=MIN_BRIGHTNESS,
+                 max_brightness=MAX_BRIGHTNESS, max_clipped=MAX_CLIPPED, max_yaw=MAX_YAW, max_roll=MAX_ROLL,
+                 min_eye_open=MIN_EYE_OPEN):
+        self.landmarks = landmarks
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.min_eye_open = min_eye_open
+
+    @classmethod
+    def from_settings(cls, settings, landmarks=None):
+        """
+        Reads the "quality" section of settings.json, e.g.
+        "quality": {"min_sharpness": 60, "max_yaw": 20}. Missing keys keep
+        the defaults above.
+        """
+        overrides = settings.get("quality") or {}
+        options = {name: float(overrides[name]) for name in
+                   ("min_sharpness", "min_brightness", "max_brightness", "max_clipped",
+                    "max_yaw", "max_roll", "min_eye_open") if name in overrides}
+        return cls(landmarks, **options)
+
+    def assess(self, frame, face, rgb_frame=None):
+        """
+        Scores the (top, right, bottom, left) face in a BGR frame. Pose is
+        only checked when rgb_frame is given and a landmarks function is set.
+        """
+        with metrics.timer("quality"):
+            score = self._assess(frame, face, rgb_frame)
+        if not score.ok:
+            metrics.incr("quality_rejects")
+        return score
+
+    def _assess(self, frame, face, rgb_frame):
+        top, right, bottom, left = face
+        crop = frame[max(0, top):bottom, max(0, left):right]
+        if crop.size == 0:
+            score = QualityScore(0.0, 0.0, 1.0)
+            score.reason = "no face"
+            return score
+        gray = cv2.cvtColor(cv2.resize(crop, (PATCH_SIZE, PATCH_SIZE), interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        brightness = float(gray.mean())
+        clipped = float(np.count_nonzero((gray < 10) | (gray > 245))) / gray.size
+        score = QualityScore(sharpness, brightness, clipped)
+
+        if sharpness < self.min_sharpness:
+            score.reason = "blurry"
+        elif brightness < self.min_brightness:
+            score.reason = "too dark"
+        elif brightness > self.max_brightness:
+            score.reason = "too bright"
+        elif clipped > self.max_clipped:
+            score.reason = "uneven light"
+        elif self.landmarks is not None and rgb_frame is not None:
+            self._assess_pose(score, rgb_frame, face)
+        if score.ok:
+            score.score = sharpness * math.cos(math.radians(score.yaw or 0.0)) * math.cos(math.radians(score.roll or 0.0))
+        return score
+
+    def _assess_pose(self, score, rgb_frame, face):
+        found = self.landmarks(rgb_frame, [face])
+        if not found:
+            score.reason = "no landmarks"
+            return
+        points = found[0]
+        left_eye = np.asarray(points["left_eye"], dtype=np.float32)
+        right_eye = np.asarray(points["right_eye"], dtype=np.float32)
+        nose_tip = np.asarray(points["nose_tip"], dtype=np.float32).mean(axis=0)
+        left_centre, right_centre = left_eye.mean(axis=0), right_eye.mean(axis=0)
+
+        dx, dy = right_centre - left_centre
+        eye_distance = math.hypot(dx, dy) or 1.0
+        score.roll = math.degrees(math.atan2(dy, dx))
+        # Offset of the nose tip from the eye midpoint, along the eye line,
+        # as a fraction of the eye distance; about +-0.5 at a 90-degree turn
+        offset = float(np.dot(nose_tip - (left_centre + right_centre) / 2, (dx, dy))) / (eye_distance ** 2)
+        score.yaw = math.degrees(math.asin(max(-1.0, min(1.0, 2 * offset))))
+        score.eye_open = min(eye_aspect_ratio(left_eye), eye_aspect_ratio(right_eye))
+
+        if abs(score.roll) > self.max_roll:
+            score.reason = "head tilted"
+        elif abs(score.yaw) > self.max_yaw:
+            score.reason = "look at the camera"
+        elif score.eye_open < self.min_eye_open:
+            score.reason = "eyes closed"
+
+
+def eye_aspect_ratio(eye):
+    """
+    Height over width of a 6-point eye outline (68-point landmark layout).
+    """
+    vertical = np.linalg.norm(eye[1] - eye[5]) + np.linalg.norm(eye[2] - eye[4])
+    horizontal = np.linalg.norm(eye[0] - eye[3]) or 1.0
+    return float(vertical / (2 * horizontal))
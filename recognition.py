@@ -0,0 +1,428 @@
+import time
+
+import cv2
+
+from capture_rules import CAPTURE_FRAMES, RECOGNITION_TOLERANCE, crowd_face_status, face_in_box, face_size_status
+from identity_cache import PunchDebouncer
+from metrics import metrics
+from quality import REASON_PROMPTS, REGISTRATION_BURST
+
+# === CONFIGURATION ===
+WARMUP_SECONDS = 2.0          # recognition starts this long after a lane (re)starts
+IDLE_STATUS = "Standby - step into the box"
+CROWD_REPEAT_SECONDS = 60     # crowd lanes never punch the same person twice within this
+CROWD_PROMPTS = {"too_small": "Come closer", "too_large": "Step back"}
+
+
+class Stage:
+    """
+    Times one stage of a frame into a per-frame timings dict (seconds,
+    summed if the stage runs more than once) and the metrics registry.
+    """
+    __slots__ = ("timings", "name", "observe", "start")
+
+    def __init__(self, timings, name, observe=True):
+        self.timings = timings
+        self.name = name
+        self.observe = observe
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        if self.observe:
+            metrics.observe(self.name, elapsed)
+        return False
+
+
+# === Recognizer ===
+class Recognizer:
+    """
+    The per-frame recognition path: detection in the capture box, position
+    and distance gating, encoding, gallery matching and the punch call.
+    Shared by the kiosk's recognition pool and replay.py, so an offline run
+    exercises exactly the code the kiosk does.
+
+    encode is face_recognition.face_encodings (None on a thin kiosk, where
+    remote is the RecognitionClient that does all of it). submit_punch(user_id,
+    status, source) returns (event_id, future); replay.py passes a stub.
+
+    With a quality gate (quality.QualityGate), a face is only encoded once
+    it passes the cheap sharpness/exposure/pose checks, and registration
+    collects `burst` good frames and keeps the capture_frames best of them.
+
+    recent (identity_cache.RecentIdentities) is checked before the full
+    gallery; debouncer (identity_cache.PunchDebouncer) turns a repeat of the
+    same punch within its window into a "duplicate" event that is not sent.
+
+    max_fps caps how many frames per second of each lane are recognized
+    (0 = every frame the pool hands over); see profiles.py.
+
+    Crowd lanes (lane.crowd) go through process_crowd_frame instead, which
+    handles every face in the frame together.
+    """
+
+    def __init__(self, matcher, submit_punch, encode=None, remote=None, tolerance=RECOGNITION_TOLERANCE,
+                 capture_frames=CAPTURE_FRAMES, warmup=WARMUP_SECONDS, quality=None, burst=REGISTRATION_BURST,
+                 recent=None, debouncer=None, max_fps=0):
+        self.matcher = matcher
+        self.submit_punch = submit_punch
+        self.encode = encode
+        self.remote = remote
+        self.tolerance = tolerance
+        self.capture_frames = capture_frames
+        self.warmup = warmup
+        self.quality = quality
+        self.recent = recent if remote is None else None  # the server holds the templates on a thin kiosk
+        self.debouncer = debouncer
+        self.max_fps = max_fps
+        # Crowd lanes punch without ending the attempt, so they always need a debouncer
+        self.crowd_debouncer = debouncer if debouncer is not None else PunchDebouncer(CROWD_REPEAT_SECONDS)
+        # Without a gate there is nothing to rank by, so keep the first frames as before
+        self.burst = max(burst, capture_frames) if quality is not None else capture_frames
+
+    def check_quality(self, frame, rgb_frame, face, result):
+        """
+        Runs the quality gate on a face and reports the scores in the result.
+        Returns the QualityScore, or None when there is no gate.
+        """
+        if self.quality is None:
+            return None
+        with Stage(result["timings"], "quality", observe=False):  # the gate records its own latency
+            score = self.quality.assess(frame, face, rgb_frame)
+        result["quality"] = score.text()
+        return score
+
+    def add_candidate(self, lane, score, encoding, rgb_frame, face):
+        """
+        Keeps a registration frame. Locally the encoding is deferred until the
+        burst is complete, so only the best frames are ever encoded; a crop
+        around the face is kept instead of the whole frame.
+        """
+        rank = score.score if score is not None else 0.0
+        if encoding is not None:
+            lane.capture_buffer.append((rank, encoding))
+            return
+        top, right, bottom, left = face
+        margin = (bottom - top) // 2
+        y0, x0 = max(0, top - margin), max(0, left - margin)
+        crop = rgb_frame[y0:bottom + margin, x0:right + margin].copy()
+        lane.capture_buffer.append((rank, (crop, (top - y0, right - x0, bottom - y0, left - x0))))
+
+    def best_templates(self, candidates, timings):
+        """
+        The capture_frames best candidates, best first (template 0 is the one
+        every login must match), encoded where that was deferred.
+        """
+        best = sorted(candidates, key=lambda candidate: candidate[0], reverse=True)[:self.capture_frames]
+        templates = []
+        for _, payload in best:
+            if isinstance(payload, tuple):
+                crop, face = payload
+                with Stage(timings, "encode"):
+                    payload = self.encode(crop, [face])[0]
+            templates.append(payload)
+        return templates
+
+    def identify_track(self, rgb_frame, track, timings=None):
+        """
+        Returns the matched user for a tracked face. The 128-d encoding is only
+        recomputed when the track is new, has drifted or is due for
+        re-verification; the match is only redone when the gallery changed.
+        """
+        if track.needs_encoding():
+            with Stage(timings, "encode"):
+                track.set_encoding(self.encode(rgb_frame, [track.box])[0])
+        version = self.matcher.version
+        if track.identity_version != version:
+            with Stage(timings, "match"):
+                track.identity = self.match(track.encoding, version)
+            track.identity_version = version
+            metrics.incr("matches" if track.identity is not None else "no_match")
+        return track.identity
+
+    def match(self, encoding, version):
+        """
+        Checks the people seen in the last few minutes first and only then
+        the whole gallery; a full-gallery match is remembered for next time.
+        """
+        if self.recent is not None:
+            user_id = self.recent.match(encoding, self.tolerance, version)
+            if user_id is not None:
+                return user_id
+        user_id = self.matcher.match(encoding, self.tolerance)
+        if user_id is not None and self.recent is not None:
+            self.recent.remember(user_id, self.matcher.user_templates.get(user_id), version)
+        return user_id
+
+    def match_many(self, encodings, version):
+        """
+        match() for several encodings: the recent cache per encoding, then
+        one batched gallery search for the rest.
+        """
+        user_ids = [None] * len(encodings)
+        missing = []
+        for position, encoding in enumerate(encodings):
+            if self.recent is not None:
+                user_ids[position] = self.recent.match(encoding, self.tolerance, version)
+            if user_ids[position] is None:
+                missing.append(position)
+        if missing:
+            found = self.matcher.match_many([encodings[position] for position in missing], self.tolerance)
+            for position, (user_id, _) in zip(missing, found):
+                user_ids[position] = user_id
+                if user_id is not None and self.recent is not None:
+                    self.recent.remember(user_id, self.matcher.user_templates.get(user_id), version)
+        return user_ids
+
+    def punch_event(self, user_id, status, debouncer):
+        """
+        Sends a face punch without blocking and returns its event, or a
+        "duplicate" event if the debouncer has seen the same punch recently.
+        """
+        if debouncer is not None and not debouncer.claim(user_id, status):
+            return {"kind": "duplicate", "status": status, "user_id": user_id}
+        event_id, future = self.submit_punch(user_id, status, "face")
+        return {"kind": "punch", "status": status, "user_id": user_id, "event_id": event_id, "future": future}
+
+    def punch(self, lane, user_id, status, result):
+        """
+        Sends a face punch without blocking (the UI picks up the answer), or
+        reports a duplicate if the debouncer has seen the same punch recently.
+        """
+        lane.recognition_done = True
+        result["event"] = self.punch_event(user_id, status, self.debouncer)
+        if result["event"]["kind"] == "duplicate":
+            result["status_text"] = f"Already {'logged in' if status == 'login' else 'logged out'}: {user_id}"
+        else:
+            result["status_text"] = f"Submitting {status}..."
+        return result
+
+    def worth_identifying(self, frame, rgb_frame, face, track, result):
+        """
+        Quality gate for login/logout. A track whose encoding is still valid
+        is not re-checked, since nothing would be encoded for it anyway.
+        """
+        if track is not None and not track.needs_encoding():
+            return True
+        score = self.check_quality(frame, rgb_frame, face, result)
+        if score is not None and not score.ok:
+            result["status_text"] = REASON_PROMPTS[score.reason]
+            return False
+        return True
+
+    def recognize_frame(self, lane, frame):
+        """
+        Runs detection, encoding and matching on one frame of a lane. This is
+        called on a recognition pool thread (never two at once for the same
+        lane), so it never touches Tk: everything the UI needs is returned in
+        the result dict, along with the seconds spent in each stage.
+        """
+        if lane.recognition_done:
+            return None
+        elapsed = time.time() - lane.start_time
+        if elapsed < self.warmup:  # start detecting after the warm-up
+            return None
+        if self.max_fps:
+            now = time.time()
+            if now < lane.next_recognition:
+                return None
+            lane.next_recognition = now + 1.0 / self.max_fps
+        # An always-on lane sleeps until something moves in its capture box
+        if lane.motion is not None and not lane.motion.should_process(frame):
+            return None
+
+        if lane.crowd and lane.mode != "register":
+            result = self.process_crowd_frame(lane, frame)
+        else:
+            result = self.process_frame(lane, frame)
+        if lane.motion is not None and lane.motion.after_frame(bool(result["faces"])):
+            metrics.incr("idle_entries")
+            result["status_text"] = IDLE_STATUS
+        return result
+
+    def process_crowd_frame(self, lane, frame):
+        """
+        Crowd lanes: every face in the wide zone is handled in the same
+        frame instead of one face in the guide box. Faces whose tracks need
+        an encoding are encoded with one face_encodings call, encodings not
+        matched yet go through one batched gallery search, and every newly
+        identified person is punched straight away (the punches run
+        concurrently on the attendance client's pool). The attempt never
+        ends; each track is punched at most once.
+
+        The result also carries "events" (punch and duplicate events) and
+        "labels", a (text, user_id or None) pair per face.
+        """
+        timings = {}
+        result = {"faces": [], "status_text": None, "messages": [], "event": None, "quality": None,
+                  "timings": timings, "events": [], "labels": []}
+        rgb_frame = None
+        remote_ids = None
+        if self.remote is not None:
+            try:
+                with Stage(timings, "remote", observe=False):
+                    remote_faces = self.remote.recognize(frame, lane.capture_box)
+            except Exception:
+                result["status_text"] = "Recognition server unreachable"
+                return result
+            faces = [face["box"] for face in remote_faces]
+            remote_ids = [face["user_id"] for face in remote_faces]
+        else:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            with Stage(timings, "detect"):
+                faces = lane.detector.detect(rgb_frame)
+        tracks = lane.tracker.update(faces)
+        result["faces"] = faces
+        metrics.incr("faces_detected", len(faces))
+
+        labels = [("", None)] * len(faces)
+        ready = []      # positions of faces that can be identified this frame
+        to_encode = []  # their tracks that need a fresh encoding
+        for position, (face, track) in enumerate(zip(faces, tracks)):
+            placement = crowd_face_status(face, lane.capture_box)
+            if placement != "ok":
+                labels[position] = (CROWD_PROMPTS.get(placement, ""), None)
+                continue
+            if remote_ids is None and track.needs_encoding():
+                score = self.check_quality(frame, rgb_frame, face, result)
+                if score is not None and not score.ok:
+                    labels[position] = (REASON_PROMPTS[score.reason], None)
+                    continue
+                to_encode.append(track)
+            ready.append(position)
+
+        if to_encode:
+            with Stage(timings, "encode"):
+                encodings = self.encode(rgb_frame, [track.box for track in to_encode])
+            for track, encoding in zip(to_encode, encodings):
+                track.set_encoding(encoding)
+
+        if remote_ids is not None:
+            for position in ready:
+                tracks[position].identity = remote_ids[position]
+        else:
+            version = self.matcher.version
+            stale = [tracks[position] for position in ready if tracks[position].identity_version != version]
+            if stale:
+                with Stage(timings, "match"):
+                    user_ids = self.match_many([track.encoding for track in stale], version)
+                for track, user_id in zip(stale, user_ids):
+                    track.identity = user_id
+                    track.identity_version = version
+                    metrics.incr("matches" if user_id is not None else "no_match")
+
+        identified = 0
+        for position in ready:
+            track = tracks[position]
+            if track.identity is None:
+                labels[position] = ("Not recognized", None)
+                continue
+            identified += 1
+            labels[position] = (track.identity, track.identity)
+            if not track.punched:
+                track.punched = True
+                result["events"].append(self.punch_event(track.identity, lane.mode, self.crowd_debouncer))
+        result["labels"] = labels
+        result["status_text"] = f"{len(ready)} in zone, {identified} identified" if faces else ""
+        return result
+
+    def process_frame(self, lane, frame):
+        """
+        The full detection/recognition path for one frame (see recognize_frame).
+        """
+        timings = {}
+        result = {"faces": [], "status_text": None, "messages": [], "event": None, "quality": None,
+                  "timings": timings}
+        rgb_frame = None
+        if self.remote is not None:
+            # Thin kiosk: the recognition server detects, encodes and matches
+            try:
+                with Stage(timings, "remote", observe=False):  # the client records its own latency
+                    remote_faces = self.remote.recognize(frame, lane.capture_box,
+                                                         include_encodings=lane.mode == "register")
+            except Exception:
+                result["status_text"] = "Recognition server unreachable"
+                return result
+            faces = [face["box"] for face in remote_faces]
+            encodings = [face.get("encoding") for face in remote_faces]
+            identities = [face["user_id"] for face in remote_faces]
+            tracks = [None] * len(faces)
+        else:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Detection is limited to the capture box
+            with Stage(timings, "detect"):
+                faces = lane.detector.detect(rgb_frame)
+            identities = [None] * len(faces)
+
+            # Registration encodes only its best frames (see best_templates);
+            # login/logout encode lazily, once per track (see identify_track)
+            encodings = [None] * len(faces)
+            tracks = [None] * len(faces) if lane.mode == "register" else lane.tracker.update(faces)
+        result["faces"] = faces
+        metrics.incr("faces_detected", len(faces))
+
+        # Register prompts are numbered steps; the same box and size rules as enroll.py
+        step = "Step {}: " if lane.mode == "register" else ""
+        for face, encoding, track, identity in zip(faces, encodings, tracks, identities):
+            # --- CAPTURE ZONE CHECK ---
+            if not face_in_box(face, lane.capture_box):
+                result["status_text"] = step.format(1) + "Move your face inside the box"
+                continue  # Skip processing until face is inside zone
+            # --- DISTANCE CHECK ---
+            size = face_size_status(face, lane.capture_box)
+            if size != "ok":
+                prompt = "Move closer to the camera" if size == "too_small" else "Move back from the camera"
+                result["status_text"] = step.format(2) + prompt
+                result["messages"].append(prompt)
+                continue
+
+            if lane.mode == "register":
+                # Step 3: Skip blurry, badly lit or turned-away frames
+                score = self.check_quality(frame, rgb_frame, face, result)
+                if score is not None and not score.ok:
+                    result["status_text"] = f"Step 3: {REASON_PROMPTS[score.reason]}"
+                    break
+
+                # Step 4: Capture frame
+                if len(lane.capture_buffer) < self.burst:
+                    self.add_candidate(lane, score, encoding, rgb_frame, face)
+                    frames_captured = len(lane.capture_buffer)
+                    result["status_text"] = f"Step 4: Capturing face... Frame {frames_captured}/{self.burst}"
+                    result["messages"].append(f"Captured frame {frames_captured}/{self.burst}")
+
+                # Step 5: Hand the best templates to the UI once the burst is complete
+                if len(lane.capture_buffer) >= self.burst:
+                    result["event"] = {"kind": "register", "user_id": lane.user_id,
+                                       "templates": self.best_templates(lane.capture_buffer, timings)}
+                    lane.capture_buffer.clear()
+                    lane.recognition_done = True
+                    return result
+                break  # one capture per frame, from the first face that passes
+
+            # Login
+            elif lane.mode == "login" and not lane.logged_in:
+                if not self.worth_identifying(frame, rgb_frame, face, track, result):
+                    continue
+                name = identity if self.remote is not None else self.identify_track(rgb_frame, track, timings)
+                if name is not None:
+                    return self.punch(lane, name, "login", result)
+                result["status_text"] = "Face not recognized"
+                result["messages"].append("⚠️ Face detected but not recognized.")
+
+            # === Logout ===
+            elif lane.mode == "logout" and not lane.logged_out:
+                # We don't use self.logged_in_user anymore
+                if not self.worth_identifying(frame, rgb_frame, face, track, result):
+                    continue
+                name = identity if self.remote is not None else self.identify_track(rgb_frame, track, timings)
+                if name is not None:
+                    return self.punch(lane, name, "logout", result)
+                result["status_text"] = "Face does not match registered user"
+                result["messages"].append("⚠️ Face detected but does not match any registered user.")
+
+        return result
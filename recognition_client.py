@@ -0,0 +1,102 @@
+import time
+
+import cv2
+import numpy as np
+import requests
+
+from capture_rules import capture_roi
+from metrics import metrics
+
+# === CONFIGURATION ===
+TOKEN_HEADER = "X-Recognition-Token"  # same as recognition_server.TOKEN_HEADER
+DEFAULT_CONNECT_TIMEOUT = 2.0
+DEFAULT_READ_TIMEOUT = 5.0
+JPEG_QUALITY = 90
+
+
+# === Recognition client ===
+class RecognitionClient:
+    """
+    Kiosk side of recognition_server.py. Only the capture-box region of a
+    frame is sent (as JPEG), so a thin kiosk needs OpenCV for the camera but
+    no dlib models. Uses one keep-alive requests.Session like AttendanceClient.
+    token is the server's shared secret, needed for enroll() and delete().
+    """
+
+    def __init__(self, base_url, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, jpeg_quality=JPEG_QUALITY, token=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.jpeg_quality = jpeg_quality
+        self.session = requests.Session()
+        if token:
+            self.session.headers[TOKEN_HEADER] = token
+
+    def recognize(self, frame, box, include_encodings=False):
+        """
+        Returns the faces found in the capture-box region of a BGR frame as
+        dicts with "box" (top, right, bottom, left) in full-frame pixels,
+        "user_id" (None if unknown) and "distance". Raises on transport errors.
+        """
+        x1, y1, x2, y2 = capture_roi(frame.shape, box)
+        ok, jpeg = cv2.imencode(".jpg", frame[y1:y2, x1:x2], [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Could not encode frame as JPEG")
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.base_url}/recognize", data=jpeg.tobytes(),
+                                         params={"encodings": 1} if include_encodings else None,
+                                         headers={"Content-Type": "image/jpeg"}, timeout=self.timeout)
+            response.raise_for_status()
+            faces = response.json()["faces"]
+        except Exception:
+            metrics.incr("remote_errors")
+            raise
+        finally:
+            metrics.observe("remote", time.perf_counter() - start)
+
+        for face in faces:
+            top, right, bottom, left = face["box"]
+            face["box"] = (top + y1, right + x1, bottom + y1, left + x1)
+            if "encoding" in face:
+                face["encoding"] = np.array(face["encoding"])
+        return faces
+
+    def users(self):
+        response = self.session.get(f"{self.base_url}/users", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["users"]
+
+    def enroll(self, user_id, templates):
+        payload = {"user_id": user_id, "templates": np.asarray(templates).reshape(-1, 128).tolist()}
+        response = self.session.post(f"{self.base_url}/enroll", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+    def delete(self, user_id):
+        response = self.session.post(f"{self.base_url}/delete", json={"user_id": user_id}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("success", False)
+
+    def close(self):
+        self.session.close()
+
+
+class RemoteGallery:
+    """
+    Stands in for GalleryMatcher on a thin kiosk: registrations and deletions
+    go to the recognition server, which holds the only copy of the gallery.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.version = 0
+
+    def set_user(self, user_id, user_templates):
+        self.client.enroll(user_id, user_templates)
+        self.version += 1
+
+    def remove_user(self, user_id):
+        removed = self.client.delete(user_id)
+        self.version += 1
+        return removed
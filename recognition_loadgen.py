@@ -0,0 +1,149 @@
+"""
+Load generator for recognition_server.py.
+
+    python recognition_loadgen.py --url http://127.0.0.1:8100 --images frames/ --concurrency 16 --duration 30
+    python recognition_loadgen.py --self-test --users 10000 --concurrency 16
+
+Each client thread posts JPEGs back to back over its own keep-alive session
+and records the round-trip time. Reports requests/sec, p50/p95/p99 latency,
+errors and the server's mean batch size. --self-test starts an in-process
+server over a synthetic gallery and posts synthetic face crops to /identify,
+which exercises the batched encode + match path without real photos.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import cv2
+import requests
+
+
+# === Inputs ===
+def load_images(images_dir, count=16, seed=0):
+    if images_dir:
+        payloads = []
+        for name in sorted(os.listdir(images_dir)):
+            path = os.path.join(images_dir, name)
+            if name.lower().endswith((".jpg", ".jpeg")):
+                with open(path, "rb") as f:
+                    payloads.append(f.read())
+            elif name.lower().endswith((".png", ".bmp")):
+                image = cv2.imread(path)
+                if image is not None:
+                    payloads.append(cv2.imencode(".jpg", image)[1].tobytes())
+        if not payloads:
+            raise SystemExit(f"No readable images in {images_dir}")
+        return payloads
+    rng = np.random.default_rng(seed)
+    return [cv2.imencode(".jpg", rng.integers(0, 255, (150, 150, 3), dtype=np.uint8))[1].tobytes()
+            for _ in range(count)]
+
+
+# === Load ===
+def server_counters(url):
+    try:
+        return requests.get(f"{url}/stats", timeout=5).json().get("counters", {})
+    except Exception:
+        return {}
+
+
+def run_load(url, payloads, endpoint="/recognize", concurrency=8, duration=10.0):
+    before = server_counters(url)
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def client(slot):
+        session = requests.Session()
+        sent = slot
+        while time.perf_counter() < deadline:
+            body = payloads[sent % len(payloads)]
+            sent += concurrency
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{url}{endpoint}", data=body,
+                                        headers={"Content-Type": "image/jpeg"}, timeout=30)
+                response.raise_for_status()
+                response.json()
+            except Exception:
+                errors[slot] += 1
+                continue
+            latencies[slot].append(time.perf_counter() - start)
+        session.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(slot,), daemon=True) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = np.array([sample for slot in latencies for sample in slot]) * 1000.0
+    report = {"endpoint": endpoint, "concurrency": concurrency, "duration_s": round(elapsed, 2),
+              "requests": int(len(samples)), "errors": sum(errors),
+              "requests_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0}
+    if len(samples):
+        report.update({"p50_ms": round(float(np.percentile(samples, 50)), 2),
+                       "p95_ms": round(float(np.percentile(samples, 95)), 2),
+                       "p99_ms": round(float(np.percentile(samples, 99)), 2),
+                       "max_ms": round(float(samples.max()), 2)})
+    after = server_counters(url)
+    batches = after.get("batches", 0) - before.get("batches", 0)
+    if batches:
+        report["mean_batch_size"] = round((after["batched_requests"] - before.get("batched_requests", 0)) / batches, 2)
+    return report
+
+
+def start_self_test_server(users, max_batch, max_wait_ms):
+    from gallery import GalleryMatcher
+    from recognition_server import RecognitionService, start_recognition_server
+
+    rng = np.random.default_rng(0)
+    centres = rng.normal(scale=0.09, size=(users, 128))
+    templates = {f"user{i}": centres[i] + rng.normal(scale=0.01, size=(5, 128)) for i in range(users)}
+    service = RecognitionService(GalleryMatcher(templates), max_batch=max_batch, max_wait=max_wait_ms / 1000.0)
+    server, url = start_recognition_server(service)
+    return server, url
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure recognition server throughput and tail latency.")
+    parser.add_argument("--url", default="http://127.0.0.1:8100")
+    parser.add_argument("--images", help="directory of frames or face crops (default: synthetic crops)")
+    parser.add_argument("--identify", action="store_true", help="post to /identify (images are face crops)")
+    parser.add_argument("--concurrency", default="8", help="client threads, or a comma-separated sweep")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--self-test", action="store_true", help="start an in-process server on a synthetic gallery")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic gallery size for --self-test")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    url = args.url
+    if args.self_test:
+        server, url = start_self_test_server(args.users, args.max_batch, args.max_wait_ms)
+        print(f"Self-test server on {url} with {args.users} synthetic users")
+    endpoint = "/identify" if args.identify or (args.self_test and not args.images) else "/recognize"
+
+    payloads = load_images(args.images)
+    reports = []
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        report = run_load(url, payloads, endpoint, concurrency, args.duration)
+        reports.append(report)
+        print(f"{endpoint} x{concurrency:<3} {report['requests_per_sec']:8.1f} req/s  "
+              f"p50 {report.get('p50_ms', 0):7.1f} ms  p95 {report.get('p95_ms', 0):7.1f}  "
+              f"p99 {report.get('p99_ms', 0):7.1f}  errors {report['errors']}  "
+              f"batch {report.get('mean_batch_size', '-')}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Results written to {args.output}")
+    sys.exit(0)
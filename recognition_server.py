@@ -0,0 +1,377 @@
+"""
+Recognition server: detection, encoding and matching for thin kiosks.
+
+    python recognition_server.py --store face_templates.store --port 8100 --host 0.0.0.0 --token <secret>
+
+    POST /recognize   JPEG frame or capture-box crop -> {"faces": [{"box", "user_id", "distance"}]}
+                      (?encodings=1 also returns each 128-d encoding, used for registration)
+    POST /identify    JPEG face crop, the whole image is the face -> same answer, one face
+    POST /enroll      {"user_id": ..., "templates": [[128 floats] x 5]}        (token required)
+    POST /delete      {"user_id": ...}                                         (token required)
+    GET  /users       enrolled user ids and the gallery version
+    GET  /stats       metrics snapshot (see metrics.py)
+
+Detection runs on the request threads. Landmarks, the ResNet descriptor and
+the gallery match run on one batcher thread that takes every request waiting
+at that moment (up to --max-batch, waiting at most --max-wait-ms for more)
+and does one descriptor call and one matrix match for all of them.
+Point a kiosk at it with settings.json "recognition_server_url".
+
+/enroll and /delete change a biometric gallery, so they need the shared
+token (--token or RECOGNITION_SERVER_TOKEN) in the X-Recognition-Token
+header; kiosks send settings.json "recognition_server_token". Without a
+token the server only binds to the loopback interface.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import cv2
+import dlib
+import face_recognition
+
+from capture_rules import CAPTURE_FRAMES, LANDMARK_MODEL, RECOGNITION_TOLERANCE
+from detection import FaceDetector
+from gallery import GalleryMatcher, PRECISIONS
+from gallery_index import INDEX_BACKENDS, build_index
+from metrics import metrics
+from template_store import TemplateStore
+
+# === CONFIGURATION ===
+DEFAULT_PORT = 8100
+DEFAULT_MAX_BATCH = 16
+DEFAULT_MAX_WAIT_MS = 5
+REQUEST_TIMEOUT = 10.0  # seconds a request waits for its batch
+TOKEN_HEADER = "X-Recognition-Token"
+TOKEN_ENV = "RECOGNITION_SERVER_TOKEN"
+PROTECTED_PATHS = ("/enroll", "/delete")  # change the gallery, so they need the token
+
+
+# === Batched encoding ===
+def encode_batch(images, locations):
+    """
+    Encodes every face of every image (RGB arrays, (top, right, bottom, left)
+    locations). Landmarks are found per image; the ResNet descriptor then runs
+    once for the whole batch. Falls back to one call per image on dlib builds
+    without the batched overload.
+    """
+    api = face_recognition.api
+    shapes = []
+    for image, image_locations in zip(images, locations):
+        detections = dlib.full_object_detections()
+        for landmarks in api._raw_face_landmarks(image, image_locations, model=LANDMARK_MODEL):
+            detections.append(landmarks)
+        shapes.append(detections)
+    try:
+        descriptors = api.face_encoder.compute_face_descriptor(images, shapes, 1)
+    except (TypeError, RuntimeError):
+        descriptors = [api.face_encoder.compute_face_descriptor(image, detections, 1)
+                       for image, detections in zip(images, shapes)]
+    return [[np.array(descriptor) for descriptor in image_descriptors] for image_descriptors in descriptors]
+
+
+class MicroBatcher(threading.Thread):
+    """
+    Collects items submitted from many request threads and hands them to
+    process_batch(items) together. The first item of a batch waits at most
+    max_wait seconds for company; while a batch is being processed new items
+    queue up, so batches grow on their own under load.
+    """
+
+    def __init__(self, process_batch, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT_MS / 1000.0):
+        super().__init__(daemon=True, name="MicroBatcher")
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.running = True
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def run(self):
+        while self.running:
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+
+            metrics.incr("batches")
+            metrics.incr("batched_requests", len(batch))
+            try:
+                with metrics.timer("batch"):
+                    results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                print(f"❌ Batch failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stop(self):
+        self.running = False
+
+
+# === Service ===
+class RecognitionService:
+    """
+    The shared gallery plus the batcher. Safe to call from any thread.
+    """
+
+    def __init__(self, matcher, store=None, tolerance=RECOGNITION_TOLERANCE, downscale=0.5,
+                 max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT_MS / 1000.0):
+        self.matcher = matcher
+        self.store = store
+        self.tolerance = tolerance
+        self.downscale = downscale
+        self.batcher = MicroBatcher(self.process_batch, max_batch, max_wait)
+        self.batcher.start()
+
+    def locate(self, rgb):
+        # The client already cropped to the capture box, so search the whole image
+        height, width = rgb.shape[:2]
+        detector = FaceDetector((0, 0, width, height), downscale=self.downscale, use_haar=False)
+        return detector.detect(rgb)
+
+    def recognize(self, rgb, whole_face=False, include_encodings=False):
+        if whole_face:
+            height, width = rgb.shape[:2]
+            locations = [(0, width, height, 0)]
+        else:
+            with metrics.timer("detect"):
+                locations = self.locate(rgb)
+        metrics.incr("faces_detected", len(locations))
+        if not locations:
+            return []
+
+        encodings, matches = self.batcher.submit((rgb, locations)).result(REQUEST_TIMEOUT)
+        faces = []
+        for box, encoding, (user_id, distance) in zip(locations, encodings, matches):
+            face = {"box": [int(v) for v in box], "user_id": user_id, "distance": round(distance, 4)}
+            if include_encodings:
+                face["encoding"] = encoding.tolist()
+            faces.append(face)
+        metrics.incr("matches", sum(1 for face in faces if face["user_id"] is not None))
+        return faces
+
+    def process_batch(self, items):
+        """
+        Runs on the batcher thread: one descriptor call and one gallery match
+        for every face of every request in the batch.
+        """
+        with metrics.timer("encode"):
+            encodings = encode_batch([rgb for rgb, _ in items], [locations for _, locations in items])
+        flat = [encoding for image_encodings in encodings for encoding in image_encodings]
+        with metrics.timer("match"):
+            matches = self.matcher.match_many(flat, self.tolerance) if flat else []
+        results = []
+        start = 0
+        for image_encodings in encodings:
+            results.append((image_encodings, matches[start:start + len(image_encodings)]))
+            start += len(image_encodings)
+        return results
+
+    def users(self):
+        with self.matcher.lock:
+            return list(self.matcher.user_ids)
+
+    def enroll(self, user_id, templates):
+        """
+        Adds or replaces a user. Raises ValueError unless there are exactly
+        CAPTURE_FRAMES finite 128-d templates: with fewer the user could
+        never reach MIN_MATCHING_TEMPLATES and would silently never match.
+        """
+        templates = np.asarray(templates, dtype=np.float64)
+        if templates.shape != (CAPTURE_FRAMES, 128):
+            raise ValueError(f"expected {CAPTURE_FRAMES} templates of 128 values, got shape {templates.shape}")
+        if not np.isfinite(templates).all():
+            raise ValueError("templates contain non-finite values")
+        if not isinstance(user_id, str) or not user_id:
+            raise ValueError("user_id must be a non-empty string")
+        self.matcher.set_user(user_id, templates)
+        if self.store is not None:
+            self.store.put(user_id, templates)
+        print(f"✅ Enrolled {user_id}")
+
+    def delete(self, user_id):
+        removed = self.matcher.remove_user(user_id)
+        if removed and self.store is not None:
+            self.store.delete(user_id)
+        return removed
+
+    def close(self):
+        self.batcher.stop()
+
+
+# === HTTP front end ===
+def decode_jpeg(body):
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so kiosks reuse connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        service = self.server.service
+        if path == "/health":
+            self.send_json(200, {"status": "ok", "users": len(service.matcher)})
+        elif path == "/users":
+            self.send_json(200, {"users": service.users(), "version": service.matcher.version})
+        elif path == "/stats":
+            self.send_json(200, metrics.snapshot())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        service = self.server.service
+        metrics.incr("requests")
+        start = time.perf_counter()
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                self.close_connection = True  # the body's end is unknown, so the stream can't be reused
+                self.send_json(400, {"error": "Bad Content-Length"})
+                return
+            body = self.rfile.read(length)
+            if url.path in PROTECTED_PATHS and not self.authorized():
+                metrics.incr("unauthorized")
+                self.send_json(401, {"error": f"Missing or wrong {TOKEN_HEADER}"})
+                return
+            if url.path in ("/recognize", "/identify"):
+                rgb = decode_jpeg(body)
+                if rgb is None:
+                    self.send_json(400, {"error": "Body is not a readable image"})
+                    return
+                faces = service.recognize(rgb, whole_face=url.path == "/identify",
+                                          include_encodings=params.get("encodings", ["0"])[0] == "1")
+                self.send_json(200, {"faces": faces})
+            elif url.path == "/enroll":
+                payload = json.loads(body)
+                service.enroll(payload["user_id"], payload["templates"])
+                self.send_json(200, {"success": True})
+            elif url.path == "/delete":
+                payload = json.loads(body)
+                self.send_json(200, {"success": service.delete(payload["user_id"])})
+            else:
+                self.send_json(404, {"error": "Not found"})
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            metrics.incr("errors")
+            print(f"❌ {url.path} failed: {e}")
+            self.send_json(500, {"error": str(e)})
+        finally:
+            metrics.observe("request", time.perf_counter() - start)
+
+    def authorized(self):
+        token = self.server.token
+        if not token:
+            return True  # loopback only, see start_recognition_server
+        sent = self.headers.get(TOKEN_HEADER, "")
+        return hmac.compare_digest(sent.encode("utf-8"), token.encode("utf-8"))
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def start_recognition_server(service, host="127.0.0.1", port=0, verbose=False, token=None):
+    """
+    Serves the service on a background thread. Returns (server, base_url).
+    Refuses to listen beyond the loopback interface without a token, since
+    anyone who can reach /enroll could enroll their face as any user.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"Binding to {host} needs a token (--token or {TOKEN_ENV}); "
+                         f"without one /enroll and /delete would be open to the network")
+    metrics.enabled = True
+    server = ThreadingHTTPServer((host, port), RecognitionHandler)
+    server.service = service
+    server.verbose = verbose
+    server.token = token
+    threading.Thread(target=server.serve_forever, daemon=True, name="RecognitionServer").start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve face recognition to thin kiosks.")
+    parser.add_argument("--store", default="face_templates.store")
+    parser.add_argument("--host", default="127.0.0.1", help="use 0.0.0.0 to accept kiosks on the LAN (needs --token)")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"shared secret kiosks send for /enroll and /delete (default: ${TOKEN_ENV})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--tolerance", type=float, default=RECOGNITION_TOLERANCE)
+    parser.add_argument("--downscale", type=float, default=0.5)
+    parser.add_argument("--index", choices=sorted(INDEX_BACKENDS), help="gallery index (default: none)")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64",
+                        help="first-pass gallery precision; matches are re-checked at float64")
+    parser.add_argument("--centroids", action="store_true", help="first pass over one centroid per user")
+    args = parser.parse_args()
+
+    store = TemplateStore(args.store)
+    templates = store.load()
+    index = build_index(args.index, templates) if args.index else None
+    matcher = GalleryMatcher(templates, index, args.precision, args.centroids)
+    service = RecognitionService(matcher, store, args.tolerance, args.downscale,
+                                 args.max_batch, args.max_wait_ms / 1000.0)
+    try:
+        server, url = start_recognition_server(service, args.host, args.port, verbose=True, token=args.token)
+    except ValueError as e:
+        service.close()
+        raise SystemExit(f"❌ {e}")
+    print(f"Recognition server on {url} ({len(templates)} users)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    service.close()
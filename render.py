@@ -0,0 +1,190 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+from capture_rules import CAPTURE_BOX, FRAME_SIZE
+
+# === CONFIGURATION ===
+BLUR_SCALE = 0.25    # the outside-the-box blur runs at this fraction of the frame size
+BLUR_KERNEL = 7      # at BLUR_SCALE, roughly the look of the old 25x25 full-frame blur
+BOX_COLOR = (255, 255, 0)
+BOX_CAPTION = "Keep your face within the guide box."
+WARMUP_CAPTION = "Keep your face within the guide box... Starting soon..."
+
+
+# === Frame rendering ===
+class FrameRenderer:
+    """
+    Render stage for one camera view that allocates nothing per frame.
+
+    Every buffer (blur, composition canvas, scaled copy, RGBA output) is
+    allocated once. The blur runs on a small copy of the frame and is
+    upscaled straight into the canvas; only the inside of the guide box is
+    then copied from the sharp frame. Captions that never change (guide box
+    caption, warm-up message, mode line) are rasterised once into sprites and
+    pasted with a masked copy; per-frame text (status, FPS) is drawn in place.
+
+    `image` is a PIL image sharing memory with the RGBA output, so after
+    render() it can go straight to ImageTk.PhotoImage.paste().
+    """
+
+    def __init__(self, box=CAPTURE_BOX, frame_size=FRAME_SIZE, output_size=None, blur_scale=BLUR_SCALE):
+        width, height = frame_size
+        self.box = box
+        self.frame_size = frame_size
+        self.output_size = tuple(output_size) if output_size else None
+        small_size = (max(1, int(width * blur_scale)), max(1, int(height * blur_scale)))
+        self.small = np.empty((small_size[1], small_size[0], 3), dtype=np.uint8)
+        self.small_blurred = np.empty_like(self.small)
+        self.canvas = np.empty((height, width, 3), dtype=np.uint8)
+        out_width, out_height = self.output_size or frame_size
+        self.scaled = np.empty((out_height, out_width, 3), dtype=np.uint8) if self.output_size else None
+        self.rgba = np.zeros((out_height, out_width, 4), dtype=np.uint8)
+        self.rgba[..., 3] = 255
+        self.image = Image.frombuffer("RGBA", (out_width, out_height), self.rgba, "raw", "RGBA", 0, 1)
+        self.sprites = {}
+
+    # --- Static overlay ---
+    def sprite(self, text, scale, color, thickness, line_type=cv2.LINE_8):
+        """
+        Returns the cached (mask, pixels, origin) rasterisation of a caption;
+        origin is where putText's (x, y) falls inside the sprite.
+        """
+        key = (text, scale, color, thickness, line_type)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+            pad = thickness + 1
+            pixels = np.zeros((text_height + baseline + 2 * pad, text_width + 2 * pad, 3), dtype=np.uint8)
+            cv2.putText(pixels, text, (pad, pad + text_height), cv2.FONT_HERSHEY_SIMPLEX, scale, color,
+                        thickness, line_type)
+            mask = pixels.any(axis=2, keepdims=True)
+            sprite = self.sprites[key] = (mask, pixels, (pad, pad + text_height))
+        return sprite
+
+    def blit(self, sprite, x, y):
+        """
+        Pastes a sprite with its text baseline at (x, y), clipped to the canvas.
+        """
+        mask, pixels, (origin_x, origin_y) = sprite
+        top, left = y - origin_y, x - origin_x
+        height, width = self.canvas.shape[:2]
+        y1, x1 = max(0, top), max(0, left)
+        y2, x2 = min(height, top + pixels.shape[0]), min(width, left + pixels.shape[1])
+        if y1 >= y2 or x1 >= x2:
+            return
+        np.copyto(self.canvas[y1:y2, x1:x2], pixels[y1 - top:y2 - top, x1 - left:x2 - left],
+                  where=mask[y1 - top:y2 - top, x1 - left:x2 - left])
+
+    # --- Per frame ---
+    def render(self, frame, mode, status_text, faces, fps_text="", warming_up=False, debug_lines=None,
+               quality_text="", labels=None):
+        """
+        Composes the kiosk view of a BGR frame and returns the RGBA output
+        buffer (also visible through self.image). labels, if given, is a
+        (text, BGR colour) pair per face, drawn above its box.
+        """
+        canvas = self.canvas
+        x1, y1, x2, y2 = self.box
+
+        # --- BLUR OUTSIDE BOX (at reduced resolution) ---
+        cv2.resize(frame, (self.small.shape[1], self.small.shape[0]), dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(self.small, (BLUR_KERNEL, BLUR_KERNEL), 0, dst=self.small_blurred)
+        cv2.resize(self.small_blurred, self.frame_size, dst=canvas, interpolation=cv2.INTER_LINEAR)
+        canvas[y1:y2, x1:x2] = frame[y1:y2, x1:x2]
+
+        # Static overlay: capture box, caption and mode line
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        self.blit(self.sprite(BOX_CAPTION, 0.6, BOX_COLOR, 2), x1, y1 - 10)
+        self.blit(self.sprite(f"MODE: {mode.upper() if mode else 'IDLE'}", 1, (0, 255, 255), 2, cv2.LINE_AA), 10, 30)
+
+        # Per-frame text
+        if fps_text:
+            cv2.putText(canvas, fps_text, (10, 55),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+        if warming_up:
+            self.blit(self.sprite(WARMUP_CAPTION, 0.8, (0, 255, 255), 2, cv2.LINE_AA), 10, 470)
+        elif status_text:
+            cv2.putText(canvas, status_text, (10, 470),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+        if quality_text and not warming_up:
+            cv2.putText(canvas, quality_text, (10, 440),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 1, cv2.LINE_AA)
+
+        # Draw face rectangles from the latest recognition result
+        for (top, right, bottom, left) in faces:
+            cv2.rectangle(canvas, (left, top), (right, bottom), (0, 255, 0), 2)
+        if labels:
+            for (top, right, bottom, left), (text, color) in zip(faces, labels):
+                if text:
+                    cv2.putText(canvas, text, (left, max(15, top - 8)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2, cv2.LINE_AA)
+
+        # Debug overlay: per-stage latency and counters
+        if debug_lines:
+            for row, line in enumerate(debug_lines):
+                cv2.putText(canvas, line, (canvas.shape[1] - 330, 20 + row * 16),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
+
+        if self.scaled is not None:
+            cv2.resize(canvas, self.output_size, dst=self.scaled, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.scaled, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        else:
+            cv2.cvtColor(canvas, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        return self.rgba
+
+    def blank(self):
+        """
+        Clears the output to opaque black (camera stopped).
+        """
+        self.rgba[..., :3] = 0
+        return self.rgba
+
+
+# === Reference implementation ===
+def compose_frame(frame, mode, status_text, faces, fps_text="", warming_up=False, box=CAPTURE_BOX,
+                  debug_lines=None):
+    """
+    The original allocating render path (full-frame blur, fresh RGBA and PIL
+    image per call). The kiosk uses FrameRenderer; this is kept so
+    benchmark.py can compare the two.
+    """
+    # --- CAPTURE ZONE COORDINATES ---
+    CAPTURE_X1, CAPTURE_Y1, CAPTURE_X2, CAPTURE_Y2 = box
+
+    # --- BLUR OUTSIDE BOX ---
+    blurred_frame = cv2.GaussianBlur(frame, (25, 25), 0)
+    blurred_frame[CAPTURE_Y1:CAPTURE_Y2, CAPTURE_X1:CAPTURE_X2] = frame[CAPTURE_Y1:CAPTURE_Y2, CAPTURE_X1:CAPTURE_X2]
+    frame = blurred_frame
+
+    # Draw capture box
+    cv2.rectangle(frame, (CAPTURE_X1, CAPTURE_Y1), (CAPTURE_X2, CAPTURE_Y2), (255, 255, 0), 2)
+    cv2.putText(frame, "Keep your face within the guide box.", (CAPTURE_X1, CAPTURE_Y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+
+    # Draw mode/status
+    mode_text = f"MODE: {mode.upper() if mode else 'IDLE'}"
+    cv2.putText(frame, mode_text, (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2, cv2.LINE_AA)
+    if fps_text:
+        cv2.putText(frame, fps_text, (10, 55),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+    if warming_up:
+        cv2.putText(frame, "Keep your face within the guide box... Starting soon...",
+                    (10, 470), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2, cv2.LINE_AA)
+    elif status_text:
+        cv2.putText(frame, status_text, (10, 470),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+
+    # Draw face rectangles from the latest recognition result
+    for (top, right, bottom, left) in faces:
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+
+    # Debug overlay: per-stage latency and counters
+    if debug_lines:
+        for row, line in enumerate(debug_lines):
+            cv2.putText(frame, line, (frame.shape[1] - 330, 20 + row * 16),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
+
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    return Image.fromarray(frame)
@@ -0,0 +1,290 @@
+"""
+Offline replay of recorded frames through the kiosk's recognition path.
+
+    python replay.py recorded.mp4 --mode login --output decisions.jsonl
+    python replay.py frames/ --mode logout --store face_templates.store --output decisions.csv
+    python replay.py frames/ --server http://127.0.0.1:8100
+    python replay.py queue.mp4 --crowd --live --output crowd.jsonl
+
+Reads a video file or a directory of stills (see frame_sources.py) as fast
+as it decodes, with no warm-up and no camera, and runs every frame through
+recognition.Recognizer: detection in the capture box, position and distance
+gating, encoding, gallery matching and the punch call. The punch goes to a
+stub that answers immediately, so nothing reaches the attendance server.
+Each frame's decision (faces, status line, punch) and per-stage timing is
+written to --output; a throughput and latency summary is printed at the end.
+After a punch the lane starts a fresh attempt, as an entrance lane does.
+
+--crowd replays through a crowd lane (every face in the wide zone at once).
+--live drops the frames a live camera would have delivered while a frame
+was being processed, so people/minute (distinct people punched per minute
+of video) reflects what the kiosk's CPU could keep up with.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import cv2
+
+from capture_rules import CAPTURE_BOX, CAPTURE_FRAMES, CROWD_BOX, FRAME_SIZE, RECOGNITION_TOLERANCE
+from frame_sources import open_source
+from identity_cache import RecentIdentities, PunchDebouncer, RECENT_CAPACITY, RECENT_TTL_SECONDS
+from lanes import Lane
+from profiles import PROFILES, encoder_for
+from quality import QualityGate, REGISTRATION_BURST
+from recognition import Recognizer
+from tracking import FaceTracker
+
+# === CONFIGURATION ===
+TEMPLATE_STORE_DIR = "face_templates.store"
+FACE_TEMPLATE_FILE = "face_templates.npz"
+STAGES = ("detect", "quality", "encode", "match", "remote")
+
+
+# === Stub punch ===
+class StubPunches:
+    """
+    Stands in for submit_punch: records the punch and returns a future that
+    has already succeeded, like a server that answers instantly.
+    """
+
+    def __init__(self):
+        self.event_ids = itertools.count(1)
+        self.punches = []
+
+    def __call__(self, user_id, status, source):
+        event_id = next(self.event_ids)
+        self.punches.append((event_id, user_id, status))
+        future = Future()
+        future.set_result((user_id, f"Replay user {user_id}"))
+        return event_id, future
+
+
+# === Setup ===
+def load_gallery(store_dir, legacy_file):
+    from gallery import GalleryMatcher
+    from template_store import TemplateStore
+
+    if os.path.isdir(store_dir):
+        templates = TemplateStore(store_dir).load()
+    elif os.path.exists(legacy_file):
+        with np.load(legacy_file, allow_pickle=True) as data:
+            templates = {user_id: data[user_id] for user_id in data.files}
+    else:
+        print(f"⚠️ No templates in {store_dir} or {legacy_file}; every face will be unknown")
+        templates = {}
+    return GalleryMatcher(templates)
+
+
+def build_recognizer(args, punches):
+    """
+    Returns (recognizer, lane) set up like one kiosk camera.
+    """
+    box = args.capture_box or (CROWD_BOX if args.crowd else CAPTURE_BOX)
+    lane = Lane("", args.source, capture_box=box, crowd=args.crowd)
+    caches = {"recent": RecentIdentities(args.recent_size, RECENT_TTL_SECONDS) if args.recent_size else None,
+              "debouncer": PunchDebouncer(args.debounce_seconds) if args.debounce_seconds else None}
+    lane.tracker = FaceTracker()
+    if args.server:
+        from recognition_client import RecognitionClient, RemoteGallery
+        remote = RecognitionClient(args.server, token=args.token)
+        quality = None if args.no_quality else QualityGate()
+        recognizer = Recognizer(RemoteGallery(remote), punches, remote=remote, tolerance=args.tolerance,
+                                capture_frames=args.capture_frames, warmup=0, quality=quality, burst=args.burst,
+                                **caches)
+    else:
+        import face_recognition
+        from detection import FaceDetector
+        # The profile's frame-rate cap is left out: replay runs at decode speed
+        profile = dict(PROFILES[args.profile], **({"downscale": args.downscale} if args.downscale else {}))
+        lane.detector = FaceDetector(lane.capture_box, downscale=profile["downscale"],
+                                     use_haar=not (args.no_haar or args.crowd),
+                                     upsample=profile["upsample"], model=profile["detector_model"])
+        quality = None if args.no_quality else QualityGate(landmarks=face_recognition.face_landmarks)
+        recognizer = Recognizer(load_gallery(args.store, args.legacy), punches,
+                                encode=encoder_for(profile, face_recognition.face_encodings), tolerance=args.tolerance,
+                                capture_frames=args.capture_frames, warmup=0, quality=quality, burst=args.burst,
+                                **caches)
+    lane.reset(args.mode)
+    lane.user_id = args.user_id
+    return recognizer, lane
+
+
+# === Replay ===
+def describe_event(event):
+    if event["kind"] == "register":
+        return f"register {event['user_id']}"
+    if event["kind"] == "duplicate":
+        return f"duplicate {event['status']} {event['user_id']}"
+    return f"{event['status']} {event['user_id']}"
+
+
+def replay(source, recognizer, lane, max_frames=None, cooldown_frames=0, live=False):
+    """
+    Runs every frame of source through the recognizer and yields one record
+    per frame. Frames arriving while the lane is cooling down after a punch
+    are recorded as skipped, and with live=True so are the frames that
+    arrived while the previous one was being processed.
+    """
+    cooldown = 0
+    dropped = 0
+    for index in itertools.count():
+        if max_frames is not None and index >= max_frames:
+            return
+        ret, frame = source.read()
+        if not ret:
+            return
+        frame = cv2.resize(frame, FRAME_SIZE)
+        if dropped:
+            dropped -= 1
+            yield {"frame": index, "skipped": True}
+            continue
+        if cooldown:
+            cooldown -= 1
+            if not cooldown:
+                lane.reset(lane.mode)
+            yield {"frame": index, "skipped": True}
+            continue
+
+        start = time.perf_counter()
+        result = recognizer.recognize_frame(lane, frame)
+        total = time.perf_counter() - start
+        if live:
+            dropped = int(total * source.fps)
+        record = {"frame": index, "skipped": result is None, "total_ms": round(total * 1000.0, 3)}
+        if result is None:
+            yield record
+            continue
+        record.update({"faces": len(result["faces"]), "status": result["status_text"], "quality": result["quality"]})
+        record.update({f"{stage}_ms": round(seconds * 1000.0, 3) for stage, seconds in result["timings"].items()})
+
+        if result.get("events"):  # crowd lane: the attempt goes on
+            record["event"] = "; ".join(describe_event(event) for event in result["events"])
+            record["punched"] = [event["user_id"] for event in result["events"] if event["kind"] == "punch"]
+        event = result["event"]
+        if event is not None:
+            if event["kind"] == "register":
+                recognizer.matcher.set_user(event["user_id"], np.array(event["templates"]))
+            elif event["kind"] == "punch":
+                record["punched"] = [event["user_id"]]
+            record["event"] = describe_event(event)
+            if cooldown_frames:
+                cooldown = cooldown_frames
+            else:
+                lane.reset(lane.mode)
+        yield record
+
+
+def summarize(records, elapsed, fps):
+    processed = [record for record in records if not record["skipped"]]
+    totals = np.array([record["total_ms"] for record in processed]) if processed else np.zeros(0)
+    video_minutes = len(records) / fps / 60.0
+    people = {user_id for record in processed for user_id in record.get("punched", ())}
+    summary = {"frames": len(records), "processed": len(processed),
+               "seconds": round(elapsed, 3),
+               "frames_per_sec": round(len(records) / elapsed, 2) if elapsed else 0.0,
+               "with_faces": sum(1 for record in processed if record.get("faces")),
+               "punches": sum(len(record.get("punched", ())) for record in processed),
+               "duplicates": sum((record.get("event") or "").count("duplicate") for record in processed),
+               "video_seconds": round(video_minutes * 60.0, 2),
+               "people": len(people),
+               "people_per_min": round(len(people) / video_minutes, 2) if video_minutes else 0.0}
+    if len(totals):
+        summary.update({"p50_ms": round(float(np.percentile(totals, 50)), 2),
+                        "p95_ms": round(float(np.percentile(totals, 95)), 2),
+                        "p99_ms": round(float(np.percentile(totals, 99)), 2),
+                        "max_ms": round(float(totals.max()), 2)})
+    for stage in STAGES:
+        samples = [record[f"{stage}_ms"] for record in processed if f"{stage}_ms" in record]
+        if samples:
+            summary[f"{stage}_p50_ms"] = round(float(np.percentile(samples, 50)), 2)
+    return summary
+
+
+def write_records(records, path):
+    if path.lower().endswith(".csv"):
+        fields = ["frame", "skipped", "faces", "status", "quality", "event", "total_ms"] + [f"{stage}_ms" for stage in STAGES]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the recognition path.")
+    parser.add_argument("source", help="video file or directory of frames")
+    parser.add_argument("--mode", choices=("login", "logout", "register"), default="login")
+    parser.add_argument("--user-id", default="replay", help="user ID a register replay enrolls")
+    parser.add_argument("--store", default=TEMPLATE_STORE_DIR, help="template store to match against")
+    parser.add_argument("--legacy", default=FACE_TEMPLATE_FILE, help="legacy .npz used when there is no store")
+    parser.add_argument("--server", help="recognition server URL (thin-kiosk path instead of local dlib)")
+    parser.add_argument("--token", default=os.environ.get("RECOGNITION_SERVER_TOKEN"),
+                        help="the server's token, needed for a register replay")
+    parser.add_argument("--tolerance", type=float, default=RECOGNITION_TOLERANCE)
+    parser.add_argument("--capture-frames", type=int, default=CAPTURE_FRAMES)
+    parser.add_argument("--burst", type=int, default=REGISTRATION_BURST, help="good frames a registration collects")
+    parser.add_argument("--no-quality", action="store_true", help="disable the quality gate")
+    parser.add_argument("--recent-size", type=int, default=RECENT_CAPACITY, help="recent-identity cache size (0 = off)")
+    parser.add_argument("--debounce-seconds", type=float, default=0,
+                        help="suppress repeat punches within this many wall-clock seconds (default off)")
+    parser.add_argument("--capture-box", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="default: the guide box, or the crowd zone with --crowd")
+    parser.add_argument("--crowd", action="store_true", help="replay through a crowd lane (login/logout only)")
+    parser.add_argument("--live", action="store_true",
+                        help="drop frames a live camera would have delivered during processing")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="balanced",
+                        help="detection/encoding profile (see profiles.py)")
+    parser.add_argument("--downscale", type=float, help="detection downscale (default: the profile's)")
+    parser.add_argument("--no-haar", action="store_true", help="disable the Haar pre-filter")
+    parser.add_argument("--realtime", action="store_true", help="pace frames at the source frame rate")
+    parser.add_argument("--max-frames", type=int)
+    parser.add_argument("--cooldown-frames", type=int, default=0, help="frames to skip after each punch")
+    parser.add_argument("--output", help="write per-frame decisions to this .jsonl or .csv file")
+    args = parser.parse_args()
+
+    if args.source.isdigit() or "://" in args.source:
+        raise SystemExit("replay.py reads recordings; pass a video file or a directory of frames")
+    if args.crowd and args.mode == "register":
+        raise SystemExit("--crowd replays login or logout; registration always uses the guide box")
+    source = open_source(args.source, realtime=args.realtime, loop=False)
+    if not source.isOpened():
+        raise SystemExit(f"Could not open {args.source}")
+
+    punches = StubPunches()
+    recognizer, lane = build_recognizer(args, punches)
+
+    started = time.perf_counter()
+    records = []
+    for record in replay(source, recognizer, lane, args.max_frames, args.cooldown_frames, args.live):
+        records.append(record)
+        if record.get("event"):
+            print(f"✅ frame {record['frame']}: {record['event']}")
+    elapsed = time.perf_counter() - started
+    source.release()
+
+    summary = summarize(records, elapsed, source.fps)
+    print(f"{summary['frames']} frames ({summary['processed']} recognized) in {summary['seconds']} s  "
+          f"{summary['frames_per_sec']} frames/s  p50 {summary.get('p50_ms', 0)} ms  "
+          f"p95 {summary.get('p95_ms', 0)} ms  p99 {summary.get('p99_ms', 0)} ms  "
+          f"punches {summary['punches']}  duplicates {summary['duplicates']}")
+    print(f"{summary['people']} people in {summary['video_seconds']} s of video: "
+          f"{summary['people_per_min']} people/min")
+    for stage in STAGES:
+        if f"{stage}_p50_ms" in summary:
+            print(f"  {stage:<8} p50 {summary[f'{stage}_p50_ms']} ms")
+
+    if args.output:
+        write_records(records, args.output)
+        print(f"Per-frame decisions written to {args.output}")
+    sys.exit(0)
@@ -0,0 +1,285 @@
+"""
+Multi-process gallery search for very large galleries (enrollment and audit
+boxes, not the kiosk).
+
+    python sharded_gallery.py --sizes 100000,300000 --workers 1,2,4,8
+    python sharded_gallery.py --npz site_a.npz site_b.npz --workers 4 --queries 512
+
+The stacked (N_templates, 128) float64 matrix and its squared row norms are
+written once into multiprocessing.shared_memory. Worker processes attach to
+it without copying, and each search is split into shards at user boundaries.
+Every shard applies the kiosk's rule (>= 4 templates within tolerance and
+template 0 within tolerance) with one batched distance computation and
+returns its top-k qualifying users by template-0 distance. It also returns
+its first qualifying user in gallery order. The parent merges the shards:
+match() gives the same answer as GalleryMatcher.match(), and search() gives
+the k best qualifying users across the whole gallery.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from capture_rules import RECOGNITION_TOLERANCE
+from gallery import MIN_MATCHING_TEMPLATES
+
+# === CONFIGURATION ===
+DEFAULT_TOP_K = 5
+SHARDS_PER_WORKER = 4        # more shards than workers evens out uneven shards
+CHUNK_ROWS = 16384           # rows per distance block inside a shard, bounds worker memory
+
+
+# === Worker side ===
+_worker = {}  # per-process view of the shared gallery, filled by _attach
+
+
+def _attach(matrix_name, norms_name, rows, first_rows, row_counts):
+    matrix_shm = SharedMemory(name=matrix_name)
+    norms_shm = SharedMemory(name=norms_name)
+    _worker["shm"] = (matrix_shm, norms_shm)  # keep the mappings alive
+    _worker["matrix"] = np.ndarray((rows, 128), dtype=np.float64, buffer=matrix_shm.buf)
+    _worker["norms"] = np.ndarray((rows,), dtype=np.float64, buffer=norms_shm.buf)
+    _worker["first_rows"] = first_rows
+    _worker["row_counts"] = row_counts
+
+
+def _search_shard(task):
+    """
+    Applies the rule to users [user_start, user_end) for every probe.
+    Returns (first qualifying user per probe or -1, top-k user indices,
+    their template-0 distances, nearest template distance per probe).
+    """
+    user_start, user_end, probes, tolerance, top_k, min_matches = task
+    matrix, norms = _worker["matrix"], _worker["norms"]
+    first_rows, row_counts = _worker["first_rows"], _worker["row_counts"]
+    probe_norms = np.einsum("ij,ij->i", probes, probes)
+
+    first = np.full(len(probes), -1, dtype=np.intp)
+    best_users = np.empty((len(probes), 0), dtype=np.intp)
+    best_distances = np.empty((len(probes), 0))
+    nearest = np.full(len(probes), np.inf)
+
+    user = user_start
+    while user < user_end:
+        # A block of whole users, about CHUNK_ROWS rows
+        block_end = int(np.searchsorted(first_rows, first_rows[user] + CHUNK_ROWS, side="right"))
+        block_end = min(max(block_end, user + 1), user_end)
+        starts = first_rows[user:block_end]
+        counts = row_counts[user:block_end]
+        row_start = starts[0]
+        row_end = starts[-1] + counts[-1]
+        if row_end > row_start:
+            squared = (probe_norms[:, None] + norms[None, row_start:row_end]
+                       - 2.0 * probes @ matrix[row_start:row_end].T)
+            distances = np.sqrt(np.maximum(squared, 0.0, out=squared), out=squared)
+            nearest = np.minimum(nearest, distances.min(axis=1))
+            hits = distances <= tolerance
+
+            local = starts - row_start
+            running = np.concatenate((np.zeros((len(probes), 1), dtype=np.intp), np.cumsum(hits, axis=1)), axis=1)
+            hit_counts = running[:, local + counts] - running[:, local]
+            has_rows = counts > 0
+            anchor = np.full((len(probes), len(starts)), np.inf)
+            anchor[:, has_rows] = distances[:, local[has_rows]]
+            qualifying = (hit_counts >= min_matches) & (anchor <= tolerance)
+
+            for row in np.flatnonzero(qualifying.any(axis=1)):
+                users = np.flatnonzero(qualifying[row])
+                if first[row] < 0:
+                    first[row] = user + users[0]
+            # Keep the running top-k (by template-0 distance) of qualifying users
+            scores = np.where(qualifying, anchor, np.inf)
+            best_users = np.concatenate((best_users, np.broadcast_to(np.arange(user, block_end), scores.shape)), axis=1)
+            best_distances = np.concatenate((best_distances, scores), axis=1)
+            if best_distances.shape[1] > top_k:
+                keep = np.argpartition(best_distances, top_k - 1, axis=1)[:, :top_k]
+                best_users = np.take_along_axis(best_users, keep, axis=1)
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+        user = block_end
+    return first, best_users, best_distances, nearest
+
+
+# === Sharded gallery ===
+class ShardedGallery:
+    """
+    A read-only gallery searched by a pool of worker processes over shared
+    memory. Build it once (it copies the templates into shared memory) and
+    close() it when done, or use it as a context manager.
+    """
+
+    def __init__(self, templates, workers=None, shards=None):
+        self.user_ids = list(templates.keys())
+        blocks = [np.asarray(templates[user_id], dtype=np.float64).reshape(-1, 128) for user_id in self.user_ids]
+        self.row_counts = np.array([len(block) for block in blocks], dtype=np.intp)
+        self.first_rows = np.concatenate(([0], np.cumsum(self.row_counts)[:-1])).astype(np.intp)
+        rows = int(self.row_counts.sum())
+
+        # Fill shared memory in place, one user at a time, so the gallery is never held twice
+        self.matrix_shm = SharedMemory(create=True, size=max(1, rows * 128 * 8))
+        self.norms_shm = SharedMemory(create=True, size=max(1, rows * 8))
+        matrix = np.ndarray((rows, 128), dtype=np.float64, buffer=self.matrix_shm.buf)
+        norms = np.ndarray((rows,), dtype=np.float64, buffer=self.norms_shm.buf)
+        for first_row, block in zip(self.first_rows, blocks):
+            matrix[first_row:first_row + len(block)] = block
+        del blocks
+        np.einsum("ij,ij->i", matrix, matrix, out=norms)
+        del matrix, norms  # the parent only needs the shared memory names from here on
+
+        self.workers = workers or os.cpu_count() or 1
+        shard_count = min(len(self.user_ids), shards or self.workers * SHARDS_PER_WORKER) or 1
+        # Shards hold about the same number of rows, split at user boundaries
+        cuts = np.searchsorted(self.first_rows, np.linspace(0, rows, shard_count + 1)[1:-1])
+        bounds = np.concatenate(([0], cuts, [len(self.user_ids)])).astype(np.intp)
+        self.shards = [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        self.pool = Pool(self.workers, initializer=_attach,
+                         initargs=(self.matrix_shm.name, self.norms_shm.name, rows, self.first_rows, self.row_counts))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def _run(self, probes, tolerance, top_k, min_matches):
+        probes = np.asarray(probes, dtype=np.float64).reshape(-1, 128)
+        tasks = [(start, end, probes, tolerance, top_k, min_matches) for start, end in self.shards]
+        return probes, self.pool.map(_search_shard, tasks)
+
+    def match_many(self, probes, tolerance=RECOGNITION_TOLERANCE, min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Returns [(user_id or None, distance)] in probe order, with the same
+        first-match-in-gallery-order answer as GalleryMatcher.match_many().
+        """
+        probes, parts = self._run(probes, tolerance, 1, min_matches)
+        results = []
+        for row in range(len(probes)):
+            # Shards are in gallery order, so the first shard with a match wins
+            for first, _, best_distances, _ in parts:
+                if first[row] >= 0:
+                    user = int(first[row])
+                    distance = np.linalg.norm(self._templates(user)[0] - probes[row])
+                    results.append((self.user_ids[user], float(distance)))
+                    break
+            else:
+                results.append((None, float(min(part[3][row] for part in parts))))
+        return results
+
+    def match(self, encoding, tolerance=RECOGNITION_TOLERANCE, min_matches=MIN_MATCHING_TEMPLATES):
+        return self.match_many([encoding], tolerance, min_matches)[0][0]
+
+    def search(self, probes, top_k=DEFAULT_TOP_K, tolerance=RECOGNITION_TOLERANCE,
+               min_matches=MIN_MATCHING_TEMPLATES):
+        """
+        Returns, per probe, up to top_k [(user_id, template-0 distance)] of
+        users that pass the rule, nearest first, merged across all shards.
+        """
+        probes, parts = self._run(probes, tolerance, top_k, min_matches)
+        users = np.concatenate([part[1] for part in parts], axis=1)
+        distances = np.concatenate([part[2] for part in parts], axis=1)
+        results = []
+        for row in range(len(probes)):
+            order = np.argsort(distances[row], kind="stable")[:top_k]
+            results.append([(self.user_ids[users[row, i]], float(distances[row, i]))
+                            for i in order if np.isfinite(distances[row, i])])
+        return results
+
+    def _templates(self, user):
+        rows = int(self.first_rows[-1] + self.row_counts[-1]) if len(self.row_counts) else 0
+        matrix = np.ndarray((rows, 128), dtype=np.float64, buffer=self.matrix_shm.buf)
+        start = self.first_rows[user]
+        return matrix[start:start + self.row_counts[user]].copy()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        for shm in (self.matrix_shm, self.norms_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def load_npz_galleries(paths):
+    """
+    Merges several sites' face_templates.npz files into one dict. A user ID
+    present in more than one file keeps the templates of the last file.
+    """
+    templates = {}
+    for path in paths:
+        with np.load(path, allow_pickle=True) as data:
+            for user_id in data.files:
+                if user_id in templates:
+                    print(f"⚠️ {user_id} appears in more than one file; using {path}")
+                templates[user_id] = data[user_id]
+    return templates
+
+
+# === MAIN (scaling report) ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure sharded gallery search against worker count and size.")
+    parser.add_argument("--npz", nargs="+", help="face_templates.npz files to merge (default: synthetic)")
+    parser.add_argument("--sizes", default="100000", help="comma-separated synthetic gallery sizes")
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)) or "1",
+                        help="comma-separated worker counts")
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=32, help="probes per search call")
+    parser.add_argument("--tolerance", type=float, default=RECOGNITION_TOLERANCE)
+    parser.add_argument("--verify", action="store_true", help="check answers against GalleryMatcher")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    galleries = []
+    if args.npz:
+        galleries.append(("npz", load_npz_galleries(args.npz)))
+    else:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            centres = rng.normal(scale=0.09, size=(size, 128))
+            galleries.append((str(size), {f"user{i}": centres[i] + rng.normal(scale=0.01, size=(5, 128))
+                                          for i in range(size)}))
+
+    reports = []
+    print(f"cpu_count={os.cpu_count()}")
+    for name, templates in galleries:
+        user_ids = list(templates.keys())
+        picks = rng.integers(0, len(user_ids), args.queries)
+        probes = np.array([np.asarray(templates[user_ids[pick]]).reshape(-1, 128).mean(axis=0) for pick in picks])
+        probes += rng.normal(scale=0.01, size=probes.shape)
+        baseline = None
+        for workers in [int(value) for value in args.workers.split(",")]:
+            started = time.perf_counter()
+            with ShardedGallery(templates, workers=workers) as gallery:
+                build_s = time.perf_counter() - started
+                gallery.match_many(probes[:1], args.tolerance)  # warm the workers
+                started = time.perf_counter()
+                answers = []
+                for first in range(0, len(probes), args.batch):
+                    answers.extend(gallery.match_many(probes[first:first + args.batch], args.tolerance))
+                elapsed = time.perf_counter() - started
+            per_sec = len(probes) / elapsed
+            baseline = baseline or per_sec
+            report = {"gallery": name, "users": len(user_ids), "workers": workers, "build_s": round(build_s, 2),
+                      "probes_per_sec": round(per_sec, 1), "ms_per_probe": round(1000 * elapsed / len(probes), 3),
+                      "speedup": round(per_sec / baseline, 2),
+                      "matches": sum(user is not None for user, _ in answers)}
+            if args.verify:
+                from gallery import GalleryMatcher
+                expected = GalleryMatcher(templates).match_many(probes, args.tolerance)
+                report["differences"] = sum(a[0] != b[0] for a, b in zip(answers, expected))
+            reports.append(report)
+            print(f"{name:>8} users x{workers:<2} workers  {report['probes_per_sec']:9.1f} probes/s  "
+                  f"{report['ms_per_probe']:8.3f} ms/probe  speedup {report['speedup']:5.2f}  "
+                  f"build {report['build_s']} s" + (f"  differences {report['differences']}" if args.verify else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Results written to {args.output}")
+    sys.exit(0)
@@ -0,0 +1,45 @@
+import json
+import time
+from contextlib import contextmanager
+
+# === Startup timing ===
+class StartupTimer:
+    """
+    Collects how long each startup stage took (import, model load, gallery
+    load, window, first frame). Each save() appends a JSON line to a history
+    file, keyed by run, so cold-start regressions show up run over run.
+    """
+
+    def __init__(self, started_at=None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.stages = {}  # stage -> seconds, in the order recorded
+        self.run = time.strftime("%Y-%m-%dT%H:%M:%S")  # groups the lines written by one run
+
+    def since_start(self):
+        return time.perf_counter() - self.started_at
+
+    def record(self, name, seconds):
+        self.stages[name] = seconds
+
+    def has(self, name):
+        return name in self.stages
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self):
+        return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.stages.items())
+
+    def save(self, path):
+        entry = {"run": self.run,
+                 "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}}
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write startup timing: {e}")
@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+import zlib
+import numpy as np
+
+# === CONFIGURATION ===
+ENCODING_DIM = 128
+ROW_BYTES = ENCODING_DIM * 4         # one float32 encoding
+COMPACT_MIN_DEAD_ROWS = 5000         # don't bother compacting tiny amounts of garbage
+COMPACT_DEAD_RATIO = 0.5             # compact once dead rows exceed half of all rows
+LEGACY_MARKER = "LEGACY_IMPORTED"    # written once the legacy .npz has been taken care of
+
+
+def _fsync_write(f, data):
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _encode_record(record):
+    payload = json.dumps(record, separators=(",", ":"))
+    return f"{payload}\t{zlib.crc32(payload.encode('utf-8')):08x}\n".encode("utf-8")
+
+
+def _decode_record(line):
+    """
+    Returns the record, or None if the line is torn or corrupt.
+    """
+    try:
+        text = line.decode("utf-8")
+        payload, crc = text.rstrip("\n").rsplit("\t", 1)
+        if not text.endswith("\n") or int(crc, 16) != zlib.crc32(payload.encode("utf-8")):
+            return None
+        return json.loads(payload)
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+# === Template store ===
+class TemplateStore:
+    """
+    Incremental, crash-safe storage for face templates.
+
+    Layout of the store directory:
+        CURRENT              generation number, swapped atomically with os.replace
+        encodings.<gen>.f32  every encoding ever appended, float32, one contiguous block
+        log.<gen>.jsonl      one checksummed line per put/delete
+        LEGACY_IMPORTED      present once the legacy .npz was imported (see import_legacy)
+
+    register appends the user's rows to the encodings block and then a "put"
+    line to the log; delete appends a tombstone. Both are fsynced, and a put
+    only counts once its log line is complete, so a crash mid-write loses at
+    most that one change and never corrupts the rest. Loading memory-maps the
+    encodings block, so users come back as float32 views without a copy.
+    compact() rewrites only the live rows into a new generation.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.generation = self._read_current()
+        self.entries = {}   # user_id -> (first row, row count), in insertion order
+        self.rows = 0       # rows in the encodings block
+        self.dead_rows = 0  # rows no longer referenced by any user
+        self.block = None
+        self._replay()
+
+    # --- Files ---
+    def _file(self, kind, generation=None):
+        generation = self.generation if generation is None else generation
+        suffix = "f32" if kind == "encodings" else "jsonl"
+        return os.path.join(self.path, f"{kind}.{generation}.{suffix}")
+
+    def _read_current(self):
+        current = os.path.join(self.path, "CURRENT")
+        if os.path.exists(current):
+            with open(current) as f:
+                return int(f.read().strip())
+        return 0
+
+    def _write_current(self, generation):
+        tmp = os.path.join(self.path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            _fsync_write(f, str(generation))
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+
+    def _replay(self):
+        """
+        Rebuilds the user table from the log and drops any torn tail left by a crash.
+        """
+        log_file = self._file("log")
+        valid_bytes = 0
+        if os.path.exists(log_file):
+            with open(log_file, "rb") as f:
+                for line in f:
+                    record = _decode_record(line)
+                    if record is None:
+                        break
+                    valid_bytes += len(line)
+                    self._apply(record)
+            if valid_bytes != os.path.getsize(log_file):
+                with open(log_file, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+        encodings_file = self._file("encodings")
+        committed = max((first + count for first, count in self.entries.values()), default=0)
+        size = os.path.getsize(encodings_file) if os.path.exists(encodings_file) else 0
+        self.rows = max(committed, size // ROW_BYTES)
+        if size != self.rows * ROW_BYTES:
+            with open(encodings_file, "r+b") as f:
+                f.truncate(self.rows * ROW_BYTES)  # partial row from an interrupted append
+        live = sum(count for _, count in self.entries.values())
+        self.dead_rows = self.rows - live
+
+    def _apply(self, record):
+        if record["op"] == "put":
+            self.entries[record["user"]] = (record["row"], record["count"])
+        elif record["op"] == "del":
+            self.entries.pop(record["user"], None)
+
+    # --- Reading ---
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, user_id):
+        return user_id in self.entries
+
+    def load(self):
+        """
+        Returns {user_id: (n, 128) float32 array}. The arrays are read-only
+        views into one memory-mapped block; nothing is decoded or copied.
+        """
+        with self.lock:
+            if self.rows == 0:
+                return {}
+            self.block = np.memmap(self._file("encodings"), dtype=np.float32, mode="r",
+                                   shape=(self.rows, ENCODING_DIM))
+            return {user_id: self.block[first:first + count]
+                    for user_id, (first, count) in self.entries.items()}
+
+    # --- Writing ---
+    def put(self, user_id, templates):
+        self.put_many([(user_id, templates)])
+
+    def put_many(self, items):
+        """
+        Adds or overwrites several users with a single append + fsync commit.
+        """
+        items = [(user_id, np.asarray(templates, dtype=np.float32).reshape(-1, ENCODING_DIM))
+                 for user_id, templates in items]
+        if not items:
+            return
+        with self.lock:
+            records = []
+            row = self.rows
+            for user_id, block in items:
+                records.append({"op": "put", "user": user_id, "row": row, "count": len(block)})
+                row += len(block)
+            with open(self._file("encodings"), "ab") as f:
+                _fsync_write(f, b"".join(block.tobytes() for _, block in items))
+            with open(self._file("log"), "ab") as f:
+                _fsync_write(f, b"".join(_encode_record(record) for record in records))
+
+            self.rows = row
+            for record in records:
+                old = self.entries.get(record["user"])
+                if old is not None:
+                    self.dead_rows += old[1]
+                self.entries[record["user"]] = (record["row"], record["count"])
+        self.maybe_compact()
+
+    def delete(self, user_id):
+        with self.lock:
+            if user_id not in self.entries:
+                return False
+            with open(self._file("log"), "ab") as f:
+                _fsync_write(f, _encode_record({"op": "del", "user": user_id}))
+            self.dead_rows += self.entries.pop(user_id)[1]
+        self.maybe_compact()
+        return True
+
+    def delete_many(self, user_ids):
+        """
+        Deletes several users with a single tombstone append + fsync. Returns
+        the number actually removed.
+        """
+        with self.lock:
+            present = [user_id for user_id in dict.fromkeys(user_ids) if user_id in self.entries]
+            if not present:
+                return 0
+            with open(self._file("log"), "ab") as f:
+                _fsync_write(f, b"".join(_encode_record({"op": "del", "user": user_id}) for user_id in present))
+            for user_id in present:
+                self.dead_rows += self.entries.pop(user_id)[1]
+        self.maybe_compact()
+        return len(present)
+
+    # --- Compaction ---
+    def maybe_compact(self):
+        if self.dead_rows >= COMPACT_MIN_DEAD_ROWS and self.dead_rows > COMPACT_DEAD_RATIO * self.rows:
+            self.compact()
+
+    def compact(self):
+        """
+        Copies live rows into a new generation and switches CURRENT to it.
+        Old generation files are removed when possible (on Windows they may
+        still be mapped; they are cleaned up on the next compaction).
+        """
+        with self.lock:
+            old_generation = self.generation
+            new_generation = old_generation + 1
+            source = None
+            if self.rows:
+                source = np.memmap(self._file("encodings"), dtype=np.float32, mode="r",
+                                   shape=(self.rows, ENCODING_DIM))
+
+            entries = {}
+            records = []
+            row = 0
+            with open(self._file("encodings", new_generation), "wb") as f:
+                for user_id, (first, count) in self.entries.items():
+                    f.write(np.ascontiguousarray(source[first:first + count]).tobytes())
+                    entries[user_id] = (row, count)
+                    records.append(_encode_record({"op": "put", "user": user_id, "row": row, "count": count}))
+                    row += count
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._file("log", new_generation), "wb") as f:
+                _fsync_write(f, b"".join(records))
+            del source
+
+            self._write_current(new_generation)
+            self.generation = new_generation
+            self.entries = entries
+            self.rows = row
+            self.dead_rows = 0
+            self._remove_stale_generations()
+
+    def _remove_stale_generations(self):
+        for name in os.listdir(self.path):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] in ("encodings", "log") and parts[1].isdigit():
+                if int(parts[1]) != self.generation:
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                    except OSError:
+                        pass  # still mapped (Windows); retried next time
+
+    # --- Import ---
+    def import_npz(self, npz_file):
+        """
+        Imports a legacy face_templates.npz in one batched commit. Returns the
+        number of users imported.
+        """
+        with np.load(npz_file, allow_pickle=True) as data:
+            items = [(user_id, data[user_id]) for user_id in data.files]
+        self.put_many(items)
+        return len(items)
+
+    def import_legacy(self, npz_file):
+        """
+        Imports the legacy .npz into a new store, exactly once. A marker file
+        records that it happened, so a store later emptied by deletes or by
+        compaction never brings the old users back. A store with history but
+        no marker was imported by an earlier version and is only marked.
+        Returns the number of users imported.
+        """
+        marker = os.path.join(self.path, LEGACY_MARKER)
+        if os.path.exists(marker):
+            return 0
+        fresh = self.generation == 0 and self.rows == 0 and not os.path.exists(self._file("log"))
+        imported = self.import_npz(npz_file) if fresh and os.path.exists(npz_file) else 0
+        tmp = marker + ".tmp"
+        with open(tmp, "w") as f:
+            _fsync_write(f, json.dumps({"source": os.path.abspath(npz_file), "users": imported,
+                                        "at": time.time()}))
+        os.replace(tmp, marker)
+        return imported
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect and maintain the face template store.")
+    parser.add_argument("command", choices=["check", "compact", "import"])
+    parser.add_argument("--store", default="face_templates.store")
+    parser.add_argument("--npz", default="face_templates.npz", help="legacy file for 'import'")
+    args = parser.parse_args()
+
+    store = TemplateStore(args.store)
+    if args.command == "import":
+        print(f"Imported {store.import_npz(args.npz)} users from {args.npz}")
+    elif args.command == "compact":
+        store.compact()
+        print(f"Compacted to generation {store.generation}: {len(store)} users, {store.rows} rows")
+    else:
+        templates = store.load()
+        bad = [user_id for user_id, block in templates.items() if not np.isfinite(block).all()]
+        print(f"Generation {store.generation}: {len(store)} users, {store.rows} rows, {store.dead_rows} dead")
+        if bad:
+            print(f"⚠️ Non-finite encodings for: {', '.join(bad)}")
@@ -0,0 +1,300 @@
+"""
+Versioned delta sync of face templates between kiosks through the
+attendance backend (settings.json "server_url"; timeclock_stub.py serves
+the same endpoints locally).
+
+    python template_sync.py sync --url http://127.0.0.1:8000
+    python template_sync.py seed --url http://127.0.0.1:8000   # push every local user once
+    python template_sync.py status
+
+Each kiosk remembers the last gallery version it pulled and keeps an outbox
+of its own registrations and deletions; both are saved in the template store
+directory, so a restart or a server outage loses nothing. A sync round
+pushes the outbox, then pulls only the changes made since the remembered
+version, one page at a time. Every page goes into the in-memory gallery with
+one GalleryMatcher.apply_changes() call and into the store with one batched
+commit.
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+import requests
+
+from metrics import metrics
+
+# === CONFIGURATION ===
+SYNC_INTERVAL_SECONDS = 30
+SYNC_MAX_BACKOFF = 300       # seconds between attempts while the server is unreachable
+PAGE_SIZE = 500              # changes per pull or push request
+STATE_FILE = "sync_state.json"
+DEFAULT_CONNECT_TIMEOUT = 3.0
+DEFAULT_READ_TIMEOUT = 10.0
+
+
+def encode_templates(templates):
+    """
+    Templates travel as base64 float32, about a third of the size of a JSON list.
+    """
+    block = np.ascontiguousarray(np.asarray(templates, dtype=np.float32).reshape(-1, 128))
+    return base64.b64encode(block.tobytes()).decode("ascii")
+
+
+def decode_templates(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32).reshape(-1, 128)
+
+
+# === Sync client ===
+class TemplateSyncClient:
+    """
+    HTTP side of the sync: GET and POST /templates/changes on the attendance
+    backend, over one keep-alive requests.Session. Raises on transport errors.
+    """
+
+    def __init__(self, base_url, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+
+    def changes(self, since, limit=PAGE_SIZE):
+        response = self.session.get(f"{self.base_url.rstrip('/')}/templates/changes",
+                                    params={"since": since, "limit": limit}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def push(self, kiosk_id, changes):
+        response = self.session.post(f"{self.base_url.rstrip('/')}/templates/changes",
+                                     json={"kiosk": kiosk_id, "changes": changes}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+# === Template sync ===
+class TemplateSync(threading.Thread):
+    """
+    Keeps the local gallery and template store in step with the server.
+
+    Local registrations and deletions go into the outbox (record_put,
+    record_delete) and wake the thread. A round pushes first, then pulls.
+    Pulled changes that came from this kiosk are already applied locally
+    (the server returns only the newest change per user), so they are
+    skipped. A remote change to a user with an unpushed local edit is also
+    skipped, because the local edit is newer and is pushed next round.
+    Applying a change twice is harmless, so the version is saved only after
+    a page has been applied.
+
+    lock guards the state, and apply() holds it from the outbox check until
+    the page is written. The app passes its gallery lock and makes its own
+    writes and their record_put/record_delete under it, so a local edit is
+    either in the outbox before a page is filtered or lands after it.
+    """
+
+    def __init__(self, client, matcher, store=None, templates=None, kiosk_id=None,
+                 interval=SYNC_INTERVAL_SECONDS, page_size=PAGE_SIZE, state_file=None, lock=None):
+        super().__init__(daemon=True, name="TemplateSync")
+        self.client = client
+        self.matcher = matcher
+        self.store = store
+        self.templates = templates  # the app's user dict, kept in step for its user list
+        self.kiosk_id = kiosk_id or socket.gethostname()
+        self.interval = interval
+        self.page_size = page_size
+        self.state_file = state_file or os.path.join(store.path if store is not None else ".", STATE_FILE)
+        self.lock = lock or threading.RLock()  # guards state and pulled writes (see apply)
+        self.state = self._load_state()
+        self.wake_event = threading.Event()
+        self.running = True
+        self.backoff = 0.0
+        self.last_sync = None
+        self.last_error = None
+
+    # --- State ---
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file) as f:
+                    state = json.load(f)
+                return {"version": int(state.get("version", 0)), "outbox": list(state.get("outbox", []))}
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Unreadable sync state {self.state_file}, starting from version 0: {e}")
+        return {"version": 0, "outbox": []}
+
+    def _save_state(self):
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_file)
+
+    @property
+    def version(self):
+        return self.state["version"]
+
+    @property
+    def pending(self):
+        return len(self.state["outbox"])
+
+    # --- Local changes ---
+    def record_put(self, user_id, templates):
+        self.record_puts([(user_id, templates)])
+
+    def record_puts(self, items):
+        self._record([{"id": uuid.uuid4().hex, "op": "put", "user": user_id,
+                       "templates": encode_templates(templates)} for user_id, templates in items])
+
+    def record_delete(self, user_id):
+        self._record([{"id": uuid.uuid4().hex, "op": "del", "user": user_id}])
+
+    def _record(self, changes):
+        with self.lock:
+            self.state["outbox"].extend(changes)
+            self._save_state()
+        self.wake()
+
+    # --- Thread ---
+    def wake(self):
+        self.wake_event.set()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+
+    def run(self):
+        while self.running:
+            try:
+                self.sync_once()
+                self.backoff = 0.0
+            except Exception as e:
+                self.last_error = str(e)
+                metrics.incr("sync_errors")
+                print(f"❌ Template sync failed: {e}")
+                self.backoff = min(SYNC_MAX_BACKOFF, max(self.interval, self.backoff * 2))
+            self.wake_event.wait(self.backoff or self.interval)
+            self.wake_event.clear()
+
+    # --- Sync ---
+    def sync_once(self):
+        """
+        Pushes the outbox, then pulls everything since the last version.
+        Returns (pushed, pulled).
+        """
+        start = time.perf_counter()
+        pushed = self.push()
+        pulled = self.pull()
+        metrics.observe("sync", time.perf_counter() - start)
+        self.last_sync = time.time()
+        self.last_error = None
+        if pushed or pulled:
+            print(f"🔄 Template sync: pushed {pushed}, pulled {pulled}, now at version {self.version}")
+        return pushed, pulled
+
+    def push(self):
+        pushed = 0
+        while True:
+            with self.lock:
+                batch = self.state["outbox"][:self.page_size]
+            if not batch:
+                return pushed
+            self.client.push(self.kiosk_id, batch)
+            sent = {change["id"] for change in batch}
+            with self.lock:
+                self.state["outbox"] = [change for change in self.state["outbox"] if change["id"] not in sent]
+                self._save_state()
+            pushed += len(batch)
+            metrics.incr("sync_pushed", len(batch))
+
+    def pull(self):
+        pulled = 0
+        while True:
+            page = self.client.changes(self.version, self.page_size)
+            if page["latest"] < self.version:
+                # The server's log restarted behind us; take everything it has again
+                print(f"⚠️ Server template version {page['latest']} is behind ours ({self.version}); resyncing")
+                with self.lock:
+                    self.state["version"] = 0
+                    self._save_state()
+                continue
+            pulled += self.apply(page["changes"])
+            with self.lock:
+                self.state["version"] = page["version"]
+                self._save_state()
+            if not page["more"]:
+                return pulled
+
+    def apply(self, changes):
+        """
+        Applies one page of server changes. Returns how many were applied.
+        """
+        with self.lock:
+            return self._apply(changes)
+
+    def _apply(self, changes):
+        unpushed = {change["user"] for change in self.state["outbox"]}
+        newest = {}
+        for change in changes:
+            if change.get("origin") == self.kiosk_id or change["user"] in unpushed:
+                continue
+            newest.pop(change["user"], None)  # keep only the newest change, in version order
+            newest[change["user"]] = change
+        puts = [(user_id, decode_templates(change["templates"]))
+                for user_id, change in newest.items() if change["op"] == "put"]
+        deletes = [user_id for user_id, change in newest.items() if change["op"] == "del"]
+        if not puts and not deletes:
+            return 0
+
+        self.matcher.apply_changes(puts, deletes)
+        if self.store is not None:
+            self.store.put_many(puts)
+            self.store.delete_many(deletes)
+        if self.templates is not None:
+            for user_id in deletes:
+                self.templates.pop(user_id, None)
+            for user_id, templates in puts:
+                self.templates[user_id] = templates
+        metrics.incr("sync_pulled", len(puts) + len(deletes))
+        return len(puts) + len(deletes)
+
+    def status_line(self):
+        line = f"sync v{self.version}, {self.pending} pending"
+        if self.last_error:
+            line += f", last error: {self.last_error}"
+        return line
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    from gallery import GalleryMatcher
+    from template_store import TemplateStore
+
+    parser = argparse.ArgumentParser(description="Sync face templates with the attendance backend.")
+    parser.add_argument("command", choices=["sync", "seed", "status"])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="attendance backend (server_url)")
+    parser.add_argument("--store", default="face_templates.store")
+    parser.add_argument("--kiosk-id", default=socket.gethostname())
+    args = parser.parse_args()
+
+    store = TemplateStore(args.store)
+    matcher = GalleryMatcher(store.load())
+    sync = TemplateSync(TemplateSyncClient(args.url), matcher, store, kiosk_id=args.kiosk_id)
+    if args.command == "status":
+        print(f"{len(store)} users, version {sync.version}, {sync.pending} changes waiting to be pushed")
+        sys.exit(0)
+    if args.command == "seed":
+        sync.record_puts(store.load().items())
+        print(f"Queued {sync.pending} changes")
+    started = time.perf_counter()
+    pushed, pulled = sync.sync_once()
+    print(f"Pushed {pushed}, pulled {pulled} in {time.perf_counter() - started:.3f} s; "
+          f"version {sync.version}, {len(store)} users")
+    sys.exit(0)
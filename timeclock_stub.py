@@ -0,0 +1,171 @@
+"""
+Local stand-in for the attendance backend's /dtr/timeclock endpoint.
+
+    python timeclock_stub.py --port 8000 --delay 0.2 --fail-rate 0.1
+
+Point settings.json "server_url" at http://127.0.0.1:8000 to run the kiosk
+against it. start_stub_server() runs it in-process on a free port.
+
+It also serves the template change log that template_sync.py talks to:
+
+    GET  /templates/changes?since=<version>&limit=<n>
+         -> {"version", "latest", "more", "changes": [{"version", "op", "user", "templates", "origin"}]}
+    POST /templates/changes  {"kiosk": id, "changes": [{"id", "op", "user", "templates"}]}
+         -> {"versions": [...], "latest"}
+
+Only the newest change per user is returned, so a pull costs the number of
+users changed since `since`, not the size of the gallery.
+"""
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+# === Template change log ===
+class TemplateChangeLog:
+    """
+    Versioned log of template puts and deletes pushed by kiosks. Versions
+    increase by one per change. A push repeated after a lost response
+    carries the same change IDs and gets its original versions back.
+    """
+
+    def __init__(self):
+        self.changes = []   # change dicts, in version order
+        self.versions = []  # version of each entry, for bisect
+        self.latest = {}    # user -> version of that user's newest change
+        self.applied = {}   # change ID -> version
+        self.lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.versions[-1] if self.versions else 0
+
+    def push(self, kiosk, changes):
+        with self.lock:
+            versions = []
+            for change in changes:
+                if change["op"] not in ("put", "del"):
+                    raise ValueError(f"Unknown op: {change['op']}")
+                if change.get("id") in self.applied:
+                    versions.append(self.applied[change["id"]])
+                    continue
+                version = self.version + 1
+                entry = {"version": version, "op": change["op"], "user": change["user"], "origin": kiosk}
+                if change["op"] == "put":
+                    entry["templates"] = change["templates"]
+                self.changes.append(entry)
+                self.versions.append(version)
+                self.latest[change["user"]] = version
+                if change.get("id"):
+                    self.applied[change["id"]] = version
+                versions.append(version)
+            return {"versions": versions, "latest": self.version}
+
+    def since(self, version, limit):
+        with self.lock:
+            start = bisect.bisect_right(self.versions, version)
+            changes = []
+            position = start
+            while position < len(self.changes) and len(changes) < limit:
+                entry = self.changes[position]
+                if self.latest[entry["user"]] == entry["version"]:  # superseded entries are skipped
+                    changes.append(entry)
+                position += 1
+            reached = self.versions[position - 1] if position > start else max(version, 0)
+            return {"version": min(reached, self.version), "latest": self.version,
+                    "more": position < len(self.changes), "changes": changes}
+
+
+# === Timeclock endpoint ===
+class TimeclockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients reuse connections
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/templates/changes":
+            params = parse_qs(url.query)
+            try:
+                since = int(params.get("since", ["0"])[0])
+                limit = max(1, int(params.get("limit", ["500"])[0]))
+            except ValueError:
+                self.send_json(400, {"success": "fail", "message": "Invalid since/limit"})
+                return
+            self.send_json(200, self.server.templates.since(since, limit))
+            return
+        if url.path != "/dtr/timeclock":
+            self.send_json(404, {"success": "fail", "message": "Not found"})
+            return
+        params = parse_qs(url.query)
+        user_id = params.get("id", [""])[0]
+        status = params.get("status", [""])[0]
+        self.server.requests_served += 1
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if random.random() < self.server.fail_rate:
+            self.send_json(503, {"success": "fail", "message": "Service unavailable"})
+            return
+        if not user_id or status not in ("login", "logout"):
+            self.send_json(200, {"success": "fail", "message": "Invalid request"})
+            return
+        self.send_json(200, {"success": status, "username": user_id, "full_name": f"Test User {user_id}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != "/templates/changes":
+            self.send_json(404, {"success": "fail", "message": "Not found"})
+            return
+        try:
+            payload = json.loads(body)
+            self.send_json(200, self.server.templates.push(payload.get("kiosk", ""), payload["changes"]))
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"success": "fail", "message": f"Bad request: {e}"})
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_stub_server(port=0, delay=0.0, fail_rate=0.0, verbose=False):
+    """
+    Starts the stub on a background thread. Returns (server, base_url).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), TimeclockHandler)
+    server.delay = delay
+    server.fail_rate = fail_rate
+    server.verbose = verbose
+    server.requests_served = 0
+    server.templates = TemplateChangeLog()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for /dtr/timeclock.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to sleep per request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.delay, args.fail_rate, verbose=True)
+    print(f"Timeclock stub listening on {url}/dtr/timeclock (templates: {url}/templates/changes)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
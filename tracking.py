@@ -0,0 +1,106 @@
+import itertools
+import time
+
+# === CONFIGURATION ===
+TRACK_MATCH_IOU = 0.3        # min IoU to continue a track from the previous frame
+TRACK_DRIFT_IOU = 0.6        # re-encode if the box moved this far from where it was encoded
+TRACK_REVERIFY_SECONDS = 1.5  # re-encode a stationary face this often anyway
+TRACK_MAX_MISSED = 5         # frames a track survives without a detection
+
+
+def iou(a, b):
+    """
+    Intersection over union of two (top, right, bottom, left) boxes.
+    """
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+# === Track ===
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.encoding = None
+        self.encoded_box = None
+        self.encoded_at = 0.0
+        self.identity = None          # cached matcher result for self.encoding
+        self.identity_version = None  # gallery version the identity was computed against
+        self.punched = False          # crowd lanes punch each track at most once
+
+    def needs_encoding(self, now=None):
+        if self.encoding is None:
+            return True
+        now = time.time() if now is None else now
+        if now - self.encoded_at >= TRACK_REVERIFY_SECONDS:
+            return True
+        return iou(self.box, self.encoded_box) < TRACK_DRIFT_IOU
+
+    def set_encoding(self, encoding, now=None):
+        self.encoding = encoding
+        self.encoded_box = self.box
+        self.encoded_at = time.time() if now is None else now
+        self.identity_version = None
+
+
+# === Tracker ===
+class FaceTracker:
+    """
+    Greedy IoU tracker. Gives each detected face a stable track ID across
+    frames so its encoding and identity can be reused while it stays put.
+    """
+
+    def __init__(self):
+        self.tracks = []
+        self.ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes):
+        """
+        Associates this frame's boxes with existing tracks. Returns one track
+        per box, in the same order as boxes.
+        """
+        pairs = []
+        for box_index, box in enumerate(boxes):
+            for track_index, track in enumerate(self.tracks):
+                overlap = iou(box, track.box)
+                if overlap >= TRACK_MATCH_IOU:
+                    pairs.append((overlap, box_index, track_index))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for overlap, box_index, track_index in pairs:
+            if assigned[box_index] is not None or track_index in used_tracks:
+                continue
+            track = self.tracks[track_index]
+            track.box = boxes[box_index]
+            track.missed = 0
+            assigned[box_index] = track
+            used_tracks.add(track_index)
+
+        survivors = []
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in used_tracks:
+                track.missed += 1
+                if track.missed > TRACK_MAX_MISSED:
+                    continue
+            survivors.append(track)
+
+        for box_index, box in enumerate(boxes):
+            if assigned[box_index] is None:
+                track = Track(next(self.ids), box)
+                assigned[box_index] = track
+                survivors.append(track)
+
+        self.tracks = survivors
+        return assigned